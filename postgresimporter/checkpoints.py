@@ -0,0 +1,107 @@
+import json
+import logging
+from dataclasses import dataclass
+
+from . import exec, utils
+
+logger = logging.getLogger("checkpoints")
+
+table = "import._checkpoints"
+
+create_table = f"""CREATE TABLE IF NOT EXISTS {table} (
+    source text NOT NULL,
+    chunk integer NOT NULL,
+    target text NOT NULL,
+    start_offset bigint NOT NULL,
+    end_offset bigint NOT NULL,
+    rows bigint NOT NULL,
+    end_line bigint NOT NULL,
+    source_size bigint NOT NULL,
+    source_mtime double precision NOT NULL,
+    committed_at timestamp with time zone NOT NULL DEFAULT now(),
+    PRIMARY KEY (source, chunk)
+)"""
+
+
+@dataclass()
+class Checkpoint:
+    source: str
+    chunk: int
+    end_offset: int
+    rows: int
+    end_line: int
+    source_size: int
+    source_mtime: float
+
+
+def setup_statements():
+    return ["CREATE SCHEMA IF NOT EXISTS import", create_table]
+
+
+def reset(source):
+    return f"DELETE FROM {table} WHERE source = {utils.sql_literal(source)}"
+
+
+def record(source, target, chunk, end_line, stat, rows=None):
+    """Statement recording a committed chunk, executed in the same transaction
+
+    :param source: path of the source file
+    :param target: qualified name of the target table
+    :param chunk: the loaded chunk
+    :param end_line: number of lines of the source read after the chunk
+    :param stat: stat result of the source file
+    :param rows: optional sql expression for the rows of the chunk, which
+        is also used for the end line
+    :return: sql statement
+    """
+    values = ", ".join(
+        [
+            utils.sql_literal(source),
+            str(chunk.index),
+            utils.sql_literal(target),
+            str(chunk.start),
+            str(chunk.end),
+            rows or str(chunk.rows),
+            f"{rows} + {end_line}" if rows else str(end_line),
+            str(stat.st_size),
+            repr(stat.st_mtime),
+        ]
+    )
+    return (
+        f"INSERT INTO {table} (source, chunk, target, start_offset, end_offset, "
+        f"rows, end_line, source_size, source_mtime) VALUES ({values})"
+    )
+
+
+async def last(db_options, source):
+    """Query the last committed chunk of a source file
+
+    :param db_options: psql connection options
+    :param source: path of the source file
+    :return: the last checkpoint or None
+    """
+    stdout, stderr = await exec.exec_sql(
+        db_options,
+        command=(
+            f"SELECT source, chunk, end_offset, rows, end_line, source_size, "
+            f"source_mtime "
+            f"FROM {table} WHERE source = {utils.sql_literal(source)} "
+            f"ORDER BY chunk DESC LIMIT 1"
+        ),
+        sync=True,
+    )
+    try:
+        rows = json.loads(stdout or "null")
+    except (json.decoder.JSONDecodeError, TypeError):
+        logger.debug(stderr)
+        return None
+    if not rows:
+        return None
+    return Checkpoint(**rows[0])
+
+
+def matches(checkpoint, stat):
+    return (
+        checkpoint.source_size == stat.st_size
+        and abs(checkpoint.source_mtime - stat.st_mtime) < 1e-3
+    )
@@ -0,0 +1,132 @@
+import csv
+import logging
+from dataclasses import dataclass
+
+from . import utils
+
+logger = logging.getLogger("chunks")
+
+
+@dataclass()
+class Chunk:
+    index: int
+    start: int
+    end: int
+    rows: int
+    data: bytes
+
+
+def csv_row_boundary(data):
+    """Offset after the last row of a csv buffer that ends outside of quotes
+
+    The buffer must start at a row boundary. Splitting on the quote character
+    leaves the unquoted parts at even positions, escaped quotes ("") just add
+    an empty quoted part.
+
+    :param data: csv buffer
+    :return: offset after the last complete row or 0 if there is none
+    """
+    offset, boundary = 0, 0
+    for i, segment in enumerate(data.split(b'"')):
+        if i % 2 == 0:
+            position = segment.rfind(b"\n")
+            if position >= 0:
+                boundary = offset + position + 1
+        offset += len(segment) + 1
+    return boundary
+
+
+def csv_rows(data):
+    rows = sum(segment.count(b"\n") for segment in data.split(b'"')[::2])
+    return rows + (1 if data.strip() and not data.endswith(b"\n") else 0)
+
+
+def line_boundary(data):
+    return data.rfind(b"\n") + 1
+
+
+def lines(data):
+    return sum(1 for line in data.splitlines() if line.strip())
+
+
+def read_header(file):
+    """Read the header row of a csv file
+
+    :param file: path of the csv file
+    :return: tuple of column names and the offset of the first data row
+    """
+    with open(file, "rb") as csv_file:
+        header = csv_file.readline()
+    return header_columns(header.decode("utf-8-sig")), len(header)
+
+
+def header_columns(header):
+    """Unique column names of a header row
+
+    :param header: header row (str)
+    :return: list of column names
+    """
+    names = next(csv.reader([header.strip("\r\n")]), [])
+    columns = list()
+    for i, name in enumerate(names):
+        column = utils.to_column_name(name) or f"column_{i + 1}"
+        while column in columns:
+            column += "_"
+        columns.append(column)
+    return columns
+
+
+def aligned_size(start, chunk_size, origin=None):
+    """Bytes from start to the next offset origin + k * chunk_size"""
+    return chunk_size - (start - (start if origin is None else origin)) % chunk_size
+
+
+def read_chunks(
+    file,
+    chunk_size,
+    start=0,
+    index=0,
+    boundary=csv_row_boundary,
+    rows=csv_rows,
+    max_row_size=None,
+    origin=None,
+):
+    """Read a file in chunks of complete rows
+
+    Blocks are read at offsets origin + k * chunk_size and every chunk ends
+    with the last complete row of a block, so a file resumed from the end of
+    any chunk is cut at the same rows as when it was read from its origin.
+
+    :param file: path of the file
+    :param chunk_size: minimum number of bytes per chunk
+    :param start: byte offset of the first row
+    :param index: index of the first chunk
+    :param boundary: function returning the end of the last complete row
+    :param rows: function counting the rows of a chunk
+    :param max_row_size: size after which a row that does not end is split at
+        the last newline (e.g. because of an unterminated quote)
+    :param origin: offset the blocks are aligned to, defaults to the start
+    :return: generator of chunks, at least one (possibly empty) chunk
+    """
+    with open(file, "rb") as source:
+        source.seek(start)
+        rest, yielded = b"", False
+        size = aligned_size(start, chunk_size, origin)
+        while True:
+            block, size = source.read(size), chunk_size
+            data = rest + block
+            if not block:
+                if data or not yielded:
+                    yield Chunk(index, start, start + len(data), rows(data), data)
+                return
+            end = boundary(data)
+            if end <= 0 and max_row_size and len(data) > max_row_size:
+                logger.warning(f"Row at byte {start} of {file} does not end")
+                end = line_boundary(data)
+            if end <= 0:
+                # A single row is larger than the chunk size
+                rest = data
+                continue
+            yield Chunk(index, start, start + end, rows(data[:end]), data[:end])
+            yielded = True
+            rest, start, index = data[end:], start + end, index + 1
@@ -1,14 +1,16 @@
 import argparse
 import os
 
-from . import utils
+from . import conversions, ndjson, normalize, rejects, schema, utils
 
 
 def parse():
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "sources",
-        type=lambda x: utils.valid_dir_or_file(parser, x, extensions=[".zip", ".csv"]),
+        type=lambda x: utils.valid_dir_or_file(
+            parser, x, extensions=[".zip", ".csv"] + ndjson.extensions
+        ),
         action="append",
         nargs="+",
         help="database dump source directory",
@@ -17,7 +19,7 @@ def parse():
         "--all",
         default=False,
         action="store_true",
-        help="whether all files should be unzipped and imported again",
+        help="whether all archives should be checked for changed members and all files imported again",
     )
 
     # Stages
@@ -28,6 +30,21 @@ def parse():
         action="store_true",
         help="whether to skip unzipping compressed files in source directory",
     )
+    parser.add_argument(
+        "--unzip-concurrency",
+        dest="unzip_concurrency",
+        type=int,
+        default=None,
+        help="maximum number of zip members extracted at the same time over all archives (default the number of cpus)",
+    )
+    parser.add_argument(
+        "--staging-budget",
+        dest="staging_budget",
+        type=lambda x: utils.valid_size(parser, x),
+        default=None,
+        help="disk space for extracted files (e.g. 20G). Archives are extracted in batches that fit the budget and "
+        "extracted files are deleted once they were loaded and verified",
+    )
     parser.add_argument(
         "--disable-import",
         dest="disable_import",
@@ -50,6 +67,359 @@ def parse():
         help="whether to skip checking csv row count and database row count after loading",
     )
 
+    # Checkpoints
+    parser.add_argument(
+        "--chunk-size",
+        dest="chunk_size",
+        type=lambda x: utils.valid_size(parser, x),
+        default=None,
+        help="load files in chunks of this size (e.g. 64M) that are committed with a checkpoint",
+    )
+    parser.add_argument(
+        "--resume",
+        default=False,
+        action="store_true",
+        help="whether to continue each file after its last committed chunk",
+    )
+    parser.add_argument(
+        "--drain-timeout",
+        dest="drain_timeout",
+        type=float,
+        default=60.0,
+        help="seconds to wait for in-flight chunks to commit when shutting down (default 60)",
+    )
+
+    # Column types
+    parser.add_argument(
+        "--schema",
+        dest="schema",
+        type=lambda x: utils.valid_dir_or_file(parser, x, extensions=[".json"]),
+        default=None,
+        help='json file mapping table names to column types, e.g. {"table": {"id": "bigint"}}',
+    )
+    parser.add_argument(
+        "--infer-types",
+        dest="infer_types",
+        default=False,
+        action="store_true",
+        help="whether to infer the column types of csv tables missing from the schema file",
+    )
+    parser.add_argument(
+        "--infer-sample-rows",
+        dest="infer_sample_rows",
+        type=int,
+        default=1000,
+        help="number of leading rows sampled to infer column types (default 1000)",
+    )
+    parser.add_argument(
+        "--copy-format",
+        dest="copy_format",
+        choices=schema.copy_formats,
+        default="csv",
+        help="whether typed csv tables are sent as csv or encoded in the binary COPY format by worker processes (default csv)",
+    )
+
+    # Hooks
+    parser.add_argument(
+        "--force-hooks",
+        dest="force_hooks",
+        default=False,
+        action="store_true",
+        help="whether to execute hook scripts even if neither they nor their input tables changed since their last execution",
+    )
+
+    # Conversions
+    parser.add_argument(
+        "--convert",
+        dest="convert_columns",
+        type=conversions.parse_rule,
+        action="append",
+        help="detect the timestamp or date format of text columns matching TABLE[.COLUMN] (shell wildcards) once "
+        "and create import.<table>_typed with converted columns before the post load scripts",
+    )
+    parser.add_argument(
+        "--convert-sample-rows",
+        dest="convert_sample_rows",
+        type=int,
+        default=1000,
+        help="number of rows sampled to detect the format of a column (default 1000)",
+    )
+
+    # Normalization
+    parser.add_argument(
+        "--normalize",
+        dest="normalize",
+        type=lambda x: utils.valid_normalize_rule(parser, x),
+        action="append",
+        help="normalize csv values before loading, as TABLE[.COLUMN][=TRANSFORM] with shell wildcards (e.g. 'animals.*' or '*.name=trim'). "
+        "Transforms are %s, strip (default) matches the strip() sql function"
+        % ", ".join(normalize.transforms),
+    )
+
+    # Filters
+    parser.add_argument(
+        "--keep-columns",
+        dest="keep_columns",
+        type=lambda x: utils.valid_table_keys(parser, x),
+        action="append",
+        help="load only some columns of csv tables, as TABLE=COLUMNS with shell wildcards (e.g. 'animals=id,name')",
+    )
+    parser.add_argument(
+        "--where",
+        dest="where",
+        type=lambda x: utils.valid_predicate(parser, x),
+        action="append",
+        help="load only csv rows matching all predicates of their table, as TABLE.COLUMN<OP>VALUE with shell wildcards (e.g. 'animals.legs>=4'). "
+        "Operators are =, !=, <, <=, >, >= and ~ for a regular expression",
+    )
+    parser.add_argument(
+        "--sample",
+        dest="samples",
+        type=lambda x: utils.valid_sample(parser, x),
+        action="append",
+        help="load a deterministic sample of csv rows, as TABLE=FRACTION[:KEYS] (e.g. 'animals=1%%:id'), rows are sampled by a hash of their key columns",
+    )
+
+    # Concurrency
+    parser.add_argument(
+        "--max-streams",
+        dest="max_streams",
+        type=int,
+        default=None,
+        help="maximum number of concurrent COPY streams (default unlimited, or twice the cpus with --adaptive-streams)",
+    )
+    parser.add_argument(
+        "--min-streams",
+        dest="min_streams",
+        type=int,
+        default=1,
+        help="minimum number of concurrent COPY streams with --adaptive-streams (default 1)",
+    )
+    parser.add_argument(
+        "--adaptive-streams",
+        dest="adaptive_streams",
+        default=False,
+        action="store_true",
+        help="whether to grow or shrink the number of concurrent COPY streams based on throughput, "
+        "database waits, checkpoints and host pressure",
+    )
+    parser.add_argument(
+        "--adaptive-interval",
+        dest="adaptive_interval",
+        type=float,
+        default=5.0,
+        help="seconds between adaptive concurrency decisions (default 5)",
+    )
+
+    parser.add_argument(
+        "--freeze",
+        dest="freeze",
+        default=False,
+        action="store_true",
+        help="whether to COPY rows frozen into tables created in the same transaction, so they are not "
+        "rewritten by the first vacuum. Every file is loaded in a single transaction",
+    )
+
+    # Server side COPY
+    parser.add_argument(
+        "--server-path",
+        dest="server_paths",
+        type=lambda x: utils.valid_server_path(parser, x),
+        action="append",
+        help="let the database server read csv files below a local directory itself, as LOCAL=SERVER "
+        "with the path the server sees the directory at (e.g. ./data=/import). Requires superuser or "
+        "pg_read_server_files, files the server cannot read are streamed",
+    )
+
+    # Throttling
+    parser.add_argument(
+        "--max-bytes-per-second",
+        dest="max_bytes_per_second",
+        type=lambda x: utils.valid_rate(parser, x, size=True),
+        default=None,
+        help="maximum number of bytes sent per second over all tables and targets (e.g. 20M)",
+    )
+    parser.add_argument(
+        "--max-rows-per-second",
+        dest="max_rows_per_second",
+        type=lambda x: utils.valid_rate(parser, x),
+        default=None,
+        help="maximum number of rows sent per second over all tables and targets",
+    )
+    parser.add_argument(
+        "--table-rate",
+        dest="table_rates",
+        type=lambda x: utils.valid_table_rate(parser, x),
+        action="append",
+        help="maximum bytes and rows per second of tables matching a shell wildcard, "
+        "as TABLE=BYTES/ROWS where either limit may be empty (e.g. 'animals_*=5M/10000')",
+    )
+    parser.add_argument(
+        "--throttle-file",
+        dest="throttle_file",
+        type=str,
+        default=None,
+        help="json file with the limits per second that is applied again whenever it changes "
+        "or on SIGUSR1, overriding the throttling options",
+    )
+
+    # Rejects
+    parser.add_argument(
+        "--max-rejects",
+        dest="max_rejects",
+        type=int,
+        default=None,
+        help="quarantine up to this many malformed rows per file instead of failing the file",
+    )
+    parser.add_argument(
+        "--rejects-to",
+        dest="rejects_to",
+        choices=rejects.destinations,
+        default="table",
+        help="whether to quarantine malformed rows in import._rejects or in a <file>.rejects.jsonl sidecar file (default table)",
+    )
+
+    # Watching
+    parser.add_argument(
+        "--watch",
+        default=False,
+        action="store_true",
+        help="whether to keep running and incrementally load new or changed files",
+    )
+    parser.add_argument(
+        "--watch-interval",
+        dest="watch_interval",
+        type=float,
+        default=5.0,
+        help="seconds between checks for new files in watch mode (default 5)",
+    )
+    parser.add_argument(
+        "--watch-settle-time",
+        dest="watch_settle_time",
+        type=float,
+        default=10.0,
+        help="seconds the size and modification time of a file must be stable before it is loaded (default 10)",
+    )
+    parser.add_argument(
+        "--watch-polling",
+        dest="watch_polling",
+        default=False,
+        action="store_true",
+        help="whether to poll the source directories instead of using inotify",
+    )
+
+    # Deduplication
+    parser.add_argument(
+        "--dedup",
+        default=False,
+        action="store_true",
+        help="whether to drop duplicate rows when combining tables",
+    )
+    parser.add_argument(
+        "--dedup-key",
+        dest="dedup_keys",
+        type=str,
+        action="append",
+        help="column identifying duplicate rows when combining tables (repeat for several columns, default the whole row)",
+    )
+    parser.add_argument(
+        "--dedup-partitions",
+        dest="dedup_partitions",
+        type=int,
+        default=max(1, os.cpu_count() or 1),
+        help="number of key hash partitions that deduplicate and write rows concurrently (default number of cpus)",
+    )
+    parser.add_argument(
+        "--dedup-memory-rows",
+        dest="dedup_memory_rows",
+        type=int,
+        default=1000000,
+        help="number of row keys kept in memory before spilling them to disk (default 1000000)",
+    )
+    parser.add_argument(
+        "--dedup-bloom",
+        dest="dedup_bloom",
+        type=int,
+        default=None,
+        help="expected number of rows to size a bloom filter that avoids disk lookups of new keys",
+    )
+    parser.add_argument(
+        "--dedup-dir",
+        dest="dedup_dir",
+        type=lambda x: utils.valid_dir_or_file(parser, x),
+        default=None,
+        help="directory for spilled row keys (default the system temporary directory)",
+    )
+    parser.add_argument(
+        "--merge-key",
+        dest="merge_keys",
+        type=lambda x: utils.valid_table_keys(parser, x),
+        action="append",
+        help="merge new rows into the persistent combined tables matching a shell wildcard "
+        "on comma separated key columns instead of rebuilding them (e.g. 'animals=id,date')",
+    )
+    parser.add_argument(
+        "--merge-batch-rows",
+        dest="merge_batch_rows",
+        type=int,
+        default=1000000,
+        help="number of staged rows merged per transaction, batched by key range",
+    )
+    parser.add_argument(
+        "--delta-key",
+        dest="delta_keys",
+        type=lambda x: utils.valid_table_keys(parser, x),
+        action="append",
+        help="load only the new, changed and deleted rows of csv files whose tables match a "
+        "shell wildcard since their last load, identified by comma separated key columns "
+        "(e.g. 'animals_*=id')",
+    )
+    parser.add_argument(
+        "--delta-dir",
+        dest="delta_dir",
+        type=lambda x: utils.valid_dir_or_file(parser, x),
+        default=None,
+        help="directory for the row hash indexes of --delta-key (default the directory of each file)",
+    )
+
+    parser.add_argument(
+        "--distributed",
+        dest="distributed",
+        action="store_true",
+        help="load the sources together with other nodes that see the same paths, "
+        "coordinated by the import._jobs table of the first database",
+    )
+    parser.add_argument(
+        "--node-name",
+        dest="node_name",
+        type=str,
+        default=None,
+        help="name of this node in import._jobs (default HOSTNAME:PID)",
+    )
+    parser.add_argument(
+        "--node-slots",
+        dest="node_slots",
+        type=int,
+        default=max(1, os.cpu_count() or 1),
+        help="number of files this node loads at the same time with --distributed",
+    )
+    parser.add_argument(
+        "--lease",
+        dest="lease",
+        type=float,
+        default=60.0,
+        help="seconds a node holds a job without renewing it before other nodes take it over",
+    )
+
+    # Checks
+    parser.add_argument(
+        "--preflight",
+        dest="preflight",
+        action="store_true",
+        help="check the column count, encoding and quotes of all csv files and the headers "
+        "of every table group before loading, and load nothing if a check fails",
+    )
+
     # Filtering
     parser.add_argument(
         "--exclude-regex",
@@ -58,6 +428,29 @@ def parse():
         help="regex for files to be excluded from import and unzip",
     )
 
+    # JSON lines
+    parser.add_argument(
+        "--json-mode",
+        dest="json_mode",
+        choices=ndjson.json_modes,
+        default="jsonb",
+        help="whether to load json lines into a single jsonb column or into flattened columns (default jsonb)",
+    )
+    parser.add_argument(
+        "--json-sample-lines",
+        dest="json_sample_lines",
+        type=int,
+        default=1000,
+        help="number of json lines sampled to derive the flattened columns (default 1000)",
+    )
+    parser.add_argument(
+        "--json-batch-lines",
+        dest="json_batch_lines",
+        type=int,
+        default=10000,
+        help="number of json lines parsed and sent per batch (default 10000)",
+    )
+
     # Hooks
     parser.add_argument(
         "--post-load",
@@ -75,6 +468,21 @@ def parse():
         nargs="+",
         help="optional pre load script to execute before import",
     )
+    parser.add_argument(
+        "--table-hook",
+        dest="table_hooks",
+        type=lambda x: utils.valid_dir_or_file(parser, x, extensions=[".j2"]),
+        action="append",
+        nargs="+",
+        help="optional jinja2 sql templates (*.j2) rendered for every table after the post load scripts",
+    )
+    parser.add_argument(
+        "--hook-concurrency",
+        dest="hook_concurrency",
+        type=int,
+        default=None,
+        help="maximum number of table hooks executed at the same time (default the number of cpus)",
+    )
 
     # Database connection options
     default_db_name = "postgres"
@@ -109,6 +517,21 @@ def parse():
         "--db-password", type=str, dest="db_password", help="database password"
     )
 
+    parser.add_argument(
+        "--target",
+        dest="targets",
+        type=str,
+        action="append",
+        help="connection string of a target database, repeat to load the same sources into several databases (default is the database given by the options above)",
+    )
+    parser.add_argument(
+        "--fan-out-queue",
+        dest="fan_out_queue",
+        type=int,
+        default=2,
+        help="number of chunks that may be queued for each target database (default 2)",
+    )
+
     parser.add_argument(
         "--log-level",
         type=lambda x: utils.valid_log_level(parser, x),
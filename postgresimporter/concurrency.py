@@ -0,0 +1,216 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+
+from . import exec
+
+logger = logging.getLogger("concurrency")
+
+activity_query = (
+    "SELECT count(*) FILTER (WHERE wait_event_type IN ('Lock', 'LWLock', 'IO')) "
+    "AS waiting, count(*) AS active, "
+    "(SELECT (to_jsonb(b) ->> 'checkpoints_req')::bigint FROM pg_stat_bgwriter b) "
+    "AS checkpoints "
+    "FROM pg_stat_activity WHERE state = 'active' AND backend_type = 'client backend'"
+)
+
+
+class AdaptiveLimit:
+    """Semaphore whose number of permits can change while it is in use"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.used < self.limit)
+            self.used += 1
+
+    async def release(self):
+        async with self.condition:
+            self.used -= 1
+            self.condition.notify_all()
+
+    async def set_limit(self, limit):
+        async with self.condition:
+            self.limit = limit
+            self.condition.notify_all()
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, *_args):
+        await self.release()
+
+
+@dataclass()
+class Signals:
+    throughput: float = 0.0
+    waiting: float = 0.0
+    checkpoints: int = 0
+    load: float = 0.0
+    io_pressure: float = 0.0
+    memory_pressure: float = 0.0
+
+
+@dataclass()
+class Decision:
+    at: float
+    streams: int
+    limit: int
+    action: str
+    reason: str
+    signals: Signals = field(default_factory=Signals)
+
+
+def pressure(resource):
+    """Share of time some tasks stalled on a resource over the last 10 seconds
+
+    :param resource: io, memory or cpu
+    :return: stall share between 0 and 1 (0 without pressure stall information)
+    """
+    try:
+        with open(f"/proc/pressure/{resource}") as f:
+            some = f.readline().split()
+    except OSError:
+        return 0.0
+    values = dict(item.split("=") for item in some[1:])
+    return float(values.get("avg10", 0.0)) / 100.0
+
+
+def cpu_load():
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except OSError:
+        return 0.0
+
+
+class Controller:
+    """Adapts the number of concurrent COPY streams with additive increase and
+    multiplicative decrease
+
+    Every interval, the controller compares the throughput with the previous
+    interval and looks for congestion: backends waiting on locks or IO,
+    requested checkpoints and CPU, IO or memory pressure of this host. On
+    congestion, the limit is cut by the decrease factor, otherwise it grows
+    by one stream as long as that does not lower the throughput.
+
+    :param limit: adaptive limit of the streams
+    :param targets: connection options of the databases to watch
+    :param minimum: minimum number of streams
+    :param maximum: maximum number of streams
+    :param interval: seconds between decisions
+    :param decrease: factor applied to the limit on congestion
+    """
+
+    max_waiting = 0.5
+    max_load = 1.0
+    max_io_pressure = 0.3
+    max_memory_pressure = 0.1
+
+    def __init__(
+        self, limit, targets, minimum=1, maximum=8, interval=5.0, decrease=0.7
+    ):
+        self.limit = limit
+        self.targets = targets
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.interval = interval
+        self.decrease = decrease
+        self.transferred = 0
+        self.previous = None
+        self.checkpoints = dict()
+        self.decisions = list()
+
+    def record(self, size):
+        self.transferred += size
+
+    async def database_signals(self, signals):
+        for i, db_options in enumerate(self.targets):
+            stdout, _ = await exec.exec_sql(
+                db_options, command=activity_query, sync=True
+            )
+            try:
+                activity = json.loads(stdout or "null")[0]
+            except (json.decoder.JSONDecodeError, TypeError, IndexError, KeyError):
+                continue
+            if activity.get("active"):
+                waiting = activity.get("waiting", 0) / activity["active"]
+                signals.waiting = max(signals.waiting, waiting)
+            checkpoints = activity.get("checkpoints")
+            if checkpoints is not None:
+                if i in self.checkpoints:
+                    signals.checkpoints += checkpoints - self.checkpoints[i]
+                self.checkpoints[i] = checkpoints
+
+    async def sample(self, elapsed):
+        signals = Signals(
+            throughput=self.transferred / max(elapsed, 1e-6),
+            load=cpu_load(),
+            io_pressure=pressure("io"),
+            memory_pressure=pressure("memory"),
+        )
+        self.transferred = 0
+        await self.database_signals(signals)
+        return signals
+
+    def congestion(self, signals):
+        if signals.waiting > self.max_waiting:
+            return f"{signals.waiting:.0%} of the active backends wait for locks or io"
+        if signals.checkpoints > 0:
+            return f"{signals.checkpoints} checkpoints were requested"
+        if signals.memory_pressure > self.max_memory_pressure:
+            return f"memory pressure of {signals.memory_pressure:.0%}"
+        if signals.io_pressure > self.max_io_pressure:
+            return f"io pressure of {signals.io_pressure:.0%}"
+        if signals.load > self.max_load:
+            return f"cpu load of {signals.load:.2f} per cpu"
+        return None
+
+    def decide(self, signals, streams):
+        """Decide on the next limit
+
+        :param signals: signals of the last interval
+        :param streams: number of streams that were in use
+        :return: the decision
+        """
+        limit = self.limit.limit
+        reason = self.congestion(signals)
+        if reason is not None:
+            new_limit, action = (
+                max(self.minimum, int(limit * self.decrease)),
+                "decrease",
+            )
+        elif self.previous is not None and signals.throughput < 0.95 * self.previous:
+            new_limit, action = limit, "hold"
+            reason = "throughput dropped to %.1f MB/s" % (signals.throughput / 1e6)
+        elif streams < limit:
+            new_limit, action = limit, "hold"
+            reason = f"only {streams} of {limit} streams are used"
+        else:
+            new_limit, action = min(self.maximum, limit + 1), "increase"
+            reason = "no congestion at %.1f MB/s" % (signals.throughput / 1e6)
+        self.previous = signals.throughput
+        return Decision(time.time(), streams, new_limit, action, reason, signals)
+
+    async def run(self):
+        last = time.monotonic()
+        while True:
+            await asyncio.sleep(self.interval)
+            streams = self.limit.used
+            now = time.monotonic()
+            signals = await self.sample(now - last)
+            last = now
+            decision = self.decide(signals, streams)
+            self.decisions.append(decision)
+            if decision.limit != self.limit.limit:
+                logger.info(
+                    f"{decision.action.capitalize()} concurrent streams from "
+                    f"{self.limit.limit} to {decision.limit}: {decision.reason}"
+                )
+                await self.limit.set_limit(decision.limit)
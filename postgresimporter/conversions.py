@@ -0,0 +1,151 @@
+import collections
+import fnmatch
+import re
+from dataclasses import dataclass
+
+from . import utils
+
+
+@dataclass()
+class Format:
+    """A single text format of a column and how postgres converts it directly"""
+
+    name: str
+    pattern: str
+    conversion: str
+    fallback: str
+    type: str
+
+    def matches(self, value):
+        return re.match(f"^{self.pattern}$", value) is not None
+
+
+# The branches of parse_timestamp() and parse_date() in hooks/functions.sql, in
+# the same order. Only values matching a pattern as a whole are converted
+# directly, which never selects a different branch than the cascade would.
+formats = [
+    Format(
+        "timestamp_fraction_offset",
+        r"\d\d-\w\w\w-\d\d \d\d.\d\d.\d\d.\d\d\d\d\d\d\d\d\d (?:AM|PM) (\+|-)\d\d:\d\d",
+        "to_timestamp({column}, 'FXDD-MON-YY HH12.MI.SS.          PM TZH:TZM')",
+        "parse_timestamp({column})",
+        "timestamp with time zone",
+    ),
+    Format(
+        "timestamp_offset",
+        r"\d\d-\w\w\w-\d\d \d\d.\d\d.\d\d (?:AM|PM) (\+|-)\d\d:\d\d",
+        "to_timestamp({column}, 'FXDD-MON-YY HH12.MI.SS PM TZH:TZM')",
+        "parse_timestamp({column})",
+        "timestamp with time zone",
+    ),
+    Format(
+        "timestamp_fraction_zone",
+        r"\d\d-\w\w\w-\d\d \d\d.\d\d.\d\d.\d\d\d\d\d\d\d\d\d (?:AM|PM) (\w\w\w)",
+        "to_timestamp({column}, 'FXDD-MON-YY HH12.MI.SS.          PM') "
+        "AT TIME ZONE right({column}, 3) AT TIME ZONE current_setting('timezone')",
+        "parse_timestamp({column})",
+        "timestamp with time zone",
+    ),
+    Format(
+        "timestamp_zone",
+        r"\d\d-\w\w\w-\d\d \d\d.\d\d.\d\d (?:AM|PM) (\w\w\w)",
+        "to_timestamp({column}, 'FXDD-MON-YY HH12.MI.SS PM') "
+        "AT TIME ZONE right({column}, 3) AT TIME ZONE current_setting('timezone')",
+        "parse_timestamp({column})",
+        "timestamp with time zone",
+    ),
+    Format(
+        "timestamp_compact",
+        r"\d\d\d\d\d\d\d\d\d\d\d\d\d\d(\+|-)\d\d\d\d",
+        "to_timestamp({column}, 'YYYYMMDDHH24MISS TZHTZM')",
+        "parse_timestamp({column})",
+        "timestamp with time zone",
+    ),
+    Format(
+        "date",
+        r"\d\d-\w\w\w-\d\d",
+        "to_date({column}, 'FXDD-MON-YY')",
+        "parse_date({column})",
+        "date",
+    ),
+]
+
+
+def parse_rule(spec):
+    """Parse a conversion rule like animals.born or animals_*
+
+    :param spec: table and optional column, both may contain shell wildcards
+    :return: tuple of table pattern and column pattern
+    """
+    table, _, column = spec.strip().partition(".")
+    return table or "*", column or "*"
+
+
+def selected_columns(rules, table, columns):
+    return [
+        column
+        for column in columns
+        if any(
+            fnmatch.fnmatchcase(table, t) and fnmatch.fnmatchcase(column, c)
+            for t, c in rules or []
+        )
+    ]
+
+
+def detect(values, min_share=0.9):
+    """Identify the single format of a sampled column
+
+    :param values: sampled non-null values
+    :param min_share: share of the values the format must match
+    :return: the format or None if the values do not share one
+    """
+    values = [value for value in values if value is not None and value != ""]
+    if not values:
+        return None
+    counts = collections.Counter()
+    for value in values:
+        for candidate in formats:
+            if candidate.matches(value):
+                counts[candidate.name] += 1
+                break
+    if not counts:
+        return None
+    name, count = counts.most_common(1)[0]
+    if count < min_share * len(values):
+        return None
+    return next(candidate for candidate in formats if candidate.name == name)
+
+
+def expression(column, detected):
+    """Set based conversion of a column with a single direct format
+
+    Rows not matching the format fall back to the cascade of functions.sql,
+    so the result is the same as converting every row with the cascade.
+    """
+    quoted = f'"{column}"'
+    return (
+        f"CASE WHEN {quoted} ~ {utils.sql_literal('^' + detected.pattern + '$')} "
+        f"THEN {detected.conversion.format(column=quoted)} "
+        f"ELSE {detected.fallback.format(column=quoted)} END"
+    )
+
+
+def convert_statements(table, columns, detected):
+    """Statements creating import.{table}_typed with converted columns
+
+    :param table: name of the source table in the import schema
+    :param columns: all column names of the table in order
+    :param detected: dict of column names to their detected format
+    :return: list of sql statements
+    """
+    target = f"import.{table}_typed"
+    selected = ", ".join(
+        f'{expression(column, detected[column])} AS "{column}"'
+        if column in detected
+        else f'"{column}"'
+        for column in columns
+    )
+    return [
+        f"DROP TABLE IF EXISTS {target}",
+        f"CREATE TABLE {target} AS SELECT {selected} FROM import.{table}",
+    ]
@@ -1,11 +1,10 @@
 import argparse
+import asyncio
 import json
 import logging
-import multiprocessing
-import re
 from pathlib import Path
 
-from . import exec, utils
+from . import utils, workers
 
 logger = logging.getLogger("csvcount")
 
@@ -23,31 +22,29 @@ def _count_csv_entries(dump_files):
     return counts
 
 
+async def count_file(file, precise=False):
+    try:
+        return str(file.absolute()), await workers.count_rows(file, precise=precise)
+    except OSError as e:
+        logger.warning(f"Failed to count entries of {file}: {e}")
+        return str(file.absolute()), None
+
+
 async def count_csv_entries(files, precise=False):
+    """Count the entries of csv files in the worker processes
+
+    Without precise counting, lines are counted like wc -l does.
+
+    :param files: paths of the csv files
+    :param precise: whether to count csv rows, which may span multiple lines
+    :return: dict of absolute file paths to their number of entries
+    """
     if len(files) < 1:
         logger.info("No csv files to count entries for")
         return
     [logger.info(f"Counting entries of {str(file.absolute())}") for file in files]
-    results = dict()
-    if precise:
-        _results = await exec.run_simultaneously(
-            [
-                ("python", ["-m", "postgresimporter.csvcount", str(file.absolute())],)
-                for file in files
-            ],
-            max_concurrency=max(1, int(multiprocessing.cpu_count() / 2)),
-        )
-        for r in _results:
-            results.update(json.loads(r))
-    else:
-        _results = await exec.run_simultaneously(
-            [("wc", ["-l", str(file.absolute())]) for file in files],
-            max_concurrency=max(1, int(multiprocessing.cpu_count() / 2)),
-        )
-        for r in _results:
-            components = re.search(r"^(\d+) (.*)$", r.decode("utf-8"))
-            results.update({components.group(2): int(components.group(1))})
-    return results
+    counts = await asyncio.gather(*[count_file(file, precise) for file in files])
+    return {file: count for file, count in counts if count is not None}
 
 
 if __name__ == "__main__":
@@ -0,0 +1,232 @@
+import bisect
+import hashlib
+import heapq
+import logging
+import math
+import mmap
+import os
+import tempfile
+
+logger = logging.getLogger("dedup")
+
+DIGEST_SIZE = 16
+
+
+def row_digest(row, key_indexes=None):
+    """Digest identifying a row of the COPY text format
+
+    :param row: row without its line terminator (bytes)
+    :param key_indexes: indexes of the key fields or None for the whole row
+    :return: digest (bytes)
+    """
+    if key_indexes is not None:
+        fields = row.split(b"\t")
+        row = b"\t".join(fields[i] if i < len(fields) else b"" for i in key_indexes)
+    return hashlib.blake2b(row, digest_size=DIGEST_SIZE).digest()
+
+
+def partition(digest, partitions):
+    return int.from_bytes(digest[-4:], "big") % partitions
+
+
+def split_block(block, partitions, key_indexes=None):
+    """Digests of the rows of a block, split into partitions by their digest
+
+    Runs in the worker processes, so parsing and hashing the rows of several
+    blocks happens in parallel.
+
+    :param block: rows of the COPY text format, each ending with a newline
+    :param partitions: number of partitions
+    :param key_indexes: indexes of the key fields or None for the whole row
+    :return: list with the (digest, row) tuples of every partition
+    """
+    split = [list() for _ in range(partitions)]
+    for row in block.splitlines(keepends=True):
+        digest = row_digest(row.rstrip(b"\n"), key_indexes)
+        split[partition(digest, partitions)].append((digest, row))
+    return split
+
+
+class BloomFilter:
+    """Probabilistic set answering "definitely new" without touching the disk"""
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, digest):
+        # Double hashing with the two halves of the digest
+        first = int.from_bytes(digest[:8], "big")
+        second = int.from_bytes(digest[8:], "big") | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, digest):
+        for position in self._positions(digest):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, digest):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(digest)
+        )
+
+
+class _Run:
+    """Sorted file of fixed size digests, searched in place via mmap"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.size = os.path.getsize(path) // DIGEST_SIZE
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        return self.map[index * DIGEST_SIZE : (index + 1) * DIGEST_SIZE]
+
+    def __contains__(self, digest):
+        index = bisect.bisect_left(self, digest)
+        return index < self.size and self[index] == digest
+
+    def __iter__(self):
+        return (self[i] for i in range(self.size))
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+        os.remove(self.path)
+
+
+class SpillingSet:
+    """Set of row digests that spills sorted runs to disk once it outgrows memory
+
+    :param directory: directory for the spilled runs
+    :param memory_items: number of digests kept in memory before spilling
+    :param bloom_capacity: expected number of rows to size an optional Bloom
+        filter that avoids searching the spilled runs for new rows
+    :param max_runs: number of runs after which they are merged into one
+    """
+
+    def __init__(
+        self, directory, memory_items=1000000, bloom_capacity=None, max_runs=8
+    ):
+        self.directory = directory
+        self.memory_items = memory_items
+        self.max_runs = max_runs
+        self.memory = set()
+        self.runs = list()
+        self.bloom = BloomFilter(bloom_capacity) if bloom_capacity else None
+
+    def _spilled(self, digest):
+        if self.bloom is not None and digest not in self.bloom:
+            return False
+        return any(digest in run for run in self.runs)
+
+    def add(self, digest):
+        """Add a digest to the set
+
+        :param digest: row digest
+        :return: whether the digest was not in the set before
+        """
+        if digest in self.memory or self._spilled(digest):
+            return False
+        self.memory.add(digest)
+        if self.bloom is not None:
+            self.bloom.add(digest)
+        if len(self.memory) >= self.memory_items:
+            self.spill()
+        return True
+
+    def _write_run(self, digests):
+        fd, path = tempfile.mkstemp(suffix=".run", dir=self.directory)
+        with os.fdopen(fd, "wb", buffering=1 << 20) as run:
+            for digest in digests:
+                run.write(digest)
+        return _Run(path)
+
+    def spill(self):
+        if not self.memory:
+            return
+        self.runs.append(self._write_run(sorted(self.memory)))
+        self.memory = set()
+        if len(self.runs) > self.max_runs:
+            logger.debug(f"Merging {len(self.runs)} spilled runs")
+            merged = self._write_run(heapq.merge(*self.runs))
+            [run.close() for run in self.runs]
+            self.runs = [merged]
+
+    def close(self):
+        [run.close() for run in self.runs]
+        self.runs, self.memory = list(), set()
+
+
+class Deduplicator:
+    """Drops duplicate rows of a stream, partitioned by the hash of their key
+
+    Every partition has its own set, so each set only holds its share of the
+    keys and the unique rows of a partition can be written by its own worker.
+
+    :param partitions: number of partitions
+    :param key_indexes: indexes of the key fields or None for the whole row
+    :param directory: directory for spilled runs (defaults to a temporary one)
+    :param memory_items: number of digests per partition kept in memory
+    :param bloom_capacity: expected number of rows to enable a Bloom filter
+    """
+
+    def __init__(
+        self,
+        partitions=1,
+        key_indexes=None,
+        directory=None,
+        memory_items=1000000,
+        bloom_capacity=None,
+    ):
+        self.partitions = max(1, partitions)
+        self.key_indexes = key_indexes
+        self.temporary = tempfile.TemporaryDirectory(
+            prefix="postgresimporter-dedup-", dir=directory
+        )
+        self.sets = [
+            SpillingSet(
+                self.temporary.name,
+                memory_items=max(1, memory_items // self.partitions),
+                bloom_capacity=bloom_capacity // self.partitions + 1
+                if bloom_capacity
+                else None,
+            )
+            for _ in range(self.partitions)
+        ]
+        self.rows = 0
+        self.duplicates = 0
+
+    def filter(self, block):
+        """Split a block of rows into the unique rows of every partition
+
+        :param block: rows of the COPY text format, each ending with a newline
+        :return: list with the unique rows (bytes) of every partition
+        """
+        return self.keep(split_block(block, self.partitions, self.key_indexes))
+
+    def keep(self, split):
+        """Drop the rows of a split block whose digest was seen before
+
+        :param split: result of split_block() for the partitions of this instance
+        :return: list with the unique rows (bytes) of every partition
+        """
+        unique = [list() for _ in range(self.partitions)]
+        for index, digests in enumerate(split):
+            for digest, row in digests:
+                self.rows += 1
+                if self.sets[index].add(digest):
+                    unique[index].append(row)
+                else:
+                    self.duplicates += 1
+        return [b"".join(rows) for rows in unique]
+
+    def close(self):
+        [s.close() for s in self.sets]
+        self.temporary.cleanup()
@@ -0,0 +1,289 @@
+import csv
+import hashlib
+import heapq
+import io
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+from collections import Counter
+from pathlib import Path
+
+logger = logging.getLogger("delta")
+
+# Key hash, row hash, row number and offset of the key in the keys file
+record = struct.Struct(">QQQQ")
+suffixes = [".idx", ".keys", ".json"]
+
+
+def digest(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+def records(path, start):
+    """Raw rows of a csv file, rows may span lines inside quoted fields
+
+    :param path: path of the csv file
+    :param start: offset of the first data row
+    :return: generator of rows (bytes) including their line terminator
+    """
+    with open(path, "rb") as source:
+        source.seek(start)
+        pending = b""
+        for line in source:
+            pending += line
+            if pending.count(b'"') % 2 == 0:
+                if pending.strip():
+                    yield pending
+                pending = b""
+        if pending.strip():
+            yield pending
+
+
+def row_key(row, key_indexes):
+    fields = next(csv.reader([row.decode("utf-8", "replace").rstrip("\r\n")]), [])
+    return [fields[i] if i < len(fields) else "" for i in key_indexes]
+
+
+class Index:
+    """Row hashes of the last loaded snapshot of a table, sorted by key hash
+
+    A new index is written next to the current one and only replaces it
+    once its rows were loaded.
+    """
+
+    def __init__(self, directory, table):
+        self.base = Path(directory) / f".{table}.delta"
+
+    def path(self, suffix, part=False):
+        return self.base.with_name(self.base.name + suffix + (".part" if part else ""))
+
+    def meta(self, part=False):
+        try:
+            with open(self.path(".json", part), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def matches(self, columns, keys):
+        """Whether the current index describes the same columns and keys"""
+        meta = self.meta()
+        return bool(meta) and meta["columns"] == columns and meta["keys"] == keys
+
+    def commit(self):
+        for suffix in suffixes:
+            os.replace(self.path(suffix, part=True), self.path(suffix))
+
+    def discard(self):
+        for suffix in suffixes:
+            try:
+                self.path(suffix, part=True).unlink()
+            except OSError:
+                pass
+
+
+def write_run(directory, entries):
+    """Write sorted index records to a temporary run file"""
+    fd, path = tempfile.mkstemp(suffix=".run", dir=directory)
+    with os.fdopen(fd, "wb", buffering=1 << 20) as run:
+        for entry in entries:
+            run.write(record.pack(*entry))
+    return path
+
+
+def read_run(path, block_records=65536):
+    with open(path, "rb") as run:
+        while True:
+            block = run.read(block_records * record.size)
+            if not block:
+                return
+            yield from record.iter_unpack(block)
+
+
+def merge_runs(directory, runs):
+    merged = write_run(directory, heapq.merge(*[read_run(run) for run in runs]))
+    [os.remove(run) for run in runs]
+    return merged
+
+
+def build(
+    directory, table, path, start, columns, keys, memory_entries=1000000, max_runs=64
+):
+    """Write the next index of a table from a csv file
+
+    Runs in the worker processes. Records are sorted in runs of at most
+    memory_entries that are spilled next to the index and merged at the end,
+    so the memory does not grow with the rows of the file.
+
+    :param directory: directory of the index files
+    :param table: name of the table
+    :param path: path of the csv file
+    :param start: offset of the first data row
+    :param columns: columns of the csv file
+    :param keys: key columns
+    :param memory_entries: number of records sorted in memory
+    :param max_runs: number of spilled runs after which they are merged into one
+    :return: number of rows
+    """
+    index = Index(directory, table)
+    key_indexes = [columns.index(key) for key in keys]
+    entries, runs, rows, offset = list(), list(), 0, 0
+    try:
+        with open(index.path(".keys", part=True), "wb") as key_file:
+            for number, row in enumerate(records(path, start)):
+                key = json.dumps(row_key(row, key_indexes)).encode("utf-8") + b"\n"
+                entries.append(
+                    (digest(key), digest(row.rstrip(b"\r\n")), number, offset)
+                )
+                key_file.write(key)
+                offset += len(key)
+                rows += 1
+                if len(entries) >= memory_entries:
+                    entries.sort()
+                    runs.append(write_run(directory, entries))
+                    entries = list()
+                    if len(runs) > max_runs:
+                        runs = [merge_runs(directory, runs)]
+        entries.sort()
+        with open(index.path(".idx", part=True), "wb", buffering=1 << 20) as f:
+            for entry in heapq.merge(entries, *[read_run(run) for run in runs]):
+                f.write(record.pack(*entry))
+    finally:
+        [os.remove(run) for run in runs]
+    with open(index.path(".json", part=True), "w", encoding="utf-8") as f:
+        json.dump(dict(columns=columns, keys=keys, rows=rows), f)
+    return rows
+
+
+def groups(path):
+    """Records of an index file grouped by key hash"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            key, group = None, list()
+            for entry in record.iter_unpack(data):
+                if group and entry[0] != key:
+                    yield key, group
+                    group = list()
+                key = entry[0]
+                group.append(entry)
+            if group:
+                yield key, group
+
+
+def diff(directory, table):
+    """Compare the current and the next index of a table
+
+    Runs in the worker processes. When a key changed, all of its rows are sent
+    again, so duplicate keys are replaced as a whole.
+
+    :param directory: directory of the index files
+    :param table: name of the table
+    :return: tuple of the sorted numbers of new or changed rows, the key values
+        of deleted keys and a Counter of inserted, updated and deleted keys
+    """
+    index = Index(directory, table)
+    rows, deleted, counts = list(), list(), Counter()
+    previous = groups(index.path(".idx"))
+    current = groups(index.path(".idx", part=True))
+    old, new = next(previous, None), next(current, None)
+    with open(index.path(".keys"), "rb") as key_file:
+        while old is not None or new is not None:
+            if new is None or (old is not None and old[0] < new[0]):
+                key_file.seek(old[1][0][3])
+                deleted.append(json.loads(key_file.readline()))
+                counts["deleted"] += 1
+                old = next(previous, None)
+                continue
+            if old is None or new[0] < old[0]:
+                counts["inserted"] += 1
+            elif [e[1] for e in old[1]] != [e[1] for e in new[1]]:
+                counts["updated"] += 1
+            else:
+                old, new = next(previous, None), next(current, None)
+                continue
+            rows += [entry[2] for entry in new[1]]
+            if old is not None and old[0] == new[0]:
+                old = next(previous, None)
+            new = next(current, None)
+    return sorted(rows), deleted, counts
+
+
+def delta_rows(path, start, numbers, deleted, columns, keys, out):
+    """Write the csv rows of a delta with an additional column marking deleted keys
+
+    Runs in the worker processes. New and changed rows are written as they
+    are in the file, deleted keys have empty (NULL) values besides their keys.
+    The delta is written to a file, so it can be streamed in chunks.
+
+    :param path: path of the csv file
+    :param start: offset of the first data row
+    :param numbers: sorted numbers of the new or changed rows
+    :param deleted: key values of the deleted keys
+    :param columns: columns of the csv file
+    :param keys: key columns
+    :param out: path of the delta file
+    :return: size of the delta in bytes
+    """
+    wanted = iter(numbers)
+    following = next(wanted, None)
+    with open(out, "wb", buffering=1 << 20) as f:
+        for number, row in enumerate(records(path, start)):
+            if following is None:
+                break
+            if number == following:
+                f.write(row.rstrip(b"\r\n") + b",f\n")
+                following = next(wanted, None)
+        text = io.TextIOWrapper(f, encoding="utf-8", newline="")
+        writer = csv.writer(text, lineterminator="\n")
+        key_indexes = [columns.index(key) for key in keys]
+        for values in deleted:
+            fields = [None] * len(columns)
+            for i, value in zip(key_indexes, values):
+                fields[i] = value
+            writer.writerow(fields + ["t"])
+        text.flush()
+        text.detach()
+        return f.tell()
+
+
+def read_delta(path, chunk_size):
+    """Chunks of a delta file for copy_from
+
+    :param path: path of the delta file
+    :param chunk_size: number of bytes per chunk
+    :return: generator of chunks (bytes)
+    """
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def apply_statements(table, columns, keys):
+    """Statements around the COPY of a delta into the temporary table _delta
+
+    :param table: name of the table in the import schema
+    :param columns: columns of the table
+    :param keys: key columns
+    :return: tuple of setup and finishing statements
+    """
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    key_list = ", ".join(f'"{key}"' for key in keys)
+    matching = " AND ".join(f'target."{key}" = _delta."{key}"' for key in keys)
+    setup = [
+        f"CREATE INDEX IF NOT EXISTS {table}_delta_key ON import.{table} ({key_list})",
+        f"CREATE TEMP TABLE _delta ON COMMIT DROP AS SELECT {column_list}, "
+        f"false AS _deleted FROM import.{table} WITH NO DATA",
+    ]
+    finish = [
+        f"DELETE FROM import.{table} AS target USING _delta WHERE {matching}",
+        f"INSERT INTO import.{table} ({column_list}) "
+        f"SELECT {column_list} FROM _delta WHERE NOT _deleted",
+    ]
+    return setup, finish
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import os
+import re
+from pathlib import Path
+
+from . import ndjson, staging, utils
+
+logger = logging.getLogger("discovery")
+
+zip_extensions = [".zip"]
+dump_extensions = [".csv"] + ndjson.extensions
+
+
+def walk(source):
+    """Walk a source directory with os.scandir, yielding files as they are found
+
+    Like Path.rglob, symlinked directories are not followed.
+
+    :param source: source directory or file
+    :return: generator of file paths
+    """
+    source = Path(source)
+    if not source.is_dir():
+        if source.is_file():
+            yield source
+        return
+    stack = [str(source)]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir() and not entry.is_symlink():
+                            stack.append(entry.path)
+                        elif entry.is_file():
+                            yield Path(entry.path)
+                    except OSError as e:
+                        logger.warning(f"Skipping {entry.path}: {e}")
+        except OSError as e:
+            logger.warning(f"Cannot scan {directory}: {e}")
+
+
+def signature(path):
+    """Size and modification time identifying the contents of a file
+
+    :param path: path of the file
+    :return: tuple of the size and mtime in ns, None if the file is gone
+    """
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class Discovery:
+    """Classifies and groups the files of all sources in a single pass
+
+    Zip archives and dump files are collected by extension, excluded dump
+    files are filtered with a precompiled pattern and dump files are grouped
+    into tables as they are found. Files listed in a staging manifest that
+    were deleted after they were loaded are kept apart with their row counts.
+    """
+
+    def __init__(self, exclude_regex=None):
+        self.exclude = re.compile(exclude_regex) if exclude_regex else None
+        self.seen = set()
+        # Signatures of the files as they were found, before they were loaded
+        self.signatures = dict()
+        self.zip_files = list()
+        self.dump_files = list()
+        self.table_dump_files = dict()
+        # Rows of loaded files that were deleted after staging
+        self.staged = dict()
+        self.staged_files = dict()
+
+    def is_dump(self, path):
+        return path.suffix in dump_extensions and not (
+            self.exclude and self.exclude.match(path.stem)
+        )
+
+    def add(self, path):
+        """Classify a single file
+
+        :param path: path of the file
+        :return: whether the file is a new zip archive or dump file
+        """
+        suffix = path.suffix
+        if path.name == staging.manifest_name:
+            self.add_manifest(path)
+            return False
+        if suffix not in zip_extensions and suffix not in dump_extensions:
+            return False
+        path = path.absolute()
+        if path in self.seen:
+            return False
+        self.seen.add(path)
+        self.signatures[path] = signature(path)
+        if suffix in zip_extensions:
+            self.zip_files.append(path)
+            return True
+        if not self.is_dump(path):
+            return False
+        if self.staged.pop(str(path), None) is not None:
+            # Extracted again
+            self.staged_files[utils.table_name_for_path(path)].remove(path)
+        self.dump_files.append(path)
+        self.table_dump_files.setdefault(utils.table_name_for_path(path), []).append(
+            path
+        )
+        return True
+
+    def add_manifest(self, path):
+        """Add the deleted files of a staging manifest
+
+        :param path: path of the manifest
+        :return:
+        """
+        dest = path.parent.absolute()
+        for name, entry in staging.load_manifest(dest).items():
+            member = dest / name
+            if member in self.seen or str(member) in self.staged:
+                continue
+            if not self.is_dump(member) or member.exists():
+                continue
+            self.staged[str(member)] = entry.get("rows", 0)
+            self.staged_files.setdefault(utils.table_name_for_path(member), []).append(
+                member
+            )
+
+    def tables(self):
+        """Dump files of every table group, including deleted files of manifests
+
+        :return: dict of table groups to dump files
+        """
+        tables = {table: list(files) for table, files in self.table_dump_files.items()}
+        for table, files in self.staged_files.items():
+            if files:
+                tables[table] = sorted(set(tables.get(table, [])) | set(files))
+        return tables
+
+    async def scan_queued(self, sources, queue):
+        """Walk all sources in a thread and put new files into a queue as they are found
+
+        The queue gets None once the walk is complete.
+
+        :param sources: list of source directories or files
+        :param queue: asyncio queue of the newly found files
+        :return:
+        """
+        loop = asyncio.get_event_loop()
+
+        def scan():
+            try:
+                for source in sources:
+                    for path in walk(source):
+                        if self.add(path):
+                            loop.call_soon_threadsafe(queue.put_nowait, path)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, None)
+
+        await loop.run_in_executor(None, scan)
+
+    def scan(self, sources):
+        """Walk all sources and classify their files
+
+        :param sources: list of source directories or files
+        :return: list of newly found files
+        """
+        found = list()
+        for source in sources:
+            for path in walk(source):
+                if self.add(path):
+                    found.append(path)
+        logger.debug(f"Discovered {len(found)} new files in {len(sources)} sources")
+        return found
@@ -1,4 +1,5 @@
 import asyncio
+import itertools
 import logging
 from dataclasses import dataclass
 
@@ -42,6 +43,9 @@ async def run(
         if process:
             process.terminate()
         raise
+    except OSError as e:
+        # E.g. an argument that is too long, the caller decides whether it matters
+        logger.error(f"Failed to run {executable}: {e}")
 
 
 async def sync_run(executable, cmd):
@@ -60,6 +64,9 @@ async def sync_run(executable, cmd):
         if process:
             process.terminate()
         raise
+    except OSError as e:
+        logger.error(f"Failed to run {executable}: {e}")
+        return b"", str(e).encode("utf-8")
 
 
 async def run_simultaneously(commands, max_concurrency=None, queue=None):
@@ -102,7 +109,9 @@ async def exec_sql(
 
     formatting = ["--tuples-only", "--no-align"]
     task = (
-        ["-f", str(script)]
+        # A failing statement stops the script with an error, scripts may run
+        # statements that cannot run in a transaction (e.g. VACUUM)
+        ["-v", "ON_ERROR_STOP=1", "-f", str(script)]
         if script
         else [
             "-c",
@@ -114,18 +123,241 @@ async def exec_sql(
         ]
     )
 
-    cmd = [
-        "psql",
-        (
-            [" ".join([f"{k}={v}" for k, v in db_options.items()])]
-            if len(db_options) > 0
-            else []
-        )
-        + formatting
-        + task,
-    ]
+    cmd = ["psql", psql_connection(db_options) + formatting + task]
     logger.debug(cmd)
     if not sync:
         await run(*cmd, completion=completion)
     else:
         return await sync_run(*cmd)
+
+
+class AdvisoryLock:
+    """Session advisory lock held by a psql process while the context is entered
+
+    The lock is held across any number of other sessions and released when
+    the context exits, or by the database when the process dies.
+
+    :param db_options: psql connection options
+    :param key: sql expression of the lock key, None does not lock
+    """
+
+    def __init__(self, db_options, key):
+        self.db_options = db_options
+        self.key = key
+        self.process = None
+
+    async def __aenter__(self):
+        if self.key is None:
+            return self
+        cmd = psql_connection(self.db_options) + [
+            "-v",
+            "ON_ERROR_STOP=1",
+            "--tuples-only",
+            "--no-align",
+            "-f",
+            "-",
+        ]
+        self.process = await asyncio.create_subprocess_exec(
+            "psql",
+            *cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
+        )
+        try:
+            self.process.stdin.write(
+                f"SELECT 'locked' FROM pg_advisory_lock({self.key});\n".encode()
+            )
+            await self.process.stdin.drain()
+            # Blocks until the lock is granted
+            locked = await self.process.stdout.readline()
+        except (asyncio.CancelledError, Exception):
+            await self.release()
+            raise
+        if locked.strip() != b"locked":
+            stderr = await self.release()
+            raise OSError(f"Failed to lock {self.key}: {stderr.decode().strip()}")
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.release()
+
+    async def release(self):
+        """End the session holding the lock
+
+        :return: stderr of the session
+        """
+        process, self.process = self.process, None
+        if process is None:
+            return b""
+        if process.returncode is None:
+            process.stdin.close()
+        try:
+            _, stderr = await asyncio.wait_for(process.communicate(), timeout=10)
+        except asyncio.TimeoutError:
+            process.terminate()
+            return b""
+        return stderr or b""
+
+
+async def iterate(items):
+    for item in items:
+        yield item
+
+
+def psql_connection(db_options):
+    if isinstance(db_options, str):
+        # A connection string or URI
+        return [db_options]
+    return (
+        [" ".join([f"{k}={v}" for k, v in db_options.items()])]
+        if len(db_options) > 0
+        else []
+    )
+
+
+async def copy_from(
+    db_options, table, chunks, columns=None, options=None, setup=None, finish=None
+):
+    """Stream chunks of data into a table using COPY ... FROM STDIN
+
+    The setup statements, the COPY and the finishing statements are executed
+    in a single transaction, so a failed COPY leaves no half-created table or
+    stale bookkeeping behind.
+
+    :param db_options: psql connection options
+    :param table: qualified name of the target table
+    :param chunks: (async) iterable of encoded chunks (bytes) in the COPY format
+    :param columns: optional list of target columns
+    :param options: optional COPY options (e.g. "FORMAT csv, HEADER")
+    :param setup: optional list of statements to execute before the COPY
+    :param finish: optional list of statements to execute after the COPY
+    :return: tuple of the finished process, its stdout and stderr
+    """
+    column_list = (
+        " (%s)" % ", ".join(f'"{column}"' for column in columns) if columns else ""
+    )
+    copy = f"COPY {table}{column_list} FROM STDIN" + (
+        f" WITH ({options})" if options else ""
+    )
+    statements = list(setup or []) + [copy] + list(finish or [])
+    cmd = (
+        psql_connection(db_options)
+        + ["-v", "ON_ERROR_STOP=1", "--single-transaction"]
+        + list(itertools.chain.from_iterable(["-c", s] for s in statements))
+    )
+    logger.debug("Running psql with %s" % cmd)
+    process = None
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "psql",
+            *cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            # Keep a terminal interrupt from aborting the transaction, the
+            # loader decides whether to drain or terminate
+            start_new_session=True,
+        )
+        if not hasattr(chunks, "__aiter__"):
+            chunks = iterate(chunks)
+        try:
+            async for chunk in chunks:
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # psql exited early, the reason will be on stderr
+            logger.debug(f"psql stopped reading input for {table}")
+        process.stdin.close()
+        stdout, stderr = await process.communicate()
+        logger.debug(f"COPY into {table} terminated")
+        return process, stdout, stderr
+    except (asyncio.CancelledError, Exception):
+        # Terminating psql aborts the transaction of the incomplete COPY
+        if process and process.returncode is None:
+            process.terminate()
+        raise
+
+
+async def copy_to(db_options, query, output, block_size=1 << 20):
+    """Stream the result of a query out of the database using COPY ... TO STDOUT
+
+    :param db_options: psql connection options
+    :param query: query whose rows are copied in the COPY text format
+    :param output: coroutine function receiving blocks of complete rows
+    :param block_size: number of bytes read at once
+    :return: tuple of the finished process and its stderr
+    """
+    cmd = psql_connection(db_options) + [
+        "-v",
+        "ON_ERROR_STOP=1",
+        "-c",
+        f"COPY ({query}) TO STDOUT",
+    ]
+    logger.debug("Running psql with %s" % cmd)
+    process = None
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "psql",
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
+        )
+        stderr = asyncio.ensure_future(process.stderr.read())
+        rest = b""
+        while True:
+            block = await process.stdout.read(block_size)
+            if not block:
+                break
+            data = rest + block
+            end = data.rfind(b"\n") + 1
+            rest = data[end:]
+            if end > 0:
+                await output(data[:end])
+        if rest:
+            await output(rest)
+        await process.wait()
+        return process, await stderr
+    except (asyncio.CancelledError, Exception):
+        if process and process.returncode is None:
+            process.terminate()
+        raise
+
+
+async def execute(db_options, statements):
+    """Execute statements in a single transaction
+
+    The statements are sent as a script on stdin, so their size is not
+    limited by the maximum length of a command line argument.
+
+    :param db_options: psql connection options
+    :param statements: list of sql statements
+    :return: tuple of the finished process, its stdout and stderr
+    """
+    cmd = psql_connection(db_options) + [
+        "-v",
+        "ON_ERROR_STOP=1",
+        "--single-transaction",
+        "-f",
+        "-",
+    ]
+    script = "".join(f"{statement};\n" for statement in statements)
+    logger.debug("Running psql with %s" % cmd)
+    process = None
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "psql",
+            *cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
+        )
+        stdout, stderr = await process.communicate(script.encode("utf-8"))
+        return process, stdout, stderr
+    except (asyncio.CancelledError, Exception):
+        if process and process.returncode is None:
+            process.terminate()
+        raise
@@ -0,0 +1,108 @@
+import asyncio
+import collections
+import logging
+import os
+import shutil
+import time
+import zipfile
+import zlib
+from pathlib import Path, PurePosixPath
+
+logger = logging.getLogger("extract")
+
+buffer_size = 1 << 20
+errors = (OSError, zipfile.BadZipFile, zlib.error, EOFError)
+
+
+def member_path(dest, info):
+    """Path of a member below the destination, ignoring absolute and parent parts"""
+    parts = [
+        part
+        for part in PurePosixPath(info.filename.replace("\\", "/")).parts
+        if part not in ("/", ".", "..")
+    ]
+    return Path(dest).joinpath(*parts) if parts else None
+
+
+def crc32(path, size=buffer_size):
+    checksum = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(size), b""):
+            checksum = zlib.crc32(block, checksum)
+    return checksum
+
+
+def unchanged(path, info):
+    """Whether an extracted file matches the size and CRC-32 of its zip entry"""
+    try:
+        if path.stat().st_size != info.file_size:
+            return False
+        return crc32(path) == info.CRC
+    except OSError:
+        return False
+
+
+def extract_member(archive, info, dest, size=buffer_size):
+    """Extract a single member unless the file on disk already matches it
+
+    The member is written to a temporary file that replaces the target once
+    it is complete, so readers never see a partially extracted file.
+
+    :param archive: open zip file, members can be read concurrently
+    :param info: zip info of the member
+    :param dest: destination directory
+    :param size: buffer size for reading and writing
+    :return: "extracted" or "skipped"
+    """
+    path = member_path(dest, info)
+    if path is None:
+        return "skipped"
+    if info.is_dir():
+        path.mkdir(parents=True, exist_ok=True)
+        return "skipped"
+    if unchanged(path, info):
+        return "skipped"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Nodes loading the same sources may extract the same member concurrently
+    partial = path.with_name(f"{path.name}.{os.getpid()}.part")
+    try:
+        with archive.open(info) as src, open(partial, "wb", buffering=size) as dst:
+            shutil.copyfileobj(src, dst, size)
+        modified = time.mktime(info.date_time + (0, 0, -1))
+        os.utime(partial, (modified, modified))
+        os.replace(partial, path)
+    except BaseException:
+        if partial.exists():
+            partial.unlink()
+        raise
+    return "extracted"
+
+
+async def extract_archive(src, dest, limit, size=buffer_size):
+    """Extract the members of an archive in parallel
+
+    :param src: path of the zip archive
+    :param dest: destination directory
+    :param limit: semaphore limiting the members extracted at the same time,
+        shared by all archives
+    :param size: buffer size for reading and writing
+    :return: counter of extracted and skipped members
+    """
+    loop = asyncio.get_event_loop()
+
+    async def extract(archive, info):
+        async with limit:
+            return await loop.run_in_executor(
+                None, extract_member, archive, info, dest, size
+            )
+
+    with zipfile.ZipFile(src) as archive:
+        # Largest members first, so a large member does not finish last
+        members = sorted(archive.infolist(), key=lambda i: i.file_size, reverse=True)
+        results = await asyncio.gather(
+            *[extract(archive, i) for i in members], return_exceptions=True
+        )
+    failed = [r for r in results if isinstance(r, BaseException)]
+    if failed:
+        raise failed[0]
+    return collections.Counter(results)
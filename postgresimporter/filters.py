@@ -0,0 +1,167 @@
+import fnmatch
+import hashlib
+import io
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from . import normalize
+
+predicate_pattern = re.compile(
+    r"\A(?P<table>[^.]*)\.(?P<column>[^<>=!~]+)(?P<op>>=|<=|!=|=|<|>|~)(?P<value>.*)\Z",
+    re.DOTALL,
+)
+operators = {
+    "=": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+}
+
+
+@dataclass
+class Plan:
+    """Columns, predicates and sample applied to the rows of a file"""
+
+    width: int
+    keep: Optional[List[int]]
+    predicates: List[Tuple[int, str, str]]
+    fraction: Optional[float]
+    sample_keys: Optional[List[int]]
+
+
+def parse_predicate(spec):
+    """Parse a row predicate like animals.legs>=4
+
+    The table may contain shell wildcards. Operators are =, !=, <, <=, >, >=
+    and ~ for a regular expression search.
+
+    :param spec: predicate specification
+    :return: tuple of table pattern, column, operator and value
+    """
+    match = predicate_pattern.match(spec)
+    if not match:
+        raise ValueError("%s is not a valid predicate (e.g. animals.legs>=4)" % spec)
+    table, column, op, value = match.group("table", "column", "op", "value")
+    if op == "~":
+        try:
+            re.compile(value)
+        except re.error as e:
+            raise ValueError("%s is not a valid regular expression: %s" % (value, e))
+    return table.strip() or "*", column.strip(), op, value
+
+
+def parse_sample(spec):
+    """Parse a sample like animals=1%:id or animals=0.01
+
+    :param spec: table pattern, fraction or percentage and optional key columns
+    :return: tuple of table pattern, fraction and key columns (or None for whole rows)
+    """
+    table, separator, sample = spec.partition("=")
+    fraction, _, keys = sample.partition(":")
+    try:
+        fraction = fraction.strip()
+        if fraction.endswith("%"):
+            value = float(fraction[:-1]) / 100.0
+        else:
+            value = float(fraction)
+    except ValueError:
+        value = None
+    if not separator or not table.strip() or value is None or not 0 < value <= 1:
+        raise ValueError("%s is not a valid sample (e.g. animals=1%%:id)" % spec)
+    keys = [key.strip() for key in keys.split(",") if key.strip()]
+    return table.strip(), value, keys or None
+
+
+def plan(tables, columns, keep_columns=None, predicates=None, samples=None):
+    """Plan of the rows and columns loaded from a file, the last matching sample wins
+
+    :param tables: names the table is known by (file stem and table group)
+    :param columns: column names of the file
+    :param keep_columns: list of (table pattern, columns to keep)
+    :param predicates: list of (table pattern, column, operator, value)
+    :param samples: list of (table pattern, fraction, key columns)
+    :return: Plan or None if all rows and columns are loaded
+    """
+
+    def matching(rules):
+        return [
+            rule[1:]
+            for rule in rules or []
+            if any(fnmatch.fnmatchcase(t, rule[0]) for t in tables)
+        ]
+
+    def index(column):
+        if column not in columns:
+            raise ValueError("%s has no column %s" % (tables[0], column))
+        return columns.index(column)
+
+    kept = [index(c) for keep in matching(keep_columns) for c in keep[0]]
+    conditions = [(index(c), op, value) for c, op, value in matching(predicates)]
+    sample = (matching(samples) or [None])[-1]
+    if not kept and not conditions and sample is None:
+        return None
+    return Plan(
+        width=len(columns),
+        keep=sorted(set(kept)) or None,
+        predicates=conditions,
+        fraction=sample[0] if sample else None,
+        sample_keys=[index(c) for c in sample[1]] if sample and sample[1] else None,
+    )
+
+
+def matches(value, op, expected):
+    """Whether a value satisfies a predicate, empty values only equal an empty value"""
+    if not value or not expected:
+        return operators[op](value, expected) if op in ("=", "!=") else False
+    if op == "~":
+        return re.search(expected, value) is not None
+    try:
+        return operators[op](float(value), float(expected))
+    except ValueError:
+        return operators[op](value, expected)
+
+
+def sampled(row, fraction, key_indexes=None):
+    """Whether a row is part of a sample, the same keys are sampled in every table
+
+    :param row: list of values
+    :param fraction: fraction of keys in the sample
+    :param key_indexes: indexes of the key columns or None for the whole row
+    :return: bool
+    """
+    values = row if key_indexes is None else [row[i] for i in key_indexes]
+    digest = hashlib.blake2b("\x1f".join(values).encode("utf-8"), digest_size=8)
+    return int.from_bytes(digest.digest(), "big") < fraction * (1 << 64)
+
+
+def filter_csv(data, selection):
+    """Drop the rows and columns of a csv chunk that are not loaded
+
+    Runs in a worker process. Kept fields are written as they are in the
+    source, so values, quotes and NULLs do not change. Rows with an
+    unexpected number of columns are passed through unchanged for COPY to
+    report.
+
+    :param data: csv chunk of complete rows
+    :param selection: Plan of the file
+    :return: tuple of the filtered csv chunk (bytes) and the number of dropped rows
+    """
+    out, dropped = io.StringIO(), 0
+    for row in normalize.raw_rows(data.decode("utf-8")):
+        if len(row) == selection.width:
+            values = [normalize.field_value(field) or "" for field in row]
+            if not all(matches(values[i], op, v) for i, op, v in selection.predicates):
+                dropped += 1
+                continue
+            if selection.fraction is not None and not sampled(
+                values, selection.fraction, selection.sample_keys
+            ):
+                dropped += 1
+                continue
+            if selection.keep is not None:
+                row = [row[i] for i in selection.keep]
+        out.write(",".join(row) + "\n")
+    return out.getvalue().encode("utf-8"), dropped
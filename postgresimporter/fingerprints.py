@@ -0,0 +1,115 @@
+import hashlib
+import json
+import logging
+import re
+
+from . import exec, utils
+
+logger = logging.getLogger("fingerprints")
+
+loads_table = "import._loads"
+hooks_table = "import._hooks"
+
+create_loads_table = f"""CREATE TABLE IF NOT EXISTS {loads_table} (
+    table_name text PRIMARY KEY,
+    version bigint NOT NULL,
+    loaded_at timestamp with time zone NOT NULL DEFAULT now()
+)"""
+
+create_hooks_table = f"""CREATE TABLE IF NOT EXISTS {hooks_table} (
+    script text PRIMARY KEY,
+    fingerprint text NOT NULL,
+    executed_at timestamp with time zone NOT NULL DEFAULT now()
+)"""
+
+table_pattern = re.compile(r'\bimport\s*\.\s*("?)([A-Za-z_][\w$]*)\1', re.IGNORECASE)
+
+
+def setup_statements():
+    return [
+        "CREATE SCHEMA IF NOT EXISTS import",
+        create_loads_table,
+        create_hooks_table,
+    ]
+
+
+def input_tables(text):
+    """Tables of the import schema a script refers to
+
+    :param text: sql script
+    :return: sorted list of table names, bookkeeping tables excluded
+    """
+    return sorted(
+        {
+            match.group(2) if match.group(1) else match.group(2).lower()
+            for match in table_pattern.finditer(text)
+            if not match.group(2).startswith("_")
+        }
+    )
+
+
+def record_loads(tables):
+    """Statements bumping the load version of tables that were (re)loaded
+
+    :param tables: names of the tables in the import schema
+    :return: list of sql statements
+    """
+    values = ", ".join(f"({utils.sql_literal(t)}, 1)" for t in sorted(set(tables)))
+    return setup_statements() + [
+        f"INSERT INTO {loads_table} (table_name, version) VALUES {values} "
+        f"ON CONFLICT (table_name) DO UPDATE SET version = {loads_table}.version + 1, "
+        "loaded_at = now()"
+    ]
+
+
+def fingerprint(text, versions):
+    """Hash of a script and the load versions of its input tables
+
+    :param text: sql script
+    :param versions: dict of input tables to their load version
+    :return: hex digest
+    """
+    digest = hashlib.sha256(text.encode("utf-8"))
+    digest.update(json.dumps(versions, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+async def state(db_options, script, inputs=None):
+    """Last recorded fingerprint of a script and the versions of its inputs
+
+    :param db_options: psql connection options
+    :param script: path identifying the script
+    :param inputs: input table names or None for all loaded tables
+    :return: tuple of the last fingerprint (or None) and a dict of versions
+    """
+    condition = ""
+    if inputs is not None:
+        condition = "WHERE table_name IN (%s)" % ", ".join(
+            [utils.sql_literal(t) for t in inputs] or ["NULL"]
+        )
+    stdout, stderr = await exec.exec_sql(
+        db_options,
+        command=(
+            f"SELECT (SELECT fingerprint FROM {hooks_table} "
+            f"WHERE script = {utils.sql_literal(script)}) AS last, "
+            f"(SELECT json_object_agg(table_name, version) FROM {loads_table} "
+            f"{condition}) AS versions"
+        ),
+        sync=True,
+    )
+    try:
+        rows = json.loads(stdout or "null")
+        return rows[0]["last"], rows[0]["versions"] or dict()
+    except (json.decoder.JSONDecodeError, TypeError, KeyError, IndexError):
+        # The bookkeeping tables do not exist before the first recorded hook
+        logger.debug(stderr)
+        return None, dict()
+
+
+def record(script, fingerprint):
+    return setup_statements() + [
+        f"INSERT INTO {hooks_table} (script, fingerprint) VALUES "
+        f"({utils.sql_literal(script)}, {utils.sql_literal(fingerprint)}) "
+        "ON CONFLICT (script) DO UPDATE SET fingerprint = EXCLUDED.fingerprint, "
+        "executed_at = now()"
+    ]
@@ -25,7 +25,7 @@ CREATE OR REPLACE FUNCTION parse_timestamp_with_tz(text, text, text) RETURNS TIM
     /* "28-MAR-19 05.02.10.000000000 AM GMT" */
     AS $$ SELECT to_timestamp($1, $2) AT TIME ZONE $3 AT TIME ZONE (select current_setting('timezone'))$$
     LANGUAGE SQL
-    IMMUTABLE
+    STABLE
     RETURNS NULL ON NULL INPUT;
 
 CREATE OR REPLACE FUNCTION parse_timezone(text) RETURNS text
@@ -54,7 +54,7 @@ CREATE OR REPLACE FUNCTION parse_timestamp(text) RETURNS TIMESTAMP WITH TIME ZON
                 THEN to_timestamp($1, 'YYYYMMDDHH24MISS TZHTZM')
             END $$
     LANGUAGE SQL
-    IMMUTABLE
+    STABLE
     RETURNS NULL ON NULL INPUT;
 
 CREATE OR REPLACE FUNCTION parse_date(text) RETURNS DATE
@@ -0,0 +1,206 @@
+import hashlib
+import json
+import logging
+import os
+import socket
+
+from . import exec, utils
+
+logger = logging.getLogger("jobs")
+
+table = "import._jobs"
+finish_job = "finish"
+combine_prefix = "combine:"
+
+create_table = f"""CREATE TABLE IF NOT EXISTS {table} (
+    job text PRIMARY KEY,
+    kind text NOT NULL,
+    version text NOT NULL,
+    size bigint NOT NULL DEFAULT 0,
+    state text NOT NULL DEFAULT 'pending',
+    node text,
+    attempts integer NOT NULL DEFAULT 0,
+    lease_until timestamp with time zone,
+    heartbeat_at timestamp with time zone,
+    finished_at timestamp with time zone
+)"""
+
+
+def default_node():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def file_version(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime!r}"
+
+
+def finish_version(versions):
+    """Version of the finishing job, which changes with any of the files"""
+    digest = hashlib.sha256(json.dumps(sorted(versions.items())).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def combine_job(name):
+    return f"{combine_prefix}{name}"
+
+
+def combined_table(job):
+    return job[len(combine_prefix) :]
+
+
+def lock_key(name):
+    """Key of the advisory lock of a combined table
+
+    :param name: name of the combined table
+    :return: sql expression
+    """
+    return f"hashtext({utils.sql_literal(f'postgresimporter.import.{name}')})"
+
+
+def lock_statement(name):
+    """Statement holding the advisory lock of a combined table until the transaction ends
+
+    Keeps a node that took over an expired combine job from rebuilding the
+    table while the first node still does.
+
+    :param name: name of the combined table
+    :return: sql statement
+    """
+    return f"SELECT pg_advisory_xact_lock({lock_key(name)})"
+
+
+def register_statements(files, finish, tables=None):
+    """Statements adding the jobs of a load
+
+    Jobs of files that changed and jobs that failed become pending again,
+    jobs that are done or held by another node are kept. The combine jobs
+    and the finishing job become pending whenever a file is loaded again.
+
+    :param files: dict of file paths to their version and size
+    :param finish: version of the finishing job
+    :param tables: dict of combined tables to their version and size
+    :return: list of sql statements
+    """
+    values = [
+        f"({utils.sql_literal(path)}, 'file', {utils.sql_literal(version)}, {size})"
+        for path, (version, size) in sorted(files.items())
+    ] + [
+        f"({utils.sql_literal(combine_job(name))}, 'combine', "
+        f"{utils.sql_literal(version)}, {size})"
+        for name, (version, size) in sorted((tables or dict()).items())
+    ]
+    values.append(
+        f"({utils.sql_literal(finish_job)}, 'finish', {utils.sql_literal(finish)}, 0)"
+    )
+    return [
+        "CREATE SCHEMA IF NOT EXISTS import",
+        create_table,
+        f"INSERT INTO {table} AS jobs (job, kind, version, size) VALUES {', '.join(values)} "
+        "ON CONFLICT (job) DO UPDATE SET version = EXCLUDED.version, size = EXCLUDED.size, "
+        "state = 'pending', node = NULL, attempts = 0, lease_until = NULL "
+        "WHERE jobs.version <> EXCLUDED.version OR jobs.state = 'failed'",
+        # Files loaded again have to be combined and checked again
+        f"UPDATE {table} SET state = 'pending', node = NULL, attempts = 0 "
+        f"WHERE kind IN ('combine', 'finish') AND state IN ('done', 'failed') AND EXISTS "
+        f"(SELECT 1 FROM {table} WHERE kind = 'file' AND state IN ('pending', 'running'))",
+    ]
+
+
+def claim_query(node, kind, lease):
+    """Query claiming the largest claimable job of a kind
+
+    A job is claimable while it is pending or when the lease of the node
+    holding it ran out. Rows locked by other nodes are skipped instead of
+    waited for. Combine jobs only become claimable once no file is pending
+    or being loaded, including files of crashed nodes, and the finishing job
+    once no table is left to combine either.
+
+    :param node: name of the claiming node
+    :param kind: file, combine or finish
+    :param lease: lease in seconds
+    :return: sql query returning the claimed job
+    """
+    waits_for = dict(combine="'file'", finish="'file', 'combine'").get(kind)
+    condition = ""
+    if waits_for:
+        condition = (
+            f" AND NOT EXISTS (SELECT 1 FROM {table} WHERE kind IN ({waits_for}) "
+            "AND state IN ('pending', 'running'))"
+        )
+    return (
+        f"WITH claimed AS (UPDATE {table} SET state = 'running', "
+        f"node = {utils.sql_literal(node)}, attempts = attempts + 1, heartbeat_at = now(), "
+        f"lease_until = now() + interval '{float(lease)} seconds' "
+        f"WHERE job = (SELECT job FROM {table} WHERE kind = {utils.sql_literal(kind)} "
+        "AND (state = 'pending' OR (state = 'running' AND lease_until < now()))"
+        f"{condition} ORDER BY size DESC, job LIMIT 1 FOR UPDATE SKIP LOCKED) "
+        "RETURNING job, attempts) SELECT json_agg(claimed) FROM claimed"
+    )
+
+
+def heartbeat_statement(node, lease):
+    return (
+        f"UPDATE {table} SET heartbeat_at = now(), "
+        f"lease_until = now() + interval '{float(lease)} seconds' "
+        f"WHERE node = {utils.sql_literal(node)} AND state = 'running'"
+    )
+
+
+def finish_statement(node, job, state):
+    """Statement ending a job, unless its lease was taken over by another node
+
+    :param node: name of the node
+    :param job: name of the job
+    :param state: done, failed or pending to hand the job back
+    :return: sql statement
+    """
+    return (
+        f"UPDATE {table} SET state = {utils.sql_literal(state)}, lease_until = NULL, "
+        f"finished_at = CASE WHEN {utils.sql_literal(state)} = 'pending' THEN NULL ELSE now() END "
+        f"WHERE job = {utils.sql_literal(job)} AND node = {utils.sql_literal(node)} "
+        "AND state = 'running'"
+    )
+
+
+def open_query(kind):
+    return (
+        f"SELECT count(*) AS open FROM {table} "
+        f"WHERE kind = {utils.sql_literal(kind)} AND state IN ('pending', 'running')"
+    )
+
+
+async def claim(db_options, node, kind, lease):
+    """Claim a job
+
+    :param db_options: psql connection options of the coordinating database
+    :param node: name of the claiming node
+    :param kind: file, combine or finish
+    :param lease: lease in seconds
+    :return: name of the claimed job or None
+    """
+    stdout, stderr = await exec.exec_sql(
+        db_options, command=claim_query(node, kind, lease), sync=True, wrap_json=False,
+    )
+    try:
+        rows = json.loads(stdout or "null")
+    except (json.decoder.JSONDecodeError, TypeError):
+        logger.error(stderr)
+        return None
+    if not rows:
+        return None
+    if rows[0]["attempts"] > 1:
+        logger.warning(f"Took over {rows[0]['job']} (attempt {rows[0]['attempts']})")
+    return rows[0]["job"]
+
+
+async def open_jobs(db_options, kind):
+    """Number of jobs of a kind that are pending or running, None on errors"""
+    stdout, stderr = await exec.exec_sql(
+        db_options, command=open_query(kind), sync=True
+    )
+    try:
+        return json.loads(stdout or "null")[0]["open"]
+    except (json.decoder.JSONDecodeError, TypeError, KeyError, IndexError):
+        logger.error(stderr)
+        return None
@@ -1,17 +1,49 @@
 import asyncio
-import concurrent.futures
+import collections
+import csv
 import itertools
 import json
 import logging
-import multiprocessing
 import os
 import re
 import signal
+import tempfile
+import time
 from pathlib import Path
 
+import jinja2
 from prettytable import PrettyTable
 
-from . import cli, csvcount, exec, utils
+from . import (
+    checkpoints,
+    chunks,
+    cli,
+    concurrency,
+    conversions,
+    csvcount,
+    dedup,
+    delta,
+    discovery,
+    exec,
+    extract,
+    filters,
+    fingerprints,
+    jobs,
+    merge,
+    ndjson,
+    normalize,
+    pgbinary,
+    preflight,
+    rejects,
+    schema,
+    servercopy,
+    staging,
+    templates,
+    throttle,
+    utils,
+    watch,
+    workers,
+)
 
 try:
     from progressbar import ProgressBar, UnknownLength
@@ -37,21 +69,39 @@ class Loader:
     zip_done = 0
     load_total = 0
     load_done = dict()
+    # Row counts of extracted files that were deleted after they were loaded
+    staged = dict()
     tables_created = list()
     table_lock = asyncio.Lock()
 
-    executor = concurrent.futures.ProcessPoolExecutor(
-        max_workers=max(1, multiprocessing.cpu_count() - 1)
-    )
+    # Chunks that are being committed and should finish before shutting down
+    in_flight = set()
+    draining = False
+    drain_timeout = 60.0
+    # Set on SIGUSR1 to re-read the --throttle-file
+    reload_throttle = False
+    discovery = None
+
+    executor = workers.executor
     queue = asyncio.PriorityQueue()
+    # Seconds between two polls of supervised processes, and without any
+    # process before supervising stops
+    progress_interval = 0.5
+    queue_timeout = 10.0
 
     def reset(self):
         self.zip_total = self.zip_done = self.load_total = 0
         self.load_done = dict()
+        self.staged = dict()
+        self.discovery = None
 
     def __init__(self, args, progress=True):
         self.progress = progress
         self.args = args
+        self.streams = None
+        self.controller = None
+        self.throttle = None
+        self.zone = None
 
     async def check_progress(self, output_handler=None, completion_handler=None):
         if not self.progress:
@@ -60,7 +110,7 @@ class Loader:
             while True:
                 try:
                     priority, item = await asyncio.wait_for(
-                        self.queue.get(), timeout=10.0
+                        self.queue.get(), timeout=self.queue_timeout
                     )
                     logger.debug("Enqueued priority: %s" % priority)
                 except asyncio.TimeoutError:
@@ -88,7 +138,7 @@ class Loader:
                         f"{item.cmd} was queued again with priority {priority}"
                     )
                 await self.update_progress()
-                await asyncio.sleep(0.5)
+                await asyncio.sleep(self.progress_interval)
         except asyncio.CancelledError:
             while True:
                 try:
@@ -102,6 +152,8 @@ class Loader:
                     pass
 
     async def update_progress(self):
+        if not self.progress:
+            return
         self.bar.max_value = self.zip_total + self.load_total
         self.bar.update(
             min(
@@ -141,15 +193,119 @@ class Loader:
         }
         return {k: v for k, v in db_options.items() if v is not None}
 
+    @property
+    def targets(self):
+        return list(self.args.targets or []) or [self.sql_db_options]
+
+    @property
+    def overlapped(self):
+        """Whether files are loaded while the sources are still being walked"""
+        return bool(
+            self.streaming
+            and not self.args.distributed
+            and (not self.args.disable_import or self.args.all)
+        )
+
+    @property
+    def streaming(self):
+        """Whether files are loaded in chunks by COPY instead of by pgfutter"""
+        return bool(
+            self.args.chunk_size
+            or self.args.resume
+            or self.args.max_rejects is not None
+            # pgfutter only loads into the database of the connection options
+            or self.args.targets
+            or self.args.schema
+            or self.args.infer_types
+            or self.args.copy_format == "binary"
+            or self.args.normalize
+            or self.args.max_streams
+            or self.args.adaptive_streams
+            or self.args.max_bytes_per_second
+            or self.args.max_rows_per_second
+            or self.args.table_rates
+            or self.args.throttle_file
+            or self.args.server_paths
+            or self.args.freeze
+            or self.args.delta_keys
+            or self.args.keep_columns
+            or self.args.where
+            or self.args.samples
+        )
+
+    async def exec_sql_targets(self, **kwargs):
+        await asyncio.gather(
+            *[
+                asyncio.create_task(
+                    exec.exec_sql(target, completion=self.sql_completed, **kwargs)
+                )
+                for target in self.targets
+            ]
+        )
+
+    def discover(self, data_dirs):
+        if self.discovery is None:
+            self.discovery = discovery.Discovery(exclude_regex=self.args.exclude_regex)
+            self.discovery.scan(data_dirs)
+        return self.discovery
+
+    async def step0_preflight(self, data_dirs):
+        """Check all csv files in the worker processes before touching the database
+
+        :param data_dirs: source directories or files
+        :return: whether no file has problems that would fail or corrupt the load
+        """
+        table_dump_files = self.discover(data_dirs).table_dump_files
+        table_csv_files = {
+            table: [f for f in files if f.suffix not in ndjson.extensions]
+            for table, files in table_dump_files.items()
+        }
+        results = await asyncio.gather(
+            *[
+                workers.run(preflight.scan_file, str(f), self.streaming)
+                for files in table_csv_files.values()
+                for f in files
+            ],
+            return_exceptions=True,
+        )
+        reports, position = dict(), 0
+        for table, files in table_csv_files.items():
+            reports[table] = list()
+            for f, result in zip(files, results[position : position + len(files)]):
+                if isinstance(result, Exception):
+                    result = preflight.FileReport(path=str(f), errors=[str(result)])
+                reports[table].append(result)
+            position += len(files)
+            preflight.check_group(table, reports[table], self.args.combine_tables)
+
+        header = ["file", "rows", "columns", "problems"]
+        report = PrettyTable(header)
+        for column in header:
+            report.align[column] = "l"
+        checked = list(itertools.chain.from_iterable(reports.values()))
+        for result in checked:
+            for problem in result.errors:
+                logger.error(f"{result.path} {problem}")
+            for problem in result.warnings:
+                logger.warning(f"{result.path} {problem}")
+            if result.errors or result.warnings:
+                report.add_row(
+                    [
+                        result.path,
+                        result.rows,
+                        len(result.columns),
+                        "\n".join(result.errors + result.warnings),
+                    ]
+                )
+        failed = [result for result in checked if result.errors]
+        logger.info(
+            f"Preflight checked {len(checked)} files, {len(failed)} failed"
+            + (":\n" + str(report) if report.rows else "")
+        )
+        return not failed
+
     async def step1_unzip(self, data_dirs):
-        zip_files = list()
-        for data_dir in data_dirs:
-            zip_files += (
-                data_dir.rglob("*.zip")
-                if data_dir.is_dir()
-                else ([data_dir] if data_dir.suffix == ".zip" else [])
-            )
-        zip_files = list(set(zip_files))  # Remove duplicates
+        zip_files = self.discover(data_dirs).zip_files
         unzipped_files = [
             (zip_file, zip_file.with_name(zip_file.stem)) for zip_file in zip_files
         ]
@@ -163,54 +319,327 @@ class Loader:
                 f"Skipping unzipping of {len(not_yet_unzipped)} not yet unzipped files ({len(zip_files)} total)"
             )
         else:
-            [unzipped.mkdir() for _, unzipped in not_yet_unzipped]
+            [unzipped.mkdir(exist_ok=True) for _, unzipped in not_yet_unzipped]
             await self.unzip(
                 sorted(not_yet_unzipped if not self.args.all else unzipped_files)
             )
+            # Only the extracted directories have to be scanned again
+            self.discovery.scan([unzipped for _, unzipped in not_yet_unzipped])
 
     async def step2_import(self, data_dirs):
-        dump_files = list()
-        for data_dir in data_dirs:
-            dump_files += (
-                data_dir.rglob("*.csv")
-                if data_dir.is_dir()
-                else ([data_dir] if data_dir.suffix == ".csv" else [])
-            )
-        dump_files = list(set(dump_files))  # Remove duplicates
-        if self.args.exclude_regex:
-            dump_files = [
-                file
-                for file in dump_files
-                if not re.match(re.compile(self.args.exclude_regex), file.stem)
-            ]
-        tables = {utils.table_name_for_path(file) for file in dump_files}
-        table_csv_files = {
-            table_name: [
-                filename.absolute()
-                for filename in dump_files
-                if utils.table_name_for_path(filename) == table_name
-            ]
-            for table_name in tables
-        }
+        sources = self.discover(data_dirs)
+        dump_files = sources.dump_files
 
         # Import
-        if self.args.disable_import and not self.args.all:
-            logger.info(f"Skipping importing of {len(dump_files)} csv files")
+        imported = not self.args.disable_import or self.args.all
+        if not imported:
+            logger.info(f"Skipping importing of {len(dump_files)} dump files")
         else:
-            await self.import_data(table_csv_files)
+            await self.import_data(sources.table_dump_files)
+        # Files deleted after staging are combined from their existing tables
+        table_csv_files = sources.tables()
+        await self.finish_import(table_csv_files, imported)
+        return dump_files, table_csv_files
+
+    async def step12_overlapped(self, data_dirs):
+        """Load dump files in chunks while the sources are still being walked
+
+        Dump files start loading as soon as the walk finds them. Archives are
+        extracted once the walk is complete and their files are loaded with
+        the others.
 
+        :param data_dirs: source directories or files
+        :return: tuple of the dump files and the dict of table groups to dump files
+        """
+        self.discovery = discovery.Discovery(exclude_regex=self.args.exclude_regex)
+        found, loaded = asyncio.Queue(), set()
+        self.load_total = 0
+        walker = asyncio.ensure_future(self.discovery.scan_queued(data_dirs, found))
+
+        async def dump_files():
+            while True:
+                path = await found.get()
+                if path is None:
+                    break
+                if path.suffix in discovery.dump_extensions:
+                    loaded.add(path)
+                    self.load_total += 1
+                    yield path
+            await walker
+            # Extracting archives resets the progress of the loaded files
+            load_total = self.load_total
+            await self.step1_unzip(data_dirs)
+            extracted = [p for p in self.discovery.dump_files if p not in loaded]
+            self.load_total = load_total + len(extracted)
+            for path in extracted:
+                yield path
+
+        try:
+            await self.import_streaming(dump_files())
+        finally:
+            await asyncio.gather(walker, return_exceptions=True)
+        table_csv_files = self.discovery.tables()
+        await self.finish_import(table_csv_files)
+        return self.discovery.dump_files, table_csv_files
+
+    async def finish_import(self, table_csv_files, imported=True, combine=True):
         # Declare a default set of packaged functions
-        await exec.exec_sql(
-            self.sql_db_options,
-            script=utils.packaged("postgresimporter", "hooks/functions.sql"),
+        await self.run_hook(
+            utils.packaged("postgresimporter", "hooks/functions.sql"),
+            inputs=[],
             wrap_json=False,
-            completion=self.sql_completed,
         )
 
         # Combine tables
-        if self.args.combine_tables:
+        if self.args.combine_tables and combine:
             await self.combine_tables(table_csv_files)
-        return dump_files, table_csv_files
+        await self.record_loads(self.loaded_tables(table_csv_files, imported))
+
+    @property
+    def staging(self):
+        """Whether archives are extracted in batches that fit the --staging-budget"""
+        return bool(
+            self.args.staging_budget
+            and not self.args.disable_unzip
+            and (not self.args.disable_import or self.args.all)
+        )
+
+    @property
+    def staged_rows(self):
+        """Rows of extracted files deleted in this run or listed in manifests"""
+        staged = dict(self.discovery.staged if self.discovery else dict())
+        staged.update(self.staged)
+        return staged
+
+    async def step12_staged(self, data_dirs):
+        """Extract, import and verify archives in batches that fit the staging budget
+
+        Files that do not have to be extracted are imported first. Extracted
+        files are deleted once they were loaded into every target with all of
+        their rows, only their entries in the manifest of the destination
+        directory are kept. Files that fail verification are kept and count
+        against the budget.
+
+        :param data_dirs: source directories or files
+        :return: tuple of the dump files and the dict of table groups to dump files
+        """
+        sources = self.discover(data_dirs)
+        archives = [(z, z.with_name(z.stem)) for z in sorted(sources.zip_files)]
+        if not self.args.all:
+            archives = [(z, dest) for z, dest in archives if not dest.exists()]
+        if len(sources.dump_files) > 0:
+            await self.import_data(self.table_files(sources.dump_files))
+
+        sized = list()
+        for src, dest in archives:
+            try:
+                sized.append((src, dest, staging.extracted_size(src)))
+            except extract.errors as e:
+                logger.error(f'Task "Unzip" of {src} errored: {e}')
+        kept = 0
+        while sized:
+            batch = staging.next_batch(sized, self.args.staging_budget, kept)
+            sized = sized[len(batch) :]
+            kept += await self.stage_batch(sources, batch)
+
+        await self.finish_import(sources.tables())
+        return sources.dump_files, sources.tables()
+
+    async def stage_batch(self, sources, batch):
+        """Extract, import and verify a batch of archives
+
+        :param sources: discovered sources
+        :param batch: list of (archive, destination, extracted size)
+        :return: bytes of the extracted files that were kept
+        """
+        [dest.mkdir(exist_ok=True) for _, dest, _ in batch]
+        await self.unzip([(src, dest) for src, dest, _ in batch])
+        sources.scan([dest for _, dest, _ in batch])
+        extracted = dict()
+        for src, dest, _ in batch:
+            try:
+                extracted.update(
+                    {p: (dest, i) for p, i in staging.members(src, dest).items()}
+                )
+            except extract.errors as e:
+                logger.error(f"Failed to list the members of {src}: {e}")
+        files = [p for p in extracted if sources.is_dump(p) and p.exists()]
+        await self.import_data(self.table_files(files))
+        for path in files:
+            rows = await self.verify_loaded(path)
+            if rows is not None:
+                dest, info = extracted[path]
+                staging.record(dest, path, info, rows)
+                self.staged[str(path)] = rows
+        return sum(p.stat().st_size for p in extracted if p.exists())
+
+    def table_files(self, files):
+        files = set(files)
+        tables = {
+            table: [f for f in dump_files if f in files]
+            for table, dump_files in self.discovery.table_dump_files.items()
+        }
+        return {table: dump_files for table, dump_files in tables.items() if dump_files}
+
+    async def verify_loaded(self, path):
+        """Whether every target holds all rows of a dump file that were not rejected
+
+        :param path: path of the dump file
+        :return: number of rows of the file if verified, otherwise None
+        """
+        is_json = path.suffix in ndjson.extensions
+        try:
+            rows = await workers.count_rows(path, precise=not is_json)
+        except OSError as e:
+            logger.error(f"Failed to count the rows of {path}: {e}")
+            return None
+        if not is_json:
+            # Without the header
+            rows = max(0, rows - 1)
+        done = self.load_done.get(str(path), dict())
+        rejected = done.get("rejected", 0) + done.get("filtered", 0)
+        for db_options in self.targets:
+            stdout, stderr = await exec.exec_sql(
+                db_options,
+                command=f"SELECT count(*) FROM import.{path.stem}",
+                sync=True,
+            )
+            try:
+                count = json.loads(stdout or "null")[0]["count"]
+            except (json.decoder.JSONDecodeError, TypeError, KeyError, IndexError):
+                logger.debug(stderr)
+                count = None
+            if count != rows - rejected:
+                logger.warning(
+                    f"Keeping {path}, {utils.describe_target(db_options)} holds "
+                    f"{count} of its {rows - rejected} rows"
+                )
+                return None
+        return rows
+
+    def loaded_tables(self, table_csv_files, imported=True):
+        """Tables (re)created from the dump files of a run
+
+        :param table_csv_files: dict of table groups to their dump files
+        :param imported: whether the dump files were imported
+        :return: list of table names in the import schema
+        """
+        tables, staged = list(), self.discovery.staged if self.discovery else dict()
+        for table, csv_files in table_csv_files.items():
+            if imported:
+                tables += [f.stem for f in csv_files if str(f) not in staged]
+            if self.args.combine_tables and csv_files:
+                tables.append(table)
+        return tables
+
+    async def record_loads(self, tables):
+        """Bump the load versions of tables, so hooks reading them run again
+
+        :param tables: names of the tables in the import schema
+        :return:
+        """
+        if len(tables) < 1:
+            return
+        statements = fingerprints.record_loads(tables)
+        results = await asyncio.gather(
+            *[exec.execute(db_options, statements) for db_options in self.targets],
+            return_exceptions=True,
+        )
+        for db_options, result in zip(self.targets, results):
+            if isinstance(result, Exception) or result[0].returncode != 0:
+                logger.error(
+                    f"Failed to record the loads of {len(tables)} tables in "
+                    f"{utils.describe_target(db_options)}: "
+                    + (
+                        str(result)
+                        if isinstance(result, Exception)
+                        else (result[2] or b"").decode()
+                    )
+                )
+
+    async def run_hook(self, script, inputs=None, name=None, lock=None, **kwargs):
+        """Execute a hook script unless neither it nor its input tables changed
+
+        Every successful execution is recorded with a fingerprint of the script
+        and the load versions of its input tables. Without explicit inputs,
+        the tables of the import schema the script refers to are used, or all
+        loaded tables if it refers to none.
+
+        :param script: path of the sql script
+        :param inputs: optional names of the input tables
+        :param name: name recording the script, defaults to its path
+        :param lock: optional table whose advisory lock is held while the script runs
+        :return:
+        """
+        try:
+            text = Path(script).read_text(encoding="utf-8")
+        except (OSError, UnicodeDecodeError) as e:
+            logger.debug(f"Cannot fingerprint {script}: {e}")
+            text = None
+        if text is not None and inputs is None:
+            inputs = fingerprints.input_tables(text) or None
+        await asyncio.gather(
+            *[
+                asyncio.create_task(
+                    self.locked(
+                        db_options,
+                        lock,
+                        self.run_hook_target,
+                        db_options,
+                        script,
+                        text,
+                        inputs,
+                        name or str(script),
+                        **kwargs,
+                    )
+                )
+                for db_options in self.targets
+            ]
+        )
+
+    async def run_hook_target(self, db_options, script, text, inputs, name, **kwargs):
+        versions = None
+        if text is not None and not self.args.force_hooks:
+            last, versions = await fingerprints.state(db_options, name, inputs)
+            if fingerprints.fingerprint(text, versions) == last:
+                logger.info(f"Skipping {script}, neither it nor its inputs changed")
+                return
+
+        async def completion(process, cmd, stderr=None, stdout=None):
+            await self.sql_completed(process, cmd, stderr=stderr, stdout=stdout)
+            if text is None or process.returncode != 0:
+                return
+            current = versions
+            if current is None:
+                _, current = await fingerprints.state(db_options, name, inputs)
+            fingerprint = fingerprints.fingerprint(text, current)
+            await exec.exec_sql(
+                db_options,
+                command=";".join(fingerprints.record(name, fingerprint)),
+                wrap_json=False,
+            )
+
+        await exec.exec_sql(db_options, completion=completion, script=script, **kwargs)
+
+    async def locked(self, db_options, table, action, *args, **kwargs):
+        """Run an action holding the advisory lock of a table in distributed loads
+
+        Keeps a node that took over an expired job from working on a table
+        while the first node still does, across all the sessions of the action.
+
+        :param db_options: connection options of the target database
+        :param table: name of the table, None does not lock
+        :param action: coroutine function to run
+        :return: result of the action, None if the lock cannot be taken
+        """
+        key = jobs.lock_key(table) if self.args.distributed and table else None
+        try:
+            async with exec.AdvisoryLock(db_options, key):
+                return await action(*args, **kwargs)
+        except OSError as e:
+            logger.error(
+                f"Failed on {table} in {utils.describe_target(db_options)}: {e}"
+            )
 
     async def combine_tables(self, table_csv_files):
 
@@ -225,35 +654,362 @@ class Loader:
                 )
                 continue
             logger.info(f"Combining tables {file_tables} into {table}")
-            table_schema_drop = f"DROP TABLE IF EXISTS import.{table} CASCADE;"
-            table_schema_copy = f"CREATE TABLE import.{table} (LIKE import.{file_tables[0]} INCLUDING ALL);"
+            keys = merge.keys_for(table, self.args.merge_keys)
+            if keys:
+                combine_tasks += [
+                    asyncio.create_task(
+                        self.locked(
+                            db_options,
+                            table,
+                            self.combine_merged,
+                            table,
+                            file_tables,
+                            keys,
+                            db_options,
+                        )
+                    )
+                    for db_options in self.targets
+                ]
+                continue
+            if self.args.dedup or self.args.dedup_keys:
+                combine_tasks += [
+                    asyncio.create_task(
+                        self.locked(
+                            db_options,
+                            table,
+                            self.combine_deduplicated,
+                            table,
+                            file_tables,
+                            db_options,
+                        )
+                    )
+                    for db_options in self.targets
+                ]
+                continue
             subquery = str(" UNION ALL ").join(
                 [f"SELECT * FROM import.{t}" for t in file_tables]
             )  # WHERE NOT ((strip(ID) = '') IS NOT FALSE)
-            command = (
-                f"INSERT INTO import.{table} SELECT * FROM ({subquery}) AS combined"
+            statements = [
+                jobs.lock_statement(table),
+                f"DROP TABLE IF EXISTS import.{table} CASCADE",
+                f"CREATE TABLE import.{table} (LIKE import.{file_tables[0]} INCLUDING ALL)",
+                f"INSERT INTO import.{table} SELECT * FROM ({subquery}) AS combined",
+            ]
+            logger.debug(statements)
+            combine_tasks += [
+                asyncio.create_task(self.combine_rebuilt(table, statements, db_options))
+                for db_options in self.targets
+            ]  # Might throw column "id" does not exist
+        await asyncio.gather(*combine_tasks)
+
+    async def combine_rebuilt(self, table, statements, db_options):
+        """Rebuild a combined table in a single transaction holding its advisory lock
+
+        :param table: name of the combined table
+        :param statements: statements locking, dropping and filling the table
+        :param db_options: connection options of the target database
+        :return:
+        """
+        process, _, stderr = await exec.execute(db_options, statements)
+        self.log_process_result(
+            task="Combine",
+            cmd=table
+            if len(self.targets) < 2
+            else f"{table} in {utils.describe_target(db_options)}",
+            process=process,
+            stderr=stderr,
+        )
+
+    async def table_columns(self, db_options, table, types=False):
+        """Columns of a table in the import schema
+
+        :param db_options: connection options of the target database
+        :param table: name of the table
+        :param types: whether to return tuples of column names and data types
+        :return: list of column names (or tuples) in order
+        """
+        stdout, stderr = await exec.exec_sql(
+            db_options,
+            command=(
+                "SELECT column_name, data_type FROM information_schema.columns "
+                f"WHERE table_schema = 'import' AND table_name = {utils.sql_literal(table)} "
+                "ORDER BY ordinal_position"
+            ),
+            sync=True,
+        )
+        try:
+            rows = json.loads(stdout or "null") or []
+            if types:
+                return [(row["column_name"], row["data_type"]) for row in rows]
+            return [row["column_name"] for row in rows]
+        except (json.decoder.JSONDecodeError, TypeError, KeyError):
+            logger.error(stderr)
+            return []
+
+    async def convert_tables(self, table_csv_files):
+        """Create typed copies of tables whose sampled text columns hold timestamps
+
+        :param table_csv_files: dict of table groups to their csv files
+        :return:
+        """
+        tables = set()
+        for table, csv_files in table_csv_files.items():
+            if self.args.combine_tables:
+                tables.add(table)
+            tables.update(f.stem for f in csv_files)
+        converted = await asyncio.gather(
+            *[
+                asyncio.create_task(self.convert_table(db_options, table))
+                for table in sorted(tables)
+                for db_options in self.targets
+            ]
+        )
+        await self.record_loads(
+            sorted({f"{table}_typed" for table in converted if table})
+        )
+
+    async def convert_table(self, db_options, table):
+        """Detect the format of selected text columns once and convert them set based
+
+        :param db_options: connection options of the target database
+        :param table: name of the table in the import schema
+        :return: the table if a typed copy was created
+        """
+        columns = await self.table_columns(db_options, table, types=True)
+        candidates = conversions.selected_columns(
+            self.args.convert_columns,
+            table,
+            [c for c, t in columns if t in ("text", "character varying")],
+        )
+        if len(candidates) < 1:
+            return
+        stdout, stderr = await exec.exec_sql(
+            db_options,
+            command=(
+                "SELECT "
+                + ", ".join(f'"{c}"' for c in candidates)
+                + f" FROM import.{table} LIMIT {int(self.args.convert_sample_rows)}"
+            ),
+            sync=True,
+        )
+        try:
+            sample = json.loads(stdout or "null") or []
+        except (json.decoder.JSONDecodeError, TypeError):
+            logger.error(f"Failed to sample import.{table}: {stderr}")
+            return
+        detected = dict()
+        for column in candidates:
+            detected_format = conversions.detect([row.get(column) for row in sample])
+            if detected_format is not None:
+                detected[column] = detected_format
+                logger.info(
+                    f"Converting import.{table}.{column} as {detected_format.name}"
+                )
+        if len(detected) < 1:
+            logger.info(f"No timestamp or date columns detected in import.{table}")
+            return
+        await exec.exec_sql(
+            db_options,
+            command=";".join(
+                conversions.convert_statements(table, [c for c, _ in columns], detected)
+            ),
+            wrap_json=False,
+            completion=self.sql_completed,
+        )
+        return table
+
+    async def combine_merged(self, table, file_tables, keys, db_options):
+        """Merge tables into a persistent combined table on its key columns
+
+        The rows of the tables are collected in an unlogged staging table and
+        upserted into the combined table one key range at a time, each in its
+        own transaction. Unchanged rows are not written, and the combined table
+        and the views depending on it are never dropped.
+
+        :param table: name of the combined table
+        :param file_tables: names of the tables to combine
+        :param keys: key columns
+        :param db_options: connection options of the target database
+        :return:
+        """
+        columns = await self.table_columns(db_options, file_tables[0])
+        missing = [key for key in keys if key not in columns]
+        if len(columns) < 1 or missing:
+            logger.error(
+                f"Cannot merge into {table}, missing key columns {missing}"
+                if missing
+                else f"Cannot merge into {table}, failed to read its columns"
             )
-            query = table_schema_drop + table_schema_copy + command
-            logger.debug(query)
-            combine_tasks.append(
-                asyncio.create_task(
-                    exec.exec_sql(
-                        self.sql_db_options,
-                        command=query,
-                        wrap_json=False,
-                        completion=self.sql_completed,
+            return
+        process, _, stderr = await exec.execute(
+            db_options,
+            merge.stage_statements(table, file_tables, columns, keys)
+            + merge.target_statements(table, file_tables[0], keys),
+        )
+        if process.returncode != 0:
+            logger.error(f"Failed to stage rows of {table}: {stderr.decode()}")
+            return
+        stdout, stderr = await exec.exec_sql(
+            db_options,
+            command=merge.bounds_query(table, keys[0], self.args.merge_batch_rows),
+            sync=True,
+        )
+        try:
+            bounds = [row["bound"] for row in json.loads(stdout or "null") or []]
+        except (json.decoder.JSONDecodeError, TypeError, KeyError):
+            logger.error(stderr)
+            bounds = []
+
+        written, lower = 0, None
+        for upper in bounds or [None]:
+            process, stdout, stderr = await exec.execute(
+                db_options,
+                [merge.upsert_statement(table, columns, keys, lower, upper)],
+            )
+            if process.returncode != 0:
+                # Merged ranges stay committed, merging again finishes the rest
+                logger.error(f"Failed to merge rows into {table}: {stderr.decode()}")
+                break
+            written += merge.written_rows(stdout)
+            lower = upper
+        await exec.execute(db_options, [f"DROP TABLE IF EXISTS import._merge_{table}"])
+        logger.info(f"Merged {table} in {len(bounds)} batches, {written} rows written")
+
+    async def combine_deduplicated(self, table, file_tables, db_options):
+        """Combine tables while dropping duplicate rows on the way
+
+        The union of the tables is streamed out of the database once. Rows are
+        assigned to a partition by the hash of their key (or of the whole row),
+        every partition drops the keys it has seen before using a set that
+        spills to disk and writes its unique rows with its own COPY.
+
+        :param table: name of the combined table
+        :param file_tables: names of the tables to combine
+        :param db_options: connection options of the target database
+        :return:
+        """
+        columns = await self.table_columns(db_options, file_tables[0])
+        missing = [key for key in self.args.dedup_keys or [] if key not in columns]
+        if len(columns) < 1 or missing:
+            logger.error(
+                f"Cannot deduplicate {table}, missing key columns {missing}"
+                if missing
+                else f"Cannot deduplicate {table}, failed to read its columns"
+            )
+            return
+        await exec.exec_sql(
+            db_options,
+            command=(
+                f"DROP TABLE IF EXISTS import.{table} CASCADE;"
+                f"CREATE TABLE import.{table} (LIKE import.{file_tables[0]} INCLUDING ALL);"
+            ),
+            wrap_json=False,
+            completion=self.sql_completed,
+        )
+
+        deduplicator = dedup.Deduplicator(
+            partitions=self.args.dedup_partitions,
+            key_indexes=[columns.index(k) for k in self.args.dedup_keys]
+            if self.args.dedup_keys
+            else None,
+            directory=self.args.dedup_dir,
+            memory_items=self.args.dedup_memory_rows,
+            bloom_capacity=self.args.dedup_bloom,
+        )
+        queues = [asyncio.Queue(maxsize=2) for _ in range(deduplicator.partitions)]
+
+        async def rows(queue):
+            while True:
+                data = await queue.get()
+                if data is None:
+                    return
+                yield data
+
+        writers = [
+            asyncio.ensure_future(
+                exec.copy_from(db_options, f"import.{table}", rows(q))
+            )
+            for q in queues
+        ]
+
+        async def put(queue, writer, data):
+            # A writer whose psql exited stops reading, do not wait for it
+            item = asyncio.ensure_future(queue.put(data))
+            await asyncio.wait({item, writer}, return_when=asyncio.FIRST_COMPLETED)
+            item.cancel()
+
+        # Blocks are hashed by the worker processes in parallel, their digests
+        # are checked against the sets of the partitions in the order they
+        # were read, so the first of duplicate rows is kept
+        pending = collections.deque()
+
+        async def keep():
+            unique = await asyncio.get_event_loop().run_in_executor(
+                None, deduplicator.keep, await pending.popleft()
+            )
+            for queue, writer, data in zip(queues, writers, unique):
+                if data:
+                    await put(queue, writer, data)
+
+        async def output(block):
+            pending.append(
+                asyncio.ensure_future(
+                    workers.run(
+                        dedup.split_block,
+                        block,
+                        deduplicator.partitions,
+                        deduplicator.key_indexes,
                     )
                 )
-            )  # Might throw column "id" does not exist
-        await asyncio.gather(*combine_tasks)
+            )
+            if len(pending) > workers.processes:
+                await keep()
 
-    async def post_load_check(self, table_csv_files, csv_entries):
-        logger.info("Running post load check")
+        union = " UNION ALL ".join(f"SELECT * FROM import.{t}" for t in file_tables)
+        try:
+            process, stderr = await exec.copy_to(db_options, union, output)
+            while pending:
+                await keep()
+        finally:
+            [future.cancel() for future in pending]
+            [await put(queue, writer, None) for queue, writer in zip(queues, writers)]
+            results = await asyncio.gather(*writers, return_exceptions=True)
+            deduplicator.close()
+        failed = [r for r in results if isinstance(r, Exception) or r[0].returncode]
+        if process.returncode != 0 or failed:
+            logger.error(
+                f"Failed to combine {file_tables} into {table}: "
+                + (stderr or b"").decode()
+                + "".join(
+                    str(r) if isinstance(r, Exception) else r[2].decode()
+                    for r in failed
+                )
+            )
+            return
+        logger.info(
+            f"Combined {deduplicator.rows} rows into {table}, "
+            f"dropped {deduplicator.duplicates} duplicates"
+        )
+
+    async def post_load_check(self, table_csv_files, csv_entries, schema="public"):
+        for db_options in self.targets:
+            await self.post_load_check_target(
+                table_csv_files, csv_entries, db_options, schema
+            )
+
+    async def post_load_check_target(
+        self, table_csv_files, csv_entries, db_options, schema="public"
+    ):
+        target = utils.describe_target(db_options)
+        logger.info(
+            "Running post load check"
+            + (f" for {target}" if len(self.targets) > 1 else "")
+        )
         try:
             database_rows = {
                 table: await exec.exec_sql(
-                    self.sql_db_options,
-                    command=f"SELECT count(*) FROM public.{table}",
+                    db_options,
+                    command=f"SELECT count(*) FROM {schema}.{table}",
                     sync=True,
                     completion=self.sql_completed,
                 )
@@ -265,6 +1021,8 @@ class Loader:
                 "csv files",
                 "total rows (csv files)",
                 "total rows (database)",
+                "rejected rows",
+                "filtered rows",
                 "difference",
             ]
             check_result = PrettyTable(table_header)
@@ -284,7 +1042,16 @@ class Loader:
                 csv_file_entries = sum(
                     [csv_entries.get(str(csv_file), 0) for csv_file in csv_files]
                 )
-                difference = abs(csv_file_entries - database_count)
+                rejected, filtered = [
+                    sum(
+                        self.load_done.get(str(csv_file), dict()).get(count, 0)
+                        for csv_file in csv_files
+                    )
+                    for count in ("rejected", "filtered")
+                ]
+                difference = abs(
+                    csv_file_entries - database_count - rejected - filtered
+                )
                 delta += difference
                 check_result.add_row(
                     [
@@ -294,10 +1061,25 @@ class Loader:
                         else [Path(f).stem for f in csv_files],
                         csv_file_entries,
                         database_count,
+                        rejected,
+                        filtered,
                         difference,
                     ]
                 )
+            failed_files = [
+                src
+                for src, load in self.load_done.items()
+                if any(
+                    status["failed"] and status["name"] == target
+                    for status in load.get("targets", [])
+                )
+            ]
             logger.info("\n" + str(check_result))
+            if len(failed_files) > 0:
+                logger.error(
+                    f"{len(failed_files)} files failed to load into {target}: "
+                    + ", ".join(failed_files)
+                )
             if delta > 100:
                 logger.fatal(f"{delta} entries were not loaded into the database!")
 
@@ -305,73 +1087,419 @@ class Loader:
             logger.error(e)
             logger.error("Failed to get database entries from database")
 
+    async def run_scripts(self, sources, routine):
+        for source in sources:
+            scripts = list(utils.files_in(source, of_type="sql"))
+            [
+                logger.info(f"Executing {routine} routine: {script}")
+                for script in scripts
+            ]
+            await asyncio.gather(
+                *[asyncio.create_task(self.run_hook(script)) for script in scripts]
+            )
+
+    async def run_table_hooks(self, table_csv_files):
+        """Render the hook templates for every table group and run them concurrently
+
+        Templates are rendered with the table name, its source files, the
+        columns of its first file and their types. Scripts of different tables
+        run at the same time, at most --hook-concurrency at once.
+
+        :param table_csv_files: dict of table groups to their dump files
+        :return:
+        """
+        hooks = templates.find(self.args.table_hooks)
+        if len(hooks) < 1:
+            return
+        limit = asyncio.Semaphore(self.args.hook_concurrency or os.cpu_count() or 1)
+        with tempfile.TemporaryDirectory(prefix="postgresimporter-hooks-") as rendered:
+            tasks = list()
+            for table, dump_files in sorted(table_csv_files.items()):
+                variables = await self.table_hook_variables(table, dump_files)
+                if variables is None:
+                    continue
+                for number, template in enumerate(hooks):
+                    try:
+                        text = templates.render(template, variables)
+                    except (OSError, jinja2.TemplateError) as e:
+                        logger.error(f"Failed to render {template} for {table}: {e}")
+                        continue
+                    if not text.strip():
+                        logger.debug(f"Skipping {template}, it is empty for {table}")
+                        continue
+                    script = Path(rendered) / f"{table}.{number}.sql"
+                    script.write_text(text, encoding="utf-8")
+                    tasks.append(
+                        self.run_table_hook(
+                            script, templates.hook_name(template, table), table, limit
+                        )
+                    )
+            await asyncio.gather(*tasks)
+
+    async def run_table_hook(self, script, name, table, limit):
+        async with limit:
+            logger.info(f"Executing table hook: {name}")
+            await self.run_hook(script, name=name, lock=table)
+
+    async def table_hook_variables(self, table, dump_files):
+        """Template variables of a table group, from the first readable file
+
+        Files deleted after staging cannot be read, so their columns are taken
+        from the import table of the first file instead.
+
+        :param table: name of the table group
+        :param dump_files: dump files of the table group
+        :return: dict of variables or None if the columns are unknown
+        """
+        combined = bool(self.args.combine_tables)
+        for dump_file in dump_files:
+            try:
+                target = await self.chunked_target(Path(dump_file))
+            except (OSError, ValueError, csv.Error) as e:
+                logger.debug(f"Cannot read the columns of {dump_file}: {e}")
+                continue
+            return templates.hook_variables(
+                table, dump_files, target["columns"], target["types"], combined
+            )
+        if len(dump_files) > 0 and len(self.targets) > 0:
+            columns = await self.table_columns(
+                self.targets[0], Path(dump_files[0]).stem, types=True
+            )
+            if len(columns) > 0:
+                return templates.hook_variables(
+                    table, dump_files, [c for c, _ in columns], dict(columns), combined
+                )
+        logger.warning(f"Skipping the table hooks of {table}, its columns are unknown")
+        return None
+
+    async def post_load_hooks(self, table_csv_files):
+        await self.run_scripts(self.args.post_load, "post load")
+        await self.run_table_hooks(table_csv_files)
+
+    async def step3_post_load(self, dump_files, table_csv_files, incremental=False):
+        if self.args.convert_columns:
+            await self.convert_tables(table_csv_files)
+
+        # Run post load scripts and table hooks while counting csv file rows
+        logger.info("Counting csv file rows")
+        staged = self.staged_rows
+        csv_entries_task = asyncio.create_task(
+            csvcount.count_csv_entries([f for f in dump_files if str(f) not in staged])
+        )
+        await asyncio.gather(self.post_load_hooks(table_csv_files), csv_entries_task)
+        csv_entries = dict(csv_entries_task.result() or dict())
+        # Deleted files were counted before they were verified, without header
+        csv_entries.update(
+            {
+                src: rows + (0 if Path(src).suffix in ndjson.extensions else 1)
+                for src, rows in staged.items()
+            }
+        )
+
+        # Post load check
+        if self.args.disable_check:
+            return
+        if incremental:
+            # The tables of the groups also hold the rows of earlier files
+            await self.post_load_check(
+                {f.stem: [f] for f in dump_files}, csv_entries, schema="import"
+            )
+        else:
+            await self.post_load_check(table_csv_files, csv_entries)
+
     async def load(self, data_dirs):
         try:
             self.reset()
 
+            unzipped = False
+            if self.args.preflight:
+                # Archives are extracted first so their files are checked as well
+                if not self.staging:
+                    await self.step1_unzip(data_dirs)
+                    unzipped = True
+                if not await self.step0_preflight(data_dirs):
+                    logger.fatal("Preflight checks failed, nothing was loaded")
+                    return
+
             # Step 0: Run Pre load script
-            for pre_load_source in self.args.pre_load:
-                pre_load_scripts = utils.files_in(pre_load_source, of_type="sql")
-                [
-                    logger.info(f"Executing pre load routine: {pre_load_script}")
-                    for pre_load_script in pre_load_scripts
-                ]
-                pre_load_tasks = [
-                    asyncio.create_task(
-                        exec.exec_sql(
-                            self.sql_db_options,
-                            script=pre_load_script,
-                            completion=self.sql_completed,
-                        )
-                    )
-                    for pre_load_script in pre_load_scripts
-                ]
-                await asyncio.gather(*pre_load_tasks)
+            await self.run_scripts(self.args.pre_load, "pre load")
+
+            if self.staging:
+                # Steps 1 and 2: Extract and import archives that fit the budget
+                dump_files, table_csv_files = await self.step12_staged(data_dirs)
+            elif self.overlapped and not unzipped:
+                # Steps 1 and 2: Load files while the sources are walked
+                dump_files, table_csv_files = await self.step12_overlapped(data_dirs)
+            else:
+                # Step 1: Extract zipped files
+                if not unzipped:
+                    await self.step1_unzip(data_dirs)
+
+                if self.args.distributed:
+                    # Steps 2 and 3: Load files claimed together with other nodes
+                    await self.load_distributed(data_dirs)
+                    return
 
-            # Step 1: Extract zipped files
-            await self.step1_unzip(data_dirs)
+                # Step 2: Import csv files into database
+                dump_files, table_csv_files = await self.step2_import(data_dirs)
+
+            # Step 3: Run post load script, count csv file rows and check
+            await self.step3_post_load(dump_files, table_csv_files)
 
-            # Step 2: Import csv files into database
-            dump_files, table_csv_files = await self.step2_import(data_dirs)
+            logger.info("Completed.")
 
-            # Step 3: Run post load script
-            post_load_tasks = list()
-            for post_load_source in self.args.post_load:
-                post_load_scripts = list(
-                    utils.files_in(post_load_source, of_type="sql")
+        except asyncio.CancelledError:
+            pass
+
+    async def load_distributed(self, data_dirs):
+        """Load the sources together with other nodes coordinated by import._jobs
+
+        Every node registers the files it discovered as jobs in the first
+        target database and claims them one at a time. A node holding jobs
+        renews their lease, so jobs of crashed nodes are taken over once their
+        lease ran out. Once all files were loaded, the nodes claim the tables
+        to combine, so different tables are combined in parallel. The node
+        claiming the finishing job after that runs the hooks and checks.
+
+        :param data_dirs: source directories or files
+        :return:
+        """
+        sources = self.discover(data_dirs)
+        dump_files, table_csv_files = sources.dump_files, sources.table_dump_files
+        files = {str(f): (jobs.file_version(f), f.stat().st_size) for f in dump_files}
+        coordinator, node = self.targets[0], self.args.node_name or jobs.default_node()
+        version = jobs.finish_version({path: v for path, (v, _) in files.items()})
+        tables = dict()
+        if self.args.combine_tables:
+            for table, table_files in sources.tables().items():
+                versions = {
+                    str(f): files.get(str(f), ("staged", 0)) for f in table_files
+                }
+                tables[table] = (
+                    jobs.finish_version({f: v for f, (v, _) in versions.items()}),
+                    sum(size for _, size in versions.values()),
                 )
-                [
-                    logger.info(f"Executing post load routine: {post_load_script}")
-                    for post_load_script in post_load_scripts
-                ]
-                post_load_tasks = [
-                    asyncio.create_task(
-                        exec.exec_sql(
-                            self.sql_db_options,
-                            script=post_load_script,
-                            completion=self.sql_completed,
-                        )
-                    )
-                    for post_load_script in post_load_scripts
-                ]
+        process, _, stderr = await exec.execute(
+            coordinator, jobs.register_statements(files, version, tables)
+        )
+        if process.returncode != 0:
+            logger.fatal(f"Failed to register jobs: {stderr.decode()}")
+            return
 
-            # Step 4: Count csv file rows
-            logger.info("Counting csv file rows")
-            csv_entries_task = asyncio.create_task(
-                csvcount.count_csv_entries(dump_files)
+        logger.info(f"Loading {len(files)} files as node {node}")
+        heartbeat = asyncio.ensure_future(self.heartbeat(coordinator, node))
+        try:
+            await asyncio.gather(
+                *[
+                    self.claim_files(coordinator, node, table_csv_files)
+                    for _ in range(max(1, self.args.node_slots))
+                ]
             )
-            post_load_tasks.append(csv_entries_task)
-            await asyncio.gather(*post_load_tasks)
-            csv_entries = csv_entries_task.result()
+            if tables:
+                await asyncio.gather(
+                    *[
+                        self.claim_combines(coordinator, node, sources.tables())
+                        for _ in range(max(1, self.args.node_slots))
+                    ]
+                )
+            if not await self.claim_finish(coordinator, node):
+                logger.info("Completed, another node finished the load")
+                return
+            await self.finish_import(sources.tables(), combine=False)
+            await self.step3_post_load(dump_files, sources.tables())
+            await self.end_job(coordinator, node, jobs.finish_job, "done")
+            logger.info("Completed.")
+        finally:
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+
+    async def claim_files(self, coordinator, node, table_csv_files):
+        """Load files claimed from import._jobs until no file is left
+
+        :param coordinator: connection options of the database holding the jobs
+        :param node: name of this node
+        :param table_csv_files: dict of table groups to their files
+        :return:
+        """
+        tables = {str(f): t for t, files in table_csv_files.items() for f in files}
+        while not Loader.draining:
+            job = await jobs.claim(coordinator, node, "file", self.args.lease)
+            if job is None:
+                if await jobs.open_jobs(coordinator, "file") == 0:
+                    return
+                # Wait for the other nodes, or for their leases to run out. A
+                # failed query (None) is retried rather than taken as no jobs
+                await asyncio.sleep(self.args.lease / 4)
+                continue
+            if job not in tables:
+                logger.error(f"{job} was not discovered by node {node}")
+                await self.end_job(coordinator, node, job, "failed")
+                continue
+            self.load_done.pop(job, None)
+            await self.import_data({tables[job]: [Path(job)]}, parallel=False)
+            state = "done"
+            if Loader.draining:
+                state = "pending"
+            elif self.load_failed(job):
+                state = "failed"
+            await self.end_job(coordinator, node, job, state)
+
+    async def claim_combines(self, coordinator, node, table_csv_files):
+        """Combine tables claimed from import._jobs until no table is left
+
+        :param coordinator: connection options of the database holding the jobs
+        :param node: name of this node
+        :param table_csv_files: dict of table groups to their files
+        :return:
+        """
+        while not Loader.draining:
+            job = await jobs.claim(coordinator, node, "combine", self.args.lease)
+            if job is None:
+                if await jobs.open_jobs(coordinator, "combine") == 0:
+                    return
+                # Wait for the files of the other nodes to be loaded, or retry
+                # after a failed query (None)
+                await asyncio.sleep(self.args.lease / 4)
+                continue
+            table = jobs.combined_table(job)
+            if table not in table_csv_files:
+                logger.error(f"{table} was not discovered by node {node}")
+                await self.end_job(coordinator, node, job, "failed")
+                continue
+            await self.combine_tables({table: table_csv_files[table]})
+            await self.end_job(coordinator, node, job, "done")
+
+    async def claim_finish(self, coordinator, node):
+        """Wait until this node claims the finishing job or another node ended it
+
+        :param coordinator: connection options of the database holding the jobs
+        :param node: name of this node
+        :return: whether this node finishes the load
+        """
+        while not Loader.draining:
+            if await jobs.claim(coordinator, node, "finish", self.args.lease):
+                return True
+            if await jobs.open_jobs(coordinator, "finish") == 0:
+                return False
+            await asyncio.sleep(self.args.lease / 4)
+        return False
+
+    async def end_job(self, coordinator, node, job, state):
+        await exec.exec_sql(
+            coordinator,
+            command=jobs.finish_statement(node, job, state),
+            sync=True,
+            wrap_json=False,
+        )
 
-            # Step 5: Post load check
-            if not self.args.disable_check:
-                await self.post_load_check(table_csv_files, csv_entries)
+    async def heartbeat(self, coordinator, node):
+        """Renew the leases of the jobs held by this node"""
+        while True:
+            await asyncio.sleep(self.args.lease / 3)
+            await exec.exec_sql(
+                coordinator,
+                command=jobs.heartbeat_statement(node, self.args.lease),
+                sync=True,
+                wrap_json=False,
+            )
 
-            logger.info("Completed.")
+    def load_failed(self, src):
+        """Whether loading a file failed on any target"""
+        progress = self.load_done.get(src, dict())
+        return progress.get("returncode", 0) != 0 or any(
+            status["failed"] for status in progress.get("targets", [])
+        )
 
+    async def watch(self, data_dirs):
+        """Load all sources and keep loading new or changed files as they complete
+
+        :param data_dirs: source directories or files
+        :return:
+        """
+        # Watching starts before the initial load, so files that appear or
+        # change while it runs are picked up afterwards
+        watcher = watch.Watcher(
+            data_dirs,
+            settle_time=self.args.watch_settle_time,
+            polling=self.args.watch_polling,
+        )
+        try:
+            await self.load(data_dirs)
+            # Files are handled with the signatures they had when the load
+            # found them, so the ones that changed since are loaded again
+            if self.discovery is not None:
+                watcher.mark_signatures(
+                    {
+                        path: signature
+                        for path, signature in self.discovery.signatures.items()
+                        if not self.load_failed(str(path))
+                    }
+                )
+            logger.info(f"Watching {len(data_dirs)} sources for new files")
+            while True:
+                await asyncio.sleep(self.args.watch_interval)
+                # Scanning large trees blocks, keep the event loop responsive
+                complete = await asyncio.get_event_loop().run_in_executor(
+                    None, watcher.poll
+                )
+                if len(complete) > 0:
+                    try:
+                        await self.load_incremental(complete, watcher)
+                    except Exception as e:
+                        logger.exception(
+                            f"Failed to load {len(complete)} new or changed files, "
+                            f"watching for further changes: {e}"
+                        )
         except asyncio.CancelledError:
             pass
+        finally:
+            watcher.close()
+
+    async def load_incremental(self, files, watcher=None):
+        """Unzip, import, combine and hook a set of new or changed files
+
+        :param files: complete zip archives and dump files
+        :param watcher: watcher that should ignore files extracted here
+        :return:
+        """
+        self.zip_total = self.zip_done = self.load_total = 0
+        self.load_done = dict()
+        sources = self.discovery
+        [sources.add(f) for f in files]
+        dump_files = [f for f in files if sources.is_dump(f)]
+
+        zip_files = [f for f in files if f.suffix in discovery.zip_extensions]
+        if len(zip_files) > 0 and not self.args.disable_unzip:
+            unzipped_files = [(z, z.with_name(z.stem)) for z in zip_files]
+            [unzipped.mkdir(exist_ok=True) for _, unzipped in unzipped_files]
+            await self.unzip(sorted(unzipped_files))
+            sources.scan([unzipped for _, unzipped in unzipped_files])
+            extracted = [
+                f.absolute()
+                for _, unzipped in unzipped_files
+                for f in discovery.walk(unzipped)
+                if sources.is_dump(f)
+            ]
+            if watcher:
+                watcher.mark_handled(extracted)
+            dump_files += extracted
+
+        if len(dump_files) < 1:
+            return
+        logger.info(f"Loading {len(dump_files)} new or changed files")
+        table_dump_files = dict()
+        for f in dump_files:
+            table_dump_files.setdefault(utils.table_name_for_path(f), []).append(f)
+        if not self.args.disable_import:
+            await self.import_data(table_dump_files)
+        table_csv_files = {t: sources.tables()[t] for t in table_dump_files}
+        if self.args.combine_tables:
+            await self.combine_tables(table_csv_files)
+        await self.record_loads(
+            self.loaded_tables(table_csv_files, not self.args.disable_import)
+        )
+        await self.step3_post_load(dump_files, table_dump_files, incremental=True)
+        logger.info("Completed incremental load.")
 
     @staticmethod
     def _log_process_result(
@@ -403,16 +1531,11 @@ class Loader:
             other_error_message=f'Task "{task}" of {cmd} errored without writing to stderr',
         )
 
-    async def zip_completed(self, process, cmd, stderr):
-        self.zip_done += 1
-        src = cmd[1]
-        self.log_process_result(task="Unzip", cmd=src, process=process, stderr=stderr)
-
     async def import_completed(self, process, cmd, stderr=None, stdout=None):
         src = cmd[-1]
         if src not in self.load_done.keys():
             self.load_done[src] = dict()
-        self.load_done[src].update(percent=1.0)
+        self.load_done[src].update(percent=1.0, returncode=process.returncode)
         self.log_process_result(task="Import", cmd=src, process=process, stderr=stderr)
 
     async def sql_completed(self, process, cmd, stderr=None, stdout=None):
@@ -472,26 +1595,62 @@ class Loader:
             raise
 
     async def unzip(self, files):
+        """Extract archives in process, with the members of all archives in parallel
+
+        :param files: list of (zip archive, destination directory)
+        :return:
+        """
         self.zip_total = self.load_total = len(files)
         if len(files) < 1:
             logger.info("No files to unzip")
             return
-        [logger.info(f"Unzipping {str(src.absolute())}") for src, dest in files]
-        await exec.run_simultaneously(
-            [
-                ("unzip", ["-o", str(src.absolute()), "-d", str(dest.absolute())])
+        limit = asyncio.Semaphore(self.args.unzip_concurrency or os.cpu_count() or 1)
+        await asyncio.gather(
+            *[
+                asyncio.create_task(self.unzip_archive(src, dest, limit))
                 for src, dest in files
             ]
         )
-        task = asyncio.create_task(
-            self.check_progress(completion_handler=self.zip_completed)
-        )
-        await asyncio.wait({task})
 
-    async def import_data(self, table_csv_files, parallel=True):
+    async def unzip_archive(self, src, dest, limit):
+        logger.info(f"Unzipping {str(src.absolute())}")
+        try:
+            members = await extract.extract_archive(src, dest, limit)
+        except extract.errors as e:
+            logger.error(f'Task "Unzip" of {src} errored: {e}')
+        else:
+            logger.info(
+                f'Task "Unzip" of {src} finished successfully: extracted '
+                f'{members["extracted"]}, skipped {members["skipped"]} unchanged members'
+            )
+        self.zip_done += 1
+        await self.update_progress()
+
+    async def import_data(self, table_dump_files, parallel=True):
         self.load_total = sum(
-            [len(csv_files) for csv_files in table_csv_files.values()]
+            [len(dump_files) for dump_files in table_dump_files.values()]
         )
+        table_csv_files = {
+            table: [f for f in dump_files if f.suffix not in ndjson.extensions]
+            for table, dump_files in table_dump_files.items()
+        }
+        table_json_files = {
+            table: [f for f in dump_files if f.suffix in ndjson.extensions]
+            for table, dump_files in table_dump_files.items()
+        }
+        if self.streaming:
+            dump_files = list(itertools.chain.from_iterable(table_dump_files.values()))
+            await self.import_streaming(exec.iterate(dump_files))
+            return
+
+        json_files = list(itertools.chain.from_iterable(table_json_files.values()))
+        if len(json_files) > 0:
+            await asyncio.gather(
+                *[asyncio.create_task(self.import_json(f)) for f in json_files]
+            )
+            await self.update_progress()
+        if not any(table_csv_files.values()):
+            return
 
         for table, csv_files in table_csv_files.items():
             [
@@ -541,9 +1700,1007 @@ class Loader:
                     )
                     await asyncio.wait({task})
 
+    async def import_streaming(self, dump_files):
+        """Load files in chunks as they arrive
+
+        :param dump_files: async iterable of dump files
+        :return:
+        """
+        controller, watcher = self.start_streams(), self.start_throttle()
+        # Files only start reading with a slot, so the chunks read ahead
+        # are bounded by the streams and not by the number of files
+        slots = asyncio.Semaphore(self.args.max_streams or 2 * (os.cpu_count() or 1))
+        tasks = list()
+        try:
+            async for dump_file in dump_files:
+                tasks.append(
+                    asyncio.ensure_future(self.import_slotted(dump_file, slots))
+                )
+            await asyncio.gather(*tasks)
+        finally:
+            [task.cancel() for task in tasks if not task.done()]
+            await self.stop_streams(controller)
+            await self.stop_throttle(watcher)
+        await self.update_progress()
+
+    async def import_slotted(self, dump_file, slots):
+        async with slots:
+            await self.import_chunked(dump_file)
+
+    def start_streams(self):
+        """Limit the number of concurrent COPY streams, adaptively with --adaptive-streams
+
+        :return: the task running the controller or None
+        """
+        maximum = self.args.max_streams
+        if self.args.adaptive_streams:
+            maximum = maximum or 2 * (os.cpu_count() or 1)
+        if not maximum:
+            return None
+        start = self.args.min_streams if self.args.adaptive_streams else maximum
+        self.streams = concurrency.AdaptiveLimit(min(start, maximum))
+        if not self.args.adaptive_streams:
+            return None
+        self.controller = concurrency.Controller(
+            self.streams,
+            self.targets,
+            minimum=self.args.min_streams,
+            maximum=maximum,
+            interval=self.args.adaptive_interval,
+        )
+        return asyncio.ensure_future(self.controller.run())
+
+    async def stop_streams(self, task):
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        if self.controller is not None and self.controller.decisions:
+            self.concurrency_report(self.controller.decisions)
+        self.streams = self.controller = None
+
+    def start_throttle(self):
+        """Limit the bytes and rows sent per second, globally and per table
+
+        :return: the task watching the --throttle-file or None
+        """
+        self.throttle = throttle.Throttle(
+            self.args.max_bytes_per_second,
+            self.args.max_rows_per_second,
+            self.args.table_rates,
+        )
+        if not self.args.throttle_file:
+            if not self.throttle.active:
+                self.throttle = None
+            return None
+        self.load_throttle()
+        return asyncio.ensure_future(self.watch_throttle())
+
+    def load_throttle(self):
+        try:
+            self.throttle.load(self.args.throttle_file)
+        except (OSError, ValueError, AttributeError) as e:
+            # Keep the current limits until the file is valid again
+            logger.error(f"Invalid throttle file {self.args.throttle_file}: {e}")
+            return
+        logger.info(f"Applied the limits of {self.args.throttle_file}")
+
+    async def watch_throttle(self, interval=1.0):
+        """Apply the --throttle-file whenever it changes or on SIGUSR1"""
+        path = Path(self.args.throttle_file)
+        modified = path.stat().st_mtime if path.exists() else None
+        while True:
+            await asyncio.sleep(interval)
+            current = path.stat().st_mtime if path.exists() else None
+            if current != modified or Loader.reload_throttle:
+                Loader.reload_throttle = False
+                modified = current
+                self.load_throttle()
+
+    async def stop_throttle(self, task):
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        self.throttle = None
+
+    @staticmethod
+    def concurrency_report(decisions):
+        header = ["time", "streams", "limit", "decision", "reason"]
+        report = PrettyTable(header)
+        for column in header:
+            report.align[column] = "l"
+        for decision in decisions:
+            report.add_row(
+                [
+                    time.strftime("%H:%M:%S", time.localtime(decision.at)),
+                    decision.streams,
+                    decision.limit,
+                    decision.action,
+                    decision.reason,
+                ]
+            )
+        logger.info("Concurrency decisions:\n" + str(report))
+
+    async def import_json(self, json_file):
+        """Stream a json lines file into import.{stem} using COPY
+
+        Records are either loaded into a single jsonb column or into text
+        columns derived from the keys of a sample of leading records.
+
+        :param json_file: path of the json lines file
+        :return:
+        """
+        loop = asyncio.get_event_loop()
+        table, src = json_file.stem, str(json_file)
+        try:
+            columns, keys = await self.json_columns(json_file)
+        except (OSError, UnicodeDecodeError, ndjson.MalformedLineError) as e:
+            logger.error(f"Failed to sample {src}: {e}")
+            return
+
+        async def batches():
+            batches = ndjson.read_batches(
+                json_file, batch_lines=self.args.json_batch_lines
+            )
+            for first, lines in batches:
+                yield await loop.run_in_executor(
+                    None, ndjson.encode_batch, lines, keys, src, first
+                )
+
+        try:
+            process, _, stderr = await exec.copy_from(
+                self.sql_db_options,
+                f"import.{table}",
+                batches(),
+                columns=columns or [ndjson.jsonb_column],
+                options=self.copy_options(None, created=True),
+                setup=ndjson.create_table_statements(table, columns),
+            )
+        except (OSError, UnicodeDecodeError, ndjson.MalformedLineError) as e:
+            logger.error(f"Failed to load {src}: {e}")
+            return
+        await self.import_completed(process, [src], stderr=stderr)
+
+    async def json_columns(self, json_file):
+        """Flattened columns and json keys of a json lines file
+
+        :param json_file: path of the json lines file
+        :return: tuple of column names and json keys or (None, None) for jsonb
+        """
+        if self.args.json_mode != "flatten":
+            return None, None
+        sampled = await asyncio.get_event_loop().run_in_executor(
+            None, ndjson.sample_columns, json_file, self.args.json_sample_lines
+        )
+        if len(sampled) < 1:
+            logger.warning(f"No json objects to flatten in {json_file}, using jsonb")
+            return None, None
+        return list(sampled.keys()), list(sampled.values())
+
+    async def chunked_target(self, dump_file):
+        """Columns, COPY options and table statements for loading a file in chunks
+
+        :param dump_file: path of the csv or json lines file
+        :return: dict describing the target of the file
+        """
+        table = dump_file.stem
+        if dump_file.suffix in ndjson.extensions:
+            columns, keys = await self.json_columns(dump_file)
+            return dict(
+                columns=columns or [ndjson.jsonb_column],
+                keys=keys,
+                binary=None,
+                transforms=None,
+                filters=None,
+                types=dict() if columns else {ndjson.jsonb_column: "jsonb"},
+                zone=None,
+                start=0,
+                line=0,
+                options=None,
+                create=ndjson.create_table_statements(table, columns),
+            )
+        columns, start = chunks.read_header(dump_file)
+        tables = [table, utils.table_name_for_path(dump_file)]
+        selection = filters.plan(
+            tables, columns, self.args.keep_columns, self.args.where, self.args.samples
+        )
+        if selection is not None and selection.keep is not None:
+            columns = [columns[i] for i in selection.keep]
+        types = await self.column_types(dump_file, columns, start)
+        binary, zone = None, None
+        if self.args.copy_format == "binary":
+            binary = schema.binary_types(columns, types)
+            if binary is None:
+                logger.warning(f"Cannot encode {dump_file} in binary, sending csv")
+        if binary and "timestamp with time zone" in binary:
+            zone = await self.session_zone()
+            if zone is None:
+                logger.warning(
+                    f"Cannot encode {dump_file} in binary without the time zone "
+                    "of the targets, sending csv"
+                )
+                binary = None
+        return dict(
+            columns=columns,
+            keys=None,
+            binary=binary,
+            transforms=normalize.column_transforms(
+                self.args.normalize, tables, columns
+            ),
+            filters=selection,
+            types=types,
+            zone=zone,
+            start=start,
+            line=1,
+            options="FORMAT binary" if binary else "FORMAT csv",
+            create=utils.create_table_statements(
+                table, schema.column_definition(columns, types)
+            ),
+        )
+
+    async def session_zone(self):
+        """Time zone in which every target reads timestamps without an offset
+
+        The TimeZone setting is read once per load.
+
+        :return: tzinfo or None if it is unknown or differs between targets
+        """
+        if self.zone is None:
+            self.zone = asyncio.ensure_future(self.query_session_zone())
+        return await self.zone
+
+    async def query_session_zone(self):
+        names = set()
+        for db_options in self.targets:
+            stdout, stderr = await exec.exec_sql(
+                db_options,
+                command="SELECT current_setting('TimeZone') AS zone",
+                sync=True,
+            )
+            try:
+                names.add(json.loads(stdout or "null")[0]["zone"])
+            except (json.decoder.JSONDecodeError, TypeError, KeyError, IndexError):
+                logger.error(f"Failed to read the time zone: {stderr}")
+                return None
+        if len(names) != 1:
+            logger.warning(f"The targets use different time zones {sorted(names)}")
+            return None
+        name = names.pop()
+        zone = pgbinary.session_zone(name)
+        if zone is None:
+            logger.warning(f"Unknown time zone {name}")
+        return zone
+
+    async def column_types(self, dump_file, columns, start):
+        """Column types of a csv file from the schema file or inferred from a sample
+
+        :param dump_file: path of the csv file
+        :param columns: column names
+        :param start: byte offset of the first data row
+        :return: dict of column names to types, missing columns are text
+        """
+        types = dict(schema.table_types(self.args.schema, dump_file) or dict())
+        missing = [column for column in columns if column not in types]
+        if self.args.infer_types and missing:
+            inferred = await asyncio.get_event_loop().run_in_executor(
+                None,
+                schema.infer_types,
+                dump_file,
+                start,
+                columns,
+                self.args.infer_sample_rows,
+            )
+            types.update({column: inferred[column] for column in missing})
+            logger.debug(f"Inferred column types of {dump_file}: {inferred}")
+        return types
+
+    async def resume_point(self, src, stat, db_options):
+        """Last committed chunk of a file that did not change since
+
+        :param src: path of the source file
+        :param stat: stat result of the source file
+        :param db_options: connection options of the target database
+        :return: the last checkpoint or None to load the file from the start
+        """
+        if not self.args.resume:
+            return None
+        checkpoint = await checkpoints.last(db_options, src)
+        if checkpoint and not checkpoints.matches(checkpoint, stat):
+            logger.warning(f"{src} changed since its last checkpoint, reloading")
+            return None
+        return checkpoint
+
+    async def encode_chunk(self, chunk, src, target, line):
+        """Encode a chunk for COPY, separating malformed rows in tolerant mode
+
+        :param chunk: chunk of complete rows
+        :param src: path of the source file
+        :param target: target description
+        :param line: line number of the first line of the chunk
+        :return: tuple of the encoded chunk and the list of rejects (or None)
+        """
+        loop = asyncio.get_event_loop()
+        rejected = list() if self.args.max_rejects is not None else None
+        if target["keys"] is not None or target["options"] is None:
+            data = await loop.run_in_executor(
+                None,
+                ndjson.encode_chunk,
+                chunk.data,
+                target["keys"],
+                src,
+                line,
+                rejected,
+            )
+            return data, rejected
+        data = chunk.data
+        if target["filters"] is not None:
+            data, dropped = await self.run_on_chunk(
+                filters.filter_csv, src, chunk, data, target["filters"]
+            )
+            done = self.load_done.setdefault(src, dict())
+            done["filtered"] = done.get("filtered", 0) + dropped
+        if target["binary"]:
+            # Parsing values is CPU bound, so it runs in the worker processes
+            return await self.run_on_chunk(
+                pgbinary.encode_csv,
+                src,
+                chunk,
+                data,
+                target["binary"],
+                line,
+                rejected is not None,
+                target["transforms"],
+                target["zone"],
+            )
+        if rejected is not None:
+            data, rejected = await self.run_on_chunk(
+                rejects.validate_csv, src, chunk, data, len(target["columns"]), line
+            )
+        if target["transforms"]:
+            data = await self.run_on_chunk(
+                normalize.normalize_csv, src, chunk, data, target["transforms"]
+            )
+        return data, rejected
+
+    @staticmethod
+    async def run_on_chunk(function, src, chunk, data, *args):
+        """Run a function on the data of a chunk in the worker processes
+
+        Large chunks that are unchanged since they were read are read again
+        by the worker, so only their offsets are pickled.
+
+        :param function: module level function taking the data as first argument
+        :param src: path of the source file
+        :param chunk: chunk the data belongs to
+        :param data: current data of the chunk
+        :return: result of the function
+        """
+        if data is chunk.data and len(data) >= workers.offset_size:
+            return await workers.run(
+                workers.apply_range, function, src, chunk.start, chunk.end, *args
+            )
+        return await workers.run(function, data, *args)
+
+    def chunk_statements(self, src, table, target, chunk, line, stat):
+        """Statements executed before and after the COPY of a chunk
+
+        :return: tuple of setup and finishing statements
+        """
+        setup = checkpoints.setup_statements()
+        finish = [checkpoints.record(src, table, chunk, line, stat)]
+        if chunk.index == 0:
+            setup += target["create"] + [checkpoints.reset(src)]
+        return setup, finish
+
+    def quarantine(self, src, table, chunk, rejected, first_line, last_line):
+        """Rejects of a chunk copied into import._rejects before the chunk
+
+        The rejects of the lines of the chunk (of the whole file for the first
+        chunk) are replaced, so copying them again when the chunk is retried
+        or resumed does not duplicate them.
+
+        :return: tuple of the csv data and setup statements or None
+        """
+        if rejected is None or self.args.rejects_to != "table":
+            return None
+        if chunk.index == 0:
+            reset = rejects.reset(src)
+        elif len(rejected) > 0:
+            reset = rejects.reset(src, first_line, last_line)
+        else:
+            return None
+        data = rejects.encode_csv(table, src, rejected)
+        return data, rejects.setup_statements() + [reset]
+
+    async def copy_chunk(
+        self, db_options, table, data, target, setup, finish, rows=None, created=False
+    ):
+        if self.streams is None:
+            return await self._copy_chunk(
+                db_options, table, data, target, setup, finish, rows, created
+            )
+        async with self.streams:
+            process, stderr = await self._copy_chunk(
+                db_options, table, data, target, setup, finish, rows, created
+            )
+        if self.controller is not None and process.returncode == 0:
+            self.controller.record(len(data))
+        return process, stderr
+
+    async def _copy_chunk(
+        self, db_options, table, data, target, setup, finish, rows=None, created=False
+    ):
+        chunks = [data]
+        if self.throttle is not None and len(data) > 0:
+            chunks = self.throttle.slices(table.split(".")[-1], data, rows)
+        task = asyncio.ensure_future(
+            exec.copy_from(
+                db_options,
+                table,
+                chunks,
+                columns=target["columns"],
+                options=self.copy_options(target["options"], created),
+                setup=setup,
+                finish=finish,
+            )
+        )
+        Loader.in_flight.add(task)
+        try:
+            process, _, stderr = await task
+        finally:
+            Loader.in_flight.discard(task)
+        return process, stderr
+
+    def copy_options(self, options, created):
+        """COPY options, with --freeze rows are frozen when the table was created
+        in the same transaction, so they are not rewritten by the first vacuum
+
+        :param options: COPY options of the target or None
+        :param created: whether the COPY runs in the transaction creating the table
+        :return: COPY options or None
+        """
+        if not (self.args.freeze and created):
+            return options
+        return ", ".join(option for option in [options, "FREEZE"] if option)
+
+    async def fan_out(self, src, table, target, stat, queue, status):
+        """Commit the chunks of a file queued for a single target database
+
+        :param src: path of the source file
+        :param table: qualified name of the target table
+        :param target: target description
+        :param stat: stat result of the source file
+        :param queue: queue of (chunk, data, setup, finish, quarantine), None
+            when the file was read completely or False when reading stopped
+        :param status: dict tracking the result for this target
+        :return:
+        """
+        while True:
+            item = await queue.get()
+            if not item:
+                return
+            if status["failed"] or Loader.draining:
+                # Keep consuming so the reader is never blocked by this target
+                continue
+            chunk, data, setup, finish, quarantine = item
+            if self.args.freeze and chunk.index == 0:
+                return await self.copy_frozen(
+                    src, table, target, stat, queue, status, item
+                )
+            if not await self.copy_rejects(status, quarantine):
+                continue
+            # The first chunk is copied in the transaction creating the table
+            process, stderr = await self.copy_chunk(
+                status["db_options"],
+                table,
+                data,
+                target,
+                setup,
+                finish,
+                chunk.rows,
+                created=chunk.index == 0,
+            )
+            status.update(process=process, stderr=stderr, committed=chunk.end)
+            if process.returncode != 0:
+                status["failed"] = True
+            else:
+                logger.debug(f"Committed chunk {chunk.index} of {src}")
+
+    async def copy_rejects(self, status, quarantine):
+        """Copy the rejects of a chunk into import._rejects
+
+        :param status: dict tracking the result for the target database
+        :param quarantine: tuple of the csv data and setup statements or None
+        :return: whether the rejects were copied
+        """
+        if quarantine is None:
+            return True
+        process, _, stderr = await exec.copy_from(
+            status["db_options"],
+            rejects.table,
+            [quarantine[0]],
+            columns=rejects.columns,
+            options="FORMAT csv",
+            setup=quarantine[1],
+        )
+        if process.returncode != 0:
+            status.update(process=process, stderr=stderr, failed=True)
+            return False
+        return True
+
+    async def copy_frozen(self, src, table, target, stat, queue, status, first):
+        """Copy all chunks of a file with --freeze in the transaction creating its table
+
+        All rows of the file are frozen. Nothing is committed unless the file
+        was read completely, the checkpoint covers the whole file.
+
+        :param first: queued item of the first chunk
+        :return:
+        """
+        ended = False
+
+        async def data():
+            nonlocal ended
+            item = first
+            while item:
+                chunk, chunk_data, _, _, quarantine = item
+                if not await self.copy_rejects(status, quarantine):
+                    raise OSError(f"Failed to copy the rejects of {src}")
+                if self.throttle is None:
+                    yield chunk_data
+                else:
+                    name = table.split(".")[-1]
+                    async for part in self.throttle.slices(
+                        name, chunk_data, chunk.rows
+                    ):
+                        yield part
+                item = await queue.get()
+            ended = True
+            if item is False:
+                raise ValueError(f"Stopped reading {src}")
+
+        whole = chunks.Chunk(0, target["start"], stat.st_size, 0, b"")
+        finish = [
+            checkpoints.record(
+                src,
+                table,
+                whole,
+                target["line"],
+                stat,
+                rows=f"(SELECT count(*) FROM {table})",
+            )
+        ]
+        copy = exec.copy_from(
+            status["db_options"],
+            table,
+            data(),
+            columns=target["columns"],
+            options=self.copy_options(target["options"], True),
+            setup=first[2],
+            finish=finish,
+        )
+        try:
+            # Terminating psql on errors rolls back the whole file
+            if self.streams is None:
+                process, _, stderr = await copy
+            else:
+                async with self.streams:
+                    process, _, stderr = await copy
+            status.update(process=process, stderr=stderr)
+        except (OSError, ValueError) as e:
+            status.update(stderr=str(e).encode("utf-8"))
+        if status["process"] is not None and status["process"].returncode == 0:
+            status.update(committed=stat.st_size)
+        else:
+            status.update(failed=True)
+        # Keep consuming so the reader is never blocked by this target
+        while not ended and await queue.get():
+            pass
+
+    async def import_chunked(self, dump_file):
+        """Load a dump file in chunks that are committed together with a checkpoint
+
+        Each chunk is copied in its own transaction, which also records the
+        byte offset and row count of the chunk in import._checkpoints. With
+        --resume, loading continues after the last committed chunk. With
+        --max-rejects, malformed rows are quarantined instead of failing the
+        file, as long as the file stays within its error budget. With
+        --delta-key, files loaded before only send the rows that changed. With
+        --freeze, all chunks of a file are copied in the transaction creating
+        its table.
+
+        The file is read and encoded once. Every target database has its own
+        bounded queue of chunks, so a slow target only holds back the reader
+        once its queue is full and a failing target does not stop the others.
+
+        :param dump_file: path of the csv or json lines file
+        :return:
+        """
+        src, table = str(dump_file), f"import.{dump_file.stem}"
+        is_json = dump_file.suffix in ndjson.extensions
+        chunk_size = self.args.chunk_size or utils.parse_size("64M")
+        try:
+            stat = dump_file.stat()
+            target = await self.chunked_target(dump_file)
+        except (OSError, ValueError, csv.Error) as e:
+            logger.error(f"Failed to prepare {src}: {e}")
+            return
+        keys = None if is_json else merge.keys_for(dump_file.stem, self.args.delta_keys)
+        row_index = await self.delta_index(dump_file, target, keys) if keys else None
+        if row_index and await self.import_delta(dump_file, target, keys, row_index):
+            return
+
+        statuses = list()
+        for db_options in self.targets:
+            checkpoint = await self.resume_point(src, stat, db_options)
+            statuses.append(
+                dict(
+                    db_options=db_options,
+                    name=utils.describe_target(db_options),
+                    checkpoint=checkpoint,
+                    committed=checkpoint.end_offset if checkpoint else 0,
+                    failed=False,
+                    process=None,
+                    stderr=None,
+                )
+            )
+        progress = self.load_done.setdefault(src, dict())
+        progress["targets"] = statuses
+        if self.server_copyable(dump_file, target):
+            await asyncio.gather(
+                *[
+                    self.server_copy(src, table, target, stat, status)
+                    for status in statuses
+                    if status["checkpoint"] is None
+                ]
+            )
+            if all(status["committed"] >= stat.st_size for status in statuses):
+                progress.update(percent=1.0)
+                if row_index:
+                    row_index.commit()
+                for status in statuses:
+                    self.log_process_result(
+                        task="Server side import",
+                        cmd=src
+                        if len(statuses) < 2
+                        else f"{src} into {status['name']}",
+                        process=status["process"],
+                        stderr=status["stderr"],
+                    )
+                return
+        index, start, line = 0, target["start"], target["line"]
+        if all(s["checkpoint"] for s in statuses):
+            checkpoint = min((s["checkpoint"] for s in statuses), key=lambda c: c.chunk)
+            index, start = checkpoint.chunk + 1, checkpoint.end_offset
+            line = checkpoint.end_line
+            if start >= stat.st_size:
+                progress.update(percent=1.0)
+                logger.info(f"{src} was already loaded completely")
+                return
+            logger.info(f"Resuming {src} from chunk {index} at byte {start}")
+
+        queues = [asyncio.Queue(maxsize=self.args.fan_out_queue) for _ in statuses]
+        consumers = [
+            asyncio.ensure_future(self.fan_out(src, table, target, stat, queue, status))
+            for queue, status in zip(queues, statuses)
+        ]
+        reader = self.read_chunks(
+            dump_file,
+            chunk_size,
+            start=start,
+            index=index,
+            is_json=is_json,
+            max_row_size=chunk_size * 4 if self.args.max_rejects is not None else None,
+            # Resumed chunks end at the same rows as in the first run
+            origin=target["start"],
+        )
+        complete = False
+        try:
+            async for chunk in reader:
+                if Loader.draining:
+                    logger.warning(f"Stopped loading {src} before chunk {chunk.index}")
+                    break
+                if all(s["failed"] for s in statuses):
+                    break
+                if not await self.enqueue_chunk(
+                    src, table, target, chunk, line, stat, queues, statuses
+                ):
+                    break
+                line += chunk.data.count(b"\n")
+                progress.update(percent=min(chunk.end / max(stat.st_size, 1), 1.0))
+                await self.update_progress()
+            else:
+                complete = True
+        finally:
+            [await queue.put(None if complete else False) for queue in queues]
+            await asyncio.gather(*consumers)
+
+        progress.update(percent=1.0)
+        if row_index and complete and not any(s["failed"] for s in statuses):
+            row_index.commit()
+        self.log_chunked_results(src, statuses, complete)
+
+    def log_chunked_results(self, src, statuses, complete):
+        for status in statuses:
+            name = src if len(statuses) < 2 else f"{src} into {status['name']}"
+            if not complete and not status["failed"]:
+                logger.error(f"Loading {name} is incomplete")
+            elif status["process"] is None and not status["failed"]:
+                logger.info(f"{name} was already loaded completely")
+            else:
+                self.log_process_result(
+                    task="Import",
+                    cmd=name,
+                    process=status["process"] or FailedProcess,
+                    stderr=status["stderr"],
+                )
+
+    async def delta_index(self, dump_file, target, keys):
+        """Write the next row hash index of a file loaded with --delta-key
+
+        :param dump_file: path of the csv file
+        :param target: target of the file
+        :param keys: key columns
+        :return: index or None if the file is loaded without delta detection
+        """
+        missing = [key for key in keys if key not in target["columns"]]
+        if missing or target["transforms"] or target["filters"]:
+            logger.warning(
+                f"Cannot detect changed rows of {dump_file}, "
+                + (
+                    f"missing key columns {missing}"
+                    if missing
+                    else "its rows are normalized or filtered"
+                )
+            )
+            return None
+        directory = Path(self.args.delta_dir or dump_file.parent)
+        try:
+            await workers.run(
+                delta.build,
+                str(directory),
+                dump_file.stem,
+                str(dump_file),
+                target["start"],
+                target["columns"],
+                keys,
+            )
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to index the rows of {dump_file}: {e}")
+            return None
+        return delta.Index(directory, dump_file.stem)
+
+    async def import_delta(self, dump_file, target, keys, index):
+        """Load only the rows that changed since the last load of a file
+
+        The new and changed rows and the deleted keys are copied into a
+        temporary table, which replaces the rows of their keys in a single
+        transaction on every target.
+
+        :param dump_file: path of the csv file
+        :param target: target of the file
+        :param keys: key columns
+        :param index: next row hash index of the file
+        :return: whether the file was handled, otherwise it is loaded completely
+        """
+        src, table, columns = str(dump_file), dump_file.stem, target["columns"]
+        if not index.matches(columns, keys):
+            return False
+        for db_options in self.targets:
+            if await self.table_columns(db_options, table) != columns:
+                return False
+        directory = str(index.base.parent)
+        numbers, deleted, counts = await workers.run(delta.diff, directory, table)
+        progress = self.load_done.setdefault(src, dict())
+        progress.update(percent=1.0)
+        logger.info(
+            f"{src} has {counts['inserted']} new, {counts['updated']} changed "
+            f"and {counts['deleted']} deleted keys"
+        )
+        if not numbers and not deleted:
+            index.commit()
+            return True
+        # The delta is written next to the index and streamed in chunks
+        spool, chunk_size = index.path(".delta"), self.args.chunk_size
+        setup, finish = delta.apply_statements(table, columns, keys)
+        try:
+            await workers.run(
+                delta.delta_rows,
+                src,
+                target["start"],
+                numbers,
+                deleted,
+                columns,
+                keys,
+                str(spool),
+            )
+            results = await asyncio.gather(
+                *[
+                    exec.copy_from(
+                        db_options,
+                        "_delta",
+                        delta.read_delta(spool, chunk_size or utils.parse_size("64M")),
+                        columns=columns + ["_deleted"],
+                        options="FORMAT csv",
+                        setup=setup,
+                        finish=finish,
+                    )
+                    for db_options in self.targets
+                ]
+            )
+        finally:
+            try:
+                spool.unlink()
+            except OSError:
+                pass
+        for db_options, (process, _, stderr) in zip(self.targets, results):
+            self.log_process_result(
+                task="Delta import",
+                cmd=src
+                if len(results) < 2
+                else f"{src} into {utils.describe_target(db_options)}",
+                process=process,
+                stderr=stderr,
+            )
+        if all(process.returncode == 0 for process, _, _ in results):
+            index.commit()
+        else:
+            index.discard()
+        return True
+
+    @staticmethod
+    async def read_chunks(dump_file, chunk_size, is_json=False, **kwargs):
+        """Read a file in chunks, large csv files are scanned by the worker processes
+
+        :param dump_file: path of the csv or json lines file
+        :param chunk_size: minimum number of bytes per chunk
+        :param is_json: whether the file contains json lines
+        :return: async generator of chunks
+        """
+        size = dump_file.stat().st_size - kwargs.get("start", 0)
+        if not is_json and size >= max(workers.parallel_size, 2 * chunk_size):
+            async for chunk in workers.plan_chunks(
+                str(dump_file), chunk_size, **kwargs
+            ):
+                yield chunk
+            return
+        reader = chunks.read_chunks(
+            dump_file,
+            chunk_size,
+            boundary=chunks.line_boundary if is_json else chunks.csv_row_boundary,
+            rows=chunks.lines if is_json else chunks.csv_rows,
+            **kwargs,
+        )
+        for chunk in reader:
+            yield chunk
+
+    def server_copyable(self, dump_file, target):
+        """Whether the database servers may read a file themselves
+
+        Files whose rows are transformed, encoded, validated or throttled on
+        the client are always streamed.
+        """
+        return bool(
+            self.args.server_paths
+            and dump_file.suffix not in ndjson.extensions
+            and not target["binary"]
+            and not target["transforms"]
+            and not target["filters"]
+            and self.args.max_rejects is None
+            and self.throttle is None
+        )
+
+    async def server_copy(self, src, table, target, stat, status):
+        """Let a database server read a file from a shared file system
+
+        The server must see the file with the same size at its mapped path,
+        otherwise or if the COPY fails, the file is streamed by the client.
+
+        :param src: path of the source file
+        :param table: qualified name of the target table
+        :param target: target description
+        :param stat: stat result of the source file
+        :param status: dict tracking the result for the target database
+        :return:
+        """
+        path = servercopy.server_path(src, self.args.server_paths)
+        if path is None:
+            return
+        db_options = status["db_options"]
+        size = await servercopy.readable_size(db_options, path)
+        if size != stat.st_size:
+            logger.info(
+                f"{status['name']} cannot read {src} as {path}, streaming it instead"
+            )
+            return
+        chunk = chunks.Chunk(0, target["start"], stat.st_size, 0, b"")
+        statements = (
+            checkpoints.setup_statements()
+            + target["create"]
+            + [
+                checkpoints.reset(src),
+                servercopy.copy_statement(
+                    table, target["columns"], path, freeze=self.args.freeze
+                ),
+                checkpoints.record(
+                    src,
+                    table,
+                    chunk,
+                    target["line"],
+                    stat,
+                    rows=f"(SELECT count(*) FROM {table})",
+                ),
+            ]
+        )
+        process, _, stderr = await exec.execute(db_options, statements)
+        if process.returncode != 0:
+            logger.warning(
+                f"{status['name']} failed to read {src} as {path}, streaming it "
+                f"instead: {stderr.decode(errors='replace').strip()}"
+            )
+            return
+        logger.info(f"{status['name']} read {src} from {path}")
+        status.update(process=process, stderr=stderr, committed=stat.st_size)
+
+    async def enqueue_chunk(
+        self, src, table, target, chunk, line, stat, queues, statuses
+    ):
+        """Encode a chunk once and queue it for every target that still needs it
+
+        :return: whether loading the file should continue
+        """
+        first_line = line + 1
+        try:
+            data, rejected = await self.encode_chunk(chunk, src, target, first_line)
+        except (ValueError, csv.Error) as e:
+            logger.error(f"Failed to load chunk {chunk.index} of {src}: {e}")
+            return False
+        line += chunk.data.count(b"\n")
+        if rejected is not None:
+            progress = self.load_done[src]
+            [logger.warning(f"Rejected {src}:{r.line}: {r.reason}") for r in rejected]
+            progress["rejected"] = progress.get("rejected", 0) + len(rejected)
+            if progress["rejected"] > self.args.max_rejects:
+                logger.error(
+                    f"Failed to load {src}: {progress['rejected']} rejected rows "
+                    f"exceed the budget of {self.args.max_rejects}"
+                )
+                return False
+            if self.args.rejects_to == "file":
+                if chunk.index == 0 or len(rejected) > 0:
+                    rejects.write_sidecar(src, rejected, append=chunk.index > 0)
+
+        setup, finish = self.chunk_statements(src, table, target, chunk, line, stat)
+        quarantine = self.quarantine(
+            src, table, chunk, rejected, first_line, max(first_line, line)
+        )
+        for queue, status in zip(queues, statuses):
+            if status["failed"] or chunk.end <= status["committed"]:
+                continue
+            if chunk.start < status["committed"]:
+                logger.error(
+                    f"Cannot resume {src} in {status['name']}, the chunk boundaries "
+                    f"changed since its last checkpoint"
+                )
+                status["failed"] = True
+                continue
+            await queue.put((chunk, data, setup, finish, quarantine))
+        return True
+
+
+class FailedProcess:
+    """Stands in for a COPY process that never ran"""
+
+    returncode = -1
+
 
 async def shutdown(exit_signal, event_loop):
     logger.error(f"Received exit signal {exit_signal.name}...")
+    Loader.draining = True
+    if len(Loader.in_flight) > 0:
+        logger.info(
+            f"Waiting up to {Loader.drain_timeout}s for {len(Loader.in_flight)} chunks to commit"
+        )
+        await asyncio.wait(set(Loader.in_flight), timeout=Loader.drain_timeout)
     tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
     [task.cancel() for task in tasks]
     logger.info(f"Cancelling {len(tasks)} outstanding tasks")
@@ -552,6 +2709,11 @@ async def shutdown(exit_signal, event_loop):
     event_loop.stop()
 
 
+def request_throttle_reload():
+    logger.info("Received SIGUSR1, reloading the throttle file")
+    Loader.reload_throttle = True
+
+
 async def _main():
     args, unknown = cli.parse()
     if len(unknown) > 0:
@@ -561,6 +2723,9 @@ async def _main():
     args.sources = [item for sublist in args.sources or list() for item in sublist]
     args.post_load = [item for sublist in args.post_load or list() for item in sublist]
     args.pre_load = [item for sublist in args.pre_load or list() for item in sublist]
+    args.table_hooks = [
+        item for sublist in args.table_hooks or list() for item in sublist
+    ]
 
     # Set log level
     log_level = getattr(
@@ -576,7 +2741,19 @@ async def _main():
         logger.fatal("No input files")
         return
 
-    await Loader(args).load([Path(source) for source in args.sources])
+    try:
+        args.schema = schema.load(args.schema) if args.schema else None
+    except (OSError, ValueError) as e:
+        logger.fatal(f"Invalid schema file {args.schema}: {e}")
+        return
+
+    Loader.drain_timeout = args.drain_timeout
+    loader = Loader(args)
+    sources = [Path(source) for source in args.sources]
+    if args.watch:
+        await loader.watch(sources)
+    else:
+        await loader.load(sources)
 
 
 def main():
@@ -587,6 +2764,8 @@ def main():
             sig, lambda s=sig: asyncio.create_task(shutdown(s, loop))
         )
 
+    loop.add_signal_handler(signal.SIGUSR1, request_throttle_reload)
+
     try:
         loop.run_until_complete(_main())
     finally:
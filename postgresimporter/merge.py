@@ -0,0 +1,116 @@
+import fnmatch
+import re
+
+from . import utils
+
+command_tag = re.compile(rb"^INSERT 0 (\d+)$", re.MULTILINE)
+
+
+def keys_for(table, rules):
+    """Key columns a combined table is merged on
+
+    :param table: name of the combined table
+    :param rules: list of (table pattern, key columns), the last match wins
+    :return: list of key columns or None if the table is rebuilt
+    """
+    keys = None
+    for pattern, columns in rules or []:
+        if fnmatch.fnmatchcase(table, pattern):
+            keys = columns
+    return keys
+
+
+def quoted(columns, prefix=""):
+    return ", ".join(f'{prefix}"{column}"' for column in columns)
+
+
+def stage_statements(table, file_tables, columns, keys):
+    """Statements collecting the rows of the file tables in an unlogged staging table
+
+    When several files hold the same key, the row of the last file wins.
+    Rows with a NULL key column can never conflict and are left out.
+
+    :param table: name of the combined table
+    :param file_tables: names of the tables to combine
+    :param columns: columns of the tables
+    :param keys: key columns
+    :return: list of sql statements
+    """
+    stage = f"import._merge_{table}"
+    union = " UNION ALL ".join(
+        f"SELECT {quoted(columns)}, {i} AS _file FROM import.{t}"
+        for i, t in enumerate(file_tables)
+    )
+    present = " AND ".join(f'"{key}" IS NOT NULL' for key in keys)
+    return [
+        f"DROP TABLE IF EXISTS {stage}",
+        f"CREATE UNLOGGED TABLE {stage} AS SELECT DISTINCT ON ({quoted(keys)}) "
+        f"{quoted(columns)} FROM ({union}) AS combined WHERE {present} "
+        f"ORDER BY {quoted(keys)}, _file DESC",
+    ]
+
+
+def target_statements(table, template, keys):
+    """Statements creating the persistent table and the unique index merges rely on
+
+    :param table: name of the combined table
+    :param template: table whose definition a new combined table copies
+    :param keys: key columns
+    :return: list of sql statements
+    """
+    return [
+        f"CREATE TABLE IF NOT EXISTS import.{table} (LIKE import.{template} INCLUDING ALL)",
+        f"CREATE UNIQUE INDEX IF NOT EXISTS {table}_merge_key ON import.{table} ({quoted(keys)})",
+    ]
+
+
+def bounds_query(table, key, batch_rows):
+    """Query for the upper bounds of key ranges of about batch_rows staged rows each
+
+    :param table: name of the combined table
+    :param key: first key column
+    :param batch_rows: number of rows per batch
+    :return: sql query returning the bound of every range in order
+    """
+    return (
+        f'SELECT max("{key}")::text AS bound FROM (SELECT "{key}", '
+        f'(row_number() OVER (ORDER BY "{key}") - 1) / {int(batch_rows)} AS batch '
+        f"FROM import._merge_{table}) AS ranges GROUP BY batch ORDER BY batch"
+    )
+
+
+def upsert_statement(table, columns, keys, lower=None, upper=None):
+    """Upsert of a key range of staged rows into the persistent table
+
+    Rows whose values did not change are neither updated nor written again.
+
+    :param table: name of the combined table
+    :param columns: columns of the table
+    :param keys: key columns
+    :param lower: exclusive lower bound of the first key column or None
+    :param upper: inclusive upper bound of the first key column or None
+    :return: sql statement
+    """
+    values = [column for column in columns if column not in keys]
+    conditions = []
+    if lower is not None:
+        conditions.append(f'"{keys[0]}" > {utils.sql_literal(lower)}')
+    if upper is not None:
+        conditions.append(f'"{keys[0]}" <= {utils.sql_literal(upper)}')
+    statement = (
+        f"INSERT INTO import.{table} AS target ({quoted(columns)}) "
+        f"SELECT {quoted(columns)} FROM import._merge_{table}"
+        + (f" WHERE {' AND '.join(conditions)}" if conditions else "")
+        + f" ON CONFLICT ({quoted(keys)}) DO "
+    )
+    if not values:
+        return statement + "NOTHING"
+    return statement + (
+        f"UPDATE SET ({quoted(values)}) = ROW({quoted(values, 'EXCLUDED.')}) "
+        f"WHERE ({quoted(values, 'target.')}) IS DISTINCT FROM ({quoted(values, 'EXCLUDED.')})"
+    )
+
+
+def written_rows(stdout):
+    """Number of rows inserted or updated according to the psql command tags"""
+    return sum(int(count) for count in command_tag.findall(stdout or b""))
@@ -0,0 +1,197 @@
+import json
+import logging
+
+from . import rejects, utils
+
+logger = logging.getLogger("ndjson")
+
+extensions = [".jsonl", ".ndjson"]
+json_modes = ["jsonb", "flatten"]
+jsonb_column = "data"
+
+# Placeholder for malformed lines that were rejected while parsing
+REJECTED = object()
+
+
+class MalformedLineError(ValueError):
+    def __init__(self, file, line_number, reason):
+        super().__init__(f"{file}:{line_number}: {reason}")
+        self.file = file
+        self.line_number = line_number
+        self.reason = reason
+
+
+def read_batches(file, batch_lines=10000):
+    """Read a newline delimited json file in batches of non-empty lines
+
+    :param file: path of the json lines file
+    :param batch_lines: maximum number of lines per batch
+    :return: generator of (line number of the first line, list of lines)
+    """
+    with open(file, encoding="utf-8") as json_file:
+        batch, first = list(), 1
+        for line_number, line in enumerate(json_file, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            if not batch:
+                first = line_number
+            batch.append(line)
+            if len(batch) >= batch_lines:
+                yield first, batch
+                batch = list()
+        if batch:
+            yield first, batch
+
+
+def parse_batch(lines, file=None, first_line=1, line_numbers=None, rejected=None):
+    """Parse a batch of json lines with a single call into the json decoder
+
+    Joining the lines into one json array keeps the per row overhead small.
+    Only if that fails, the lines are parsed one by one to locate the error.
+
+    :param lines: list of json encoded lines
+    :param file: source file used for error reporting
+    :param first_line: line number of the first line used for error reporting
+    :param line_numbers: optional line numbers of the lines
+    :param rejected: optional list collecting malformed lines instead of raising
+    :return: list of decoded records and the rejected marker for malformed lines
+    """
+    try:
+        records = json.loads("[" + ",".join(lines) + "]")
+        if len(records) == len(lines):
+            return records
+    except ValueError:
+        pass
+    records = list()
+    for offset, line in enumerate(lines):
+        try:
+            records.append(json.loads(line))
+        except ValueError as e:
+            line_number = line_numbers[offset] if line_numbers else first_line + offset
+            if rejected is None:
+                raise MalformedLineError(file, line_number, str(e))
+            rejected.append(
+                rejects.Reject(line_number, f"malformed json: {e}", line.encode())
+            )
+            records.append(REJECTED)
+    return records
+
+
+def sample_columns(file, sample_lines=1000):
+    """Sample the leading records of a file to derive a flat column schema
+
+    :param file: path of the json lines file
+    :param sample_lines: number of lines to sample
+    :return: dict of column names to the json keys, in order of appearance
+    """
+    columns = dict()
+    for first, lines in read_batches(file, batch_lines=sample_lines):
+        for record in parse_batch(lines, file=file, first_line=first):
+            if not isinstance(record, dict):
+                continue
+            for key in record.keys():
+                column = utils.to_column_name(key)
+                if column and column not in columns:
+                    columns[column] = key
+        break
+    return columns
+
+
+def to_copy_text(value):
+    """Encode a single value as a field of the COPY text format
+
+    :param value: decoded json value
+    :return: escaped field
+    """
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        value = "true" if value else "false"
+    elif isinstance(value, (dict, list)):
+        value = json.dumps(value, ensure_ascii=False)
+    else:
+        value = str(value)
+    return (
+        value.replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def encode_batch(
+    lines, keys=None, file=None, first_line=1, line_numbers=None, rejected=None
+):
+    """Encode a batch of json lines as rows of the COPY text format
+
+    :param lines: list of json encoded lines
+    :param keys: json keys of the flattened columns or None to load raw jsonb
+    :param file: source file used for error reporting
+    :param first_line: line number of the first line used for error reporting
+    :param line_numbers: optional line numbers of the lines
+    :param rejected: optional list collecting malformed lines instead of raising
+    :return: encoded rows (bytes)
+    """
+    records = parse_batch(
+        lines,
+        file=file,
+        first_line=first_line,
+        line_numbers=line_numbers,
+        rejected=rejected,
+    )
+    if keys is None:
+        rows = [
+            to_copy_text(line)
+            for line, record in zip(lines, records)
+            if record is not REJECTED
+        ]
+    else:
+        rows = [
+            "\t".join(
+                to_copy_text(record.get(key) if isinstance(record, dict) else None)
+                for key in keys
+            )
+            for record in records
+            if record is not REJECTED
+        ]
+    return ("\n".join(rows) + "\n").encode("utf-8") if rows else b""
+
+
+def encode_chunk(data, keys=None, file=None, first_line=1, rejected=None):
+    """Encode a chunk of raw json lines as rows of the COPY text format
+
+    :param data: chunk of complete json lines (bytes)
+    :param keys: json keys of the flattened columns or None to load raw jsonb
+    :param file: source file used for error reporting
+    :param first_line: line number of the first line of the chunk
+    :param rejected: optional list collecting malformed lines instead of raising
+    :return: encoded rows (bytes)
+    """
+    lines, line_numbers = list(), list()
+    for line_number, raw in enumerate(data.split(b"\n"), start=first_line):
+        if not raw.strip():
+            continue
+        try:
+            lines.append(raw.decode("utf-8").strip())
+            line_numbers.append(line_number)
+        except UnicodeDecodeError as e:
+            reason = f"invalid encoding: {e.reason} at byte {e.start}"
+            if rejected is None:
+                raise MalformedLineError(file, line_number, reason)
+            rejected.append(rejects.Reject(line_number, reason, raw))
+    return encode_batch(
+        lines, keys=keys, file=file, line_numbers=line_numbers, rejected=rejected,
+    )
+
+
+def create_table_statements(table, columns=None):
+    """Statements to (re)create the target table of a json lines file
+
+    :param table: name of the table in the import schema
+    :param columns: flattened column names or None for a single jsonb column
+    :return: list of sql statements
+    """
+    return utils.create_table_statements(
+        table, utils.text_columns(columns) if columns else f"{jsonb_column} jsonb"
+    )
@@ -0,0 +1,195 @@
+import csv
+import fnmatch
+import re
+
+SEPARATOR = "\x00"
+
+# strip() of hooks/functions.sql: edge newlines and every quote are removed
+strip_pattern = re.compile(r'\A[\n\r]+|"|[\n\r]+\Z')
+# The same for a column buffer of values joined by NUL, which text cannot contain
+strip_column_pattern = re.compile(r'(?:\A|(?<=\x00))[\n\r]+|"|[\n\r]+(?=\x00|\Z)')
+# A quoted field including its quotes or the text up to the next separator
+field_pattern = re.compile(r'"[^"]*(?:""[^"]*)*"|[^,\r\n]*')
+
+
+def strip(value):
+    """Python version of the packaged strip() sql function
+
+    :param value: text or None
+    :return: the stripped text or None if it is empty
+    """
+    if value is None:
+        return None
+    return strip_pattern.sub("", value) or None
+
+
+def strip_column(values):
+    """Apply strip() to a whole column with a single pass of the regex engine
+
+    :param values: list of texts (or None)
+    :return: list of stripped texts or None for empty values
+    """
+    if not values:
+        return list()
+    nulls = [i for i, value in enumerate(values) if value is None]
+    buffer = SEPARATOR.join(value or "" for value in values)
+    stripped = [
+        value or None for value in strip_column_pattern.sub("", buffer).split(SEPARATOR)
+    ]
+    for i in nulls:
+        stripped[i] = None
+    return stripped
+
+
+def empty_to_null(values):
+    return [value or None for value in values]
+
+
+def trim(values):
+    return [value.strip() if value is not None else None for value in values]
+
+
+transforms = {
+    "strip": strip_column,
+    "trim": trim,
+    "empty_to_null": empty_to_null,
+}
+
+
+def parse_rule(spec):
+    """Parse a normalization rule like animals.name=strip
+
+    The target is a table and an optional column, both may contain shell
+    wildcards. Without a transform, strip is applied.
+
+    :param spec: rule specification
+    :return: tuple of table pattern, column pattern and transform name
+    """
+    target, _, transform = spec.partition("=")
+    table, _, column = target.strip().partition(".")
+    transform = transform.strip() or "strip"
+    if transform not in transforms:
+        raise ValueError(
+            "%s is not a known transform. Must be one of %s"
+            % (transform, ", ".join(transforms))
+        )
+    return table or "*", column or "*", transform
+
+
+def column_transforms(rules, tables, columns):
+    """Transform of every column of a table, the last matching rule wins
+
+    :param rules: parsed rules
+    :param tables: names the table is known by (file stem and table group)
+    :param columns: column names
+    :return: list of transform names (or None) per column or None if there are none
+    """
+    selected = [None] * len(columns)
+    for table_pattern, column_pattern, transform in rules or []:
+        if not any(fnmatch.fnmatchcase(t, table_pattern) for t in tables):
+            continue
+        for i, column in enumerate(columns):
+            if fnmatch.fnmatchcase(column, column_pattern):
+                selected[i] = transform
+    return selected if any(selected) else None
+
+
+def apply(rows, selected):
+    """Apply the transforms column by column to rows of equal length
+
+    :param rows: list of rows (lists of values)
+    :param selected: transform name (or None) per column
+    :return: list of transformed rows
+    """
+    if not rows:
+        return rows
+    columns = [list(column) for column in zip(*rows)]
+    for i, transform in enumerate(selected):
+        if transform:
+            columns[i] = transforms[transform](columns[i])
+    return [list(row) for row in zip(*columns)]
+
+
+def csv_value(value):
+    """Csv field of a value, quoted unless it is NULL"""
+    if value is None:
+        return ""
+    return '"' + value.replace('"', '""') + '"'
+
+
+def raw_rows(text):
+    """Rows of a csv text as lists of raw fields, quoted fields keep their quotes
+
+    Unlike with csv.reader, an empty quoted field ("") stays distinct from an
+    unquoted empty field, which COPY reads as NULL. Empty lines are skipped.
+
+    :param text: csv text of complete rows
+    :return: generator of lists of raw fields
+    """
+    for _, row in numbered_rows(text):
+        yield row
+
+
+def numbered_rows(text, first_line=1):
+    """Rows of a csv text as lists of raw fields with the line they start on
+
+    :param text: csv text of complete rows
+    :param first_line: line number of the first row
+    :return: generator of tuples of the line number and the list of raw fields
+    """
+    position, end, row = 0, len(text), list()
+    line = start = first_line
+    while position < end:
+        match = field_pattern.match(text, position)
+        row.append(match.group())
+        line += match.group().count("\n")
+        position = match.end()
+        if position < end and text[position] == ",":
+            position += 1
+            if position == end:
+                row.append("")
+            continue
+        if text.startswith("\r\n", position):
+            position += 2
+            line += 1
+        elif position < end and text[position] in "\r\n":
+            if text[position] == "\n":
+                line += 1
+            position += 1
+        elif position < end:
+            raise csv.Error(f"',' expected after a quoted field at {position}")
+        if row != [""]:
+            yield start, row
+        row, start = list(), line
+    if row and row != [""]:
+        yield start, row
+
+
+def field_value(raw):
+    """Value of a raw csv field, None for an unquoted empty field"""
+    if len(raw) > 1 and raw[0] == '"' and raw[-1] == '"':
+        return raw[1:-1].replace('""', '"')
+    return raw or None
+
+
+def normalize_csv(data, selected):
+    """Normalize the values of a csv chunk, runs in a worker process
+
+    Transformed values are written quoted and NULL as an unquoted empty
+    field, the fields of other columns are passed through as they are.
+    Rows with an unexpected number of columns are passed through unchanged
+    for COPY to report.
+
+    :param data: csv chunk of complete rows
+    :param selected: transform name (or None) per column
+    :return: normalized csv chunk (bytes)
+    """
+    rows = list(raw_rows(data.decode("utf-8")))
+    complete = [i for i, row in enumerate(rows) if len(row) == len(selected)]
+    values = [[field_value(field) for field in rows[i]] for i in complete]
+    for i, transformed in zip(complete, apply(values, selected)):
+        rows[i] = [
+            csv_value(value) if transform else field
+            for field, value, transform in zip(rows[i], transformed, selected)
+        ]
+    return "".join(",".join(row) + "\n" for row in rows).encode("utf-8")
@@ -0,0 +1,320 @@
+import csv
+import datetime
+import decimal
+import functools
+import io
+import re
+import struct
+
+from . import normalize, rejects
+
+try:
+    import zoneinfo
+except ImportError:  # Python < 3.9
+    zoneinfo = None
+
+HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+TRAILER = struct.pack(">h", -1)
+NULL = struct.pack(">i", -1)
+
+POSTGRES_EPOCH = datetime.datetime(2000, 1, 1)
+POSTGRES_EPOCH_UTC = POSTGRES_EPOCH.replace(tzinfo=datetime.timezone.utc)
+POSTGRES_EPOCH_DATE = POSTGRES_EPOCH.date()
+
+# TimeZone settings that are always UTC, other zones need zoneinfo
+utc_zones = {"utc", "uct", "gmt", "zulu", "universal", "greenwich", "z"}
+
+date_pattern = re.compile(r"^(\d{4})-(\d{2})-(\d{2})$")
+# Digits of integers as postgres reads them, int() also takes 1_000 and
+# digits of other scripts
+integer_pattern = re.compile(r"\s*[+-]?[0-9]+\s*", re.ASCII)
+timestamp_pattern = re.compile(
+    r"^(\d{4})-(\d{2})-(\d{2})[ T](\d{2}):(\d{2})(?::(\d{2})(?:\.(\d{1,6}))?)?"
+    r"\s*(Z|[+-]\d{2}(?::?\d{2})?)?$"
+)
+
+
+def _int(fmt):
+    packer = struct.Struct(fmt)
+
+    def encode(value):
+        if not integer_pattern.fullmatch(value):
+            raise ValueError(f"invalid integer {value!r}")
+        return packer.pack(int(value))
+
+    return encode
+
+
+def _float(fmt):
+    packer = struct.Struct(fmt)
+    return lambda value: packer.pack(float(value))
+
+
+def _bool(value):
+    value = value.strip().lower()
+    if value in ("t", "true", "y", "yes", "on", "1"):
+        return b"\x01"
+    if value in ("f", "false", "n", "no", "off", "0"):
+        return b"\x00"
+    raise ValueError(f"invalid boolean {value!r}")
+
+
+def _text(value):
+    return value.encode("utf-8")
+
+
+def _jsonb(value):
+    return b"\x01" + value.encode("utf-8")
+
+
+def parse_date(value):
+    match = date_pattern.match(value.strip())
+    if not match:
+        raise ValueError(f"invalid date {value!r}")
+    return datetime.date(*(int(g) for g in match.groups()))
+
+
+def parse_timestamp(value):
+    match = timestamp_pattern.match(value.strip())
+    if not match:
+        raise ValueError(f"invalid timestamp {value!r}")
+    year, month, day, hour, minute, second, fraction, offset = match.groups()
+    timestamp = datetime.datetime(
+        int(year),
+        int(month),
+        int(day),
+        int(hour),
+        int(minute),
+        int(second or 0),
+        int((fraction or "0").ljust(6, "0")),
+    )
+    if offset:
+        if offset == "Z":
+            delta = datetime.timedelta(0)
+        else:
+            digits = offset[1:].replace(":", "")
+            delta = datetime.timedelta(
+                hours=int(digits[:2]), minutes=int(digits[2:4] or 0)
+            )
+            delta = -delta if offset[0] == "-" else delta
+        timestamp = timestamp.replace(tzinfo=datetime.timezone(delta))
+    return timestamp
+
+
+def _date(value):
+    return struct.pack(">i", (parse_date(value) - POSTGRES_EPOCH_DATE).days)
+
+
+def _timestamp(value):
+    timestamp = parse_timestamp(value).replace(tzinfo=None)
+    delta = timestamp - POSTGRES_EPOCH
+    return struct.pack(">q", delta // datetime.timedelta(microseconds=1))
+
+
+def session_zone(name):
+    """Time zone of a TimeZone setting of postgres
+
+    A text COPY reads timestamps with time zone without an offset in the
+    TimeZone of the session, so binary values are encoded in the same zone.
+
+    :param name: value of the TimeZone setting (e.g. Europe/Berlin)
+    :return: tzinfo or None if the zone is unknown
+    """
+    name = str(name or "").strip()
+    if name.lower().replace("etc/", "", 1) in utc_zones:
+        return datetime.timezone.utc
+    if zoneinfo is None or not name:
+        return None
+    try:
+        return zoneinfo.ZoneInfo(name)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def _timestamptz(value, zone=datetime.timezone.utc):
+    timestamp = parse_timestamp(value)
+    if timestamp.tzinfo is None:
+        # Without an explicit offset, values are in the time zone of the session
+        timestamp = timestamp.replace(tzinfo=zone)
+    delta = timestamp - POSTGRES_EPOCH_UTC
+    return struct.pack(">q", delta // datetime.timedelta(microseconds=1))
+
+
+def _numeric(value):
+    number = decimal.Decimal(value.strip())
+    if number.is_nan():
+        return struct.pack(">hhHH", 0, 0, 0xC000, 0)
+    if not number.is_finite():
+        raise ValueError(f"invalid numeric {value!r}")
+    sign, digits, exponent = number.as_tuple()
+    scale = max(0, -exponent)
+    # Align the digits to groups of four decimal digits around the point
+    digits = "".join(str(d) for d in digits) + "0" * (exponent % 4)
+    exponent -= exponent % 4
+    digits = "0" * (-len(digits) % 4) + digits
+    groups = [int(digits[i : i + 4]) for i in range(0, len(digits), 4)]
+    weight = len(groups) - 1 + exponent // 4
+    while groups and groups[0] == 0:
+        groups.pop(0)
+        weight -= 1
+    while groups and groups[-1] == 0:
+        groups.pop()
+    if not groups:
+        weight = 0
+    return struct.pack(
+        ">hhHH%dH" % len(groups),
+        len(groups),
+        weight,
+        0x4000 if sign else 0,
+        scale,
+        *groups,
+    )
+
+
+encoders = {
+    "smallint": _int(">h"),
+    "integer": _int(">i"),
+    "bigint": _int(">q"),
+    "real": _float(">f"),
+    "double precision": _float(">d"),
+    "numeric": _numeric,
+    "boolean": _bool,
+    "text": _text,
+    "varchar": _text,
+    "json": _text,
+    "jsonb": _jsonb,
+    "date": _date,
+    "timestamp": _timestamp,
+    "timestamp with time zone": _timestamptz,
+}
+
+aliases = {
+    "int2": "smallint",
+    "int": "integer",
+    "int4": "integer",
+    "int8": "bigint",
+    "float4": "real",
+    "float8": "double precision",
+    "float": "double precision",
+    "decimal": "numeric",
+    "bool": "boolean",
+    "character varying": "varchar",
+    "timestamp without time zone": "timestamp",
+    "timestamptz": "timestamp with time zone",
+}
+
+
+def normalize_type(pg_type):
+    """Canonical name of a column type, ignoring modifiers like varchar(200)
+
+    :param pg_type: postgres type name
+    :return: canonical type name or None if it cannot be encoded
+    """
+    name = re.sub(r"\s*\(.*\)\s*$", "", str(pg_type).strip().lower())
+    name = re.sub(r"\s+", " ", name)
+    name = aliases.get(name, name)
+    return name if name in encoders else None
+
+
+def encode_row(values, row_encoders):
+    fields = [struct.pack(">h", len(values))]
+    for value, encoder in zip(values, row_encoders):
+        if value is None:
+            fields.append(NULL)
+            continue
+        encoded = encoder(value)
+        fields.append(struct.pack(">i", len(encoded)))
+        fields.append(encoded)
+    return b"".join(fields)
+
+
+def _value(raw):
+    if raw.startswith('"') and (len(raw) < 2 or not raw.endswith('"')):
+        raise csv.Error("unterminated quoted field")
+    return normalize.field_value(raw)
+
+
+def _parse(data, first_line):
+    """Parse a csv chunk into rows of values, None for unquoted empty fields"""
+    return [
+        (line, [_value(field) for field in fields], None)
+        for line, fields in normalize.numbered_rows(data.decode("utf-8"), first_line)
+    ]
+
+
+def _parse_rows(data, first_line):
+    """Parse a csv chunk row by row, keeping malformed rows and their lines"""
+    rows, line = list(), first_line
+    for raw in rejects.split_rows(data):
+        try:
+            rows += [
+                (row_line, values, None) for row_line, values, _ in _parse(raw, line)
+            ]
+        except UnicodeDecodeError as e:
+            rows.append((line, raw, f"invalid encoding: {e.reason} at byte {e.start}"))
+        except csv.Error as e:
+            rows.append((line, raw, f"malformed row: {e}"))
+        line += raw.count(b"\n")
+    return rows
+
+
+def encode_csv(data, types, first_line=1, tolerant=False, selected=None, zone=None):
+    """Encode a csv chunk in the binary COPY format
+
+    Unquoted empty fields are sent as NULL and quoted empty fields ("") as
+    empty strings, like a csv COPY reads them.
+    Runs in a worker process, so rejects are returned rather than collected.
+
+    :param data: csv chunk of complete rows
+    :param types: canonical column types
+    :param first_line: line number of the first row of the chunk
+    :param tolerant: whether to reject rows that cannot be parsed or encoded
+        instead of raising
+    :param selected: optional transform name (or None) per column applied
+        before encoding
+    :param zone: time zone of timestamps with time zone without an offset,
+        defaults to UTC
+    :return: tuple of the encoded chunk (with header and trailer) and the
+        list of rejects (or None)
+    """
+    row_encoders = [
+        functools.partial(_timestamptz, zone=zone)
+        if zone is not None and t == "timestamp with time zone"
+        else encoders[t]
+        for t in types
+    ]
+    try:
+        rows = _parse(data, first_line)
+    except (UnicodeDecodeError, csv.Error):
+        if not tolerant:
+            raise
+        rows = _parse_rows(data, first_line)
+    if selected:
+        complete = [
+            i
+            for i, (_, values, reason) in enumerate(rows)
+            if reason is None and len(values) == len(types)
+        ]
+        transformed = normalize.apply([rows[i][1] for i in complete], selected)
+        for i, values in zip(complete, transformed):
+            rows[i] = (rows[i][0], values, None)
+
+    encoded, rejected = [HEADER], list() if tolerant else None
+    for line, values, reason in rows:
+        if reason is None:
+            try:
+                if len(values) != len(row_encoders):
+                    reason = f"expected {len(row_encoders)} columns, got {len(values)}"
+                else:
+                    encoded.append(encode_row(values, row_encoders))
+                    continue
+            except (ValueError, ArithmeticError, struct.error) as e:
+                reason = f"invalid value: {e}"
+            if not tolerant:
+                raise ValueError(f"line {line}: {reason}")
+            raw = io.StringIO()
+            csv.writer(raw).writerow(values)
+            values = raw.getvalue().encode("utf-8")
+        rejected.append(rejects.Reject(line, reason, values))
+    encoded.append(TRAILER)
+    return b"".join(encoded), rejected
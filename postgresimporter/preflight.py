@@ -0,0 +1,143 @@
+import codecs
+import csv
+import logging
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from . import chunks
+
+logger = logging.getLogger("preflight")
+
+# A quoted value growing beyond this size is taken for an unterminated quote
+max_row_size = 64 << 20
+# Number of ragged rows whose line is reported
+sample_lines = 5
+wide_boms = (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)
+
+
+@dataclass
+class FileReport:
+    """Problems found in a csv file"""
+
+    path: str
+    columns: List[str] = field(default_factory=list)
+    rows: int = 0
+    ragged: int = 0
+    ragged_lines: List[int] = field(default_factory=list)
+    invalid_line: Optional[int] = None
+    unterminated_line: Optional[int] = None
+    bom: Optional[str] = None
+    errors: List[str] = field(default_factory=list)
+    warnings: List[str] = field(default_factory=list)
+
+
+def field_count(row):
+    return len(next(csv.reader([row.decode("utf-8", "replace").rstrip("\r\n")]), []))
+
+
+def scan_file(path, bom_allowed=False, row_size=max_row_size):
+    """Check the rows of a csv file line by line
+
+    Runs in the worker processes and keeps at most one row in memory.
+
+    :param path: path of the csv file
+    :param bom_allowed: whether a UTF-8 byte order mark is stripped by the loader
+    :param row_size: size from which an open quote is reported as unterminated
+    :return: FileReport
+    """
+    report = FileReport(path=str(path))
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    with open(path, "rb") as source:
+        head = source.read(4)
+        if head.startswith(wide_boms):
+            report.bom = "UTF-16/32"
+            report.errors.append("is UTF-16 or UTF-32 encoded, convert it to UTF-8")
+            return report
+        if head.startswith(codecs.BOM_UTF8):
+            report.bom = "UTF-8"
+            (report.warnings if bom_allowed else report.errors).append(
+                "starts with a UTF-8 byte order mark"
+            )
+        source.seek(0)
+        pending, quotes, first_line, number = b"", 0, 1, 0
+        for line in source:
+            number += 1
+            if report.invalid_line is None:
+                try:
+                    decoder.decode(line)
+                except UnicodeDecodeError:
+                    report.invalid_line = number
+            if report.unterminated_line is not None:
+                continue
+            if not pending:
+                first_line = number
+            pending += line
+            quotes += line.count(b'"')
+            if quotes % 2:
+                if len(pending) > row_size:
+                    report.unterminated_line = first_line
+                continue
+            check_row(report, pending, first_line)
+            pending, quotes = b"", 0
+        if pending and report.unterminated_line is None:
+            report.unterminated_line = first_line
+        try:
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            report.invalid_line = report.invalid_line or number
+    summarize(report)
+    return report
+
+
+def check_row(report, row, line):
+    if line == 1:
+        report.columns = chunks.header_columns(row.decode("utf-8-sig", "replace"))
+        if not report.columns:
+            report.errors.append("has no header")
+        return
+    report.rows += 1
+    if field_count(row) != len(report.columns):
+        report.ragged += 1
+        if len(report.ragged_lines) < sample_lines:
+            report.ragged_lines.append(line)
+
+
+def summarize(report):
+    if report.ragged:
+        lines = ", ".join(str(line) for line in report.ragged_lines)
+        report.errors.append(
+            f"has {report.ragged} rows without {len(report.columns)} columns "
+            f"(lines {lines}{', ...' if report.ragged > len(report.ragged_lines) else ''})"
+        )
+    if report.invalid_line is not None:
+        report.errors.append(f"is not valid UTF-8 from line {report.invalid_line}")
+    if report.unterminated_line is not None:
+        report.errors.append(
+            f"has an unterminated quote from line {report.unterminated_line}"
+        )
+    if not report.columns and not report.errors:
+        report.errors.append("is empty")
+
+
+def check_group(table, reports, combined=False):
+    """Report files whose header differs from the first file of their group
+
+    :param table: name of the table group
+    :param reports: FileReports of the files of the group
+    :param combined: whether the group is combined into one table
+    :return:
+    """
+    reports = [report for report in reports if report.columns]
+    for report in reports[1:]:
+        expected, columns = reports[0].columns, report.columns
+        if columns == expected:
+            continue
+        missing = [c for c in expected if c not in columns]
+        extra = [c for c in columns if c not in expected]
+        problem = (
+            f"has a header different from {reports[0].path} of {table}"
+            + (f", missing {missing}" if missing else "")
+            + (f", extra {extra}" if extra else "")
+            + ("" if missing or extra else ", columns are in a different order")
+        )
+        (report.errors if combined else report.warnings).append(problem)
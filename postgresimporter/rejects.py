@@ -0,0 +1,161 @@
+import csv
+import io
+import json
+import logging
+from dataclasses import dataclass
+
+from . import utils
+
+logger = logging.getLogger("rejects")
+
+table = "import._rejects"
+destinations = ["table", "file"]
+
+create_table = f"""CREATE TABLE IF NOT EXISTS {table} (
+    target text NOT NULL,
+    source text NOT NULL,
+    line bigint NOT NULL,
+    reason text NOT NULL,
+    raw bytea,
+    rejected_at timestamp with time zone NOT NULL DEFAULT now()
+)"""
+
+
+@dataclass()
+class Reject:
+    line: int
+    reason: str
+    raw: bytes
+
+
+def split_rows(data):
+    """Split a csv buffer into raw rows, keeping quoted newlines inside their row
+
+    :param data: csv buffer starting at a row boundary
+    :return: list of raw rows including their line terminators
+    """
+    rows, start, quoted = list(), 0, False
+    position = 0
+    while True:
+        newline = data.find(b"\n", position)
+        if newline < 0:
+            break
+        quoted ^= data.count(b'"', position, newline) % 2 == 1
+        position = newline + 1
+        if not quoted:
+            rows.append(data[start:position])
+            start = position
+    if start < len(data):
+        rows.append(data[start:])
+    return rows
+
+
+def _check_row(text, columns):
+    try:
+        fields = list(csv.reader(io.StringIO(text), strict=True))
+    except csv.Error as e:
+        return f"malformed row: {e}"
+    if len(fields) != 1:
+        return "malformed row: unterminated quote"
+    if len(fields[0]) != columns:
+        return f"expected {columns} columns, got {len(fields[0])}"
+    return None
+
+
+def validate_csv(data, columns, first_line):
+    """Separate the valid rows of a csv chunk from malformed ones
+
+    The whole chunk is checked at once first, rows are only checked one by
+    one if the chunk contains a problem.
+
+    :param data: csv chunk of complete rows
+    :param columns: expected number of columns per row
+    :param first_line: line number of the first row of the chunk
+    :return: tuple of the valid rows (bytes) and a list of rejects
+    """
+    try:
+        rows = list(csv.reader(io.StringIO(data.decode("utf-8")), strict=True))
+        if all(len(row) == columns for row in rows):
+            return data, list()
+    except (UnicodeDecodeError, csv.Error):
+        pass
+
+    valid, rejected, line = list(), list(), first_line
+    for raw in split_rows(data):
+        try:
+            text = raw.decode("utf-8")
+            reason = _check_row(text, columns) if text.strip() else None
+        except UnicodeDecodeError as e:
+            reason = f"invalid encoding: {e.reason} at byte {e.start}"
+        if reason:
+            rejected.append(Reject(line, reason, raw))
+        elif text.strip():
+            # Blank lines are dropped, COPY would read them as a row of NULLs
+            valid.append(raw)
+        line += raw.count(b"\n")
+    return b"".join(valid), rejected
+
+
+def setup_statements():
+    return ["CREATE SCHEMA IF NOT EXISTS import", create_table]
+
+
+columns = ["target", "source", "line", "reason", "raw"]
+
+
+def reset(source, first_line=None, last_line=None):
+    """Statement removing the rejects of a source
+
+    :param source: path of the source file
+    :param first_line: optional first line of the range to remove
+    :param last_line: optional last line of the range to remove
+    :return: sql statement
+    """
+    condition = f"source = {utils.sql_literal(source)}"
+    if first_line is not None:
+        condition += f" AND line BETWEEN {int(first_line)} AND {int(last_line)}"
+    return f"DELETE FROM {table} WHERE {condition}"
+
+
+def encode_csv(target, source, rejected):
+    """Rejected rows in the csv format of COPY import._rejects FROM STDIN
+
+    :param target: qualified name of the target table
+    :param source: path of the source file
+    :param rejected: list of rejects
+    :return: csv data (bytes) of the columns
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for reject in rejected:
+        writer.writerow(
+            [target, source, reject.line, reject.reason, "\\x" + reject.raw.hex()]
+        )
+    return buffer.getvalue().encode("utf-8")
+
+
+def sidecar(source):
+    return str(source) + ".rejects.jsonl"
+
+
+def write_sidecar(source, rejected, append=True):
+    """Append rejected rows to a json lines file next to the source
+
+    :param source: path of the source file
+    :param rejected: list of rejects
+    :param append: whether to keep rejects written for earlier chunks
+    :return:
+    """
+    with open(sidecar(source), "a" if append else "w", encoding="utf-8") as f:
+        for reject in rejected:
+            f.write(
+                json.dumps(
+                    dict(
+                        line=reject.line,
+                        reason=reject.reason,
+                        raw=reject.raw.decode("utf-8", errors="backslashreplace"),
+                    ),
+                    ensure_ascii=False,
+                )
+                + "\n"
+            )
@@ -0,0 +1,114 @@
+import csv
+import io
+import json
+import logging
+import re
+
+from . import pgbinary, utils
+
+logger = logging.getLogger("schema")
+
+copy_formats = ["csv", "binary"]
+
+integer_pattern = re.compile(r"^-?(0|[1-9]\d{0,17})$")
+decimal_pattern = re.compile(r"^-?(0|[1-9]\d*)\.\d+$")
+
+# Candidate types from the most to the least specific
+candidates = [
+    ("boolean", lambda v: v.lower() in ("true", "false", "t", "f")),
+    ("bigint", integer_pattern.match),
+    ("numeric", lambda v: integer_pattern.match(v) or decimal_pattern.match(v)),
+    ("date", pgbinary.date_pattern.match),
+    ("timestamp", lambda v: _timestamp_offset(v) is False),
+    ("timestamp with time zone", lambda v: _timestamp_offset(v) is not None),
+]
+
+
+def _timestamp_offset(value):
+    """Whether a timestamp has an offset, or None if it is not a timestamp"""
+    match = pgbinary.timestamp_pattern.match(value)
+    if not match:
+        return None
+    return match.group(8) is not None
+
+
+def load(path):
+    """Load a schema file mapping table names to column types
+
+    The file is a json object like {"table": {"column": "bigint", ...}, ...}.
+    Tables are matched by file stem or by the name of their table group.
+
+    :param path: path of the json schema file
+    :return: dict of table names to dicts of column names to types
+    """
+    with open(path, encoding="utf-8") as schema_file:
+        tables = json.load(schema_file)
+    if not isinstance(tables, dict) or not all(
+        isinstance(columns, dict) for columns in tables.values()
+    ):
+        raise ValueError(f"{path} must map table names to objects of column types")
+    return {
+        table: {utils.to_column_name(c): str(t) for c, t in columns.items()}
+        for table, columns in tables.items()
+    }
+
+
+def table_types(schema, dump_file):
+    if not schema:
+        return None
+    for name in (dump_file.stem, utils.table_name_for_path(dump_file)):
+        if name in schema:
+            return schema[name]
+    return None
+
+
+def infer_types(file, start, columns, sample_rows=1000):
+    """Infer column types from the leading rows of a csv file
+
+    A column gets the most specific type all sampled values can be parsed as.
+    Values with leading zeros are kept as text, and empty columns stay text.
+
+    :param file: path of the csv file
+    :param start: byte offset of the first data row
+    :param columns: column names
+    :param sample_rows: number of rows to sample
+    :return: dict of column names to types
+    """
+    with open(file, "rb") as csv_file:
+        csv_file.seek(start)
+        text = io.TextIOWrapper(csv_file, encoding="utf-8", newline="")
+        rows = list()
+        for row in csv.reader(text, strict=True):
+            if len(rows) >= sample_rows:
+                break
+            if row:
+                rows.append(row)
+
+    types = dict()
+    for i, column in enumerate(columns):
+        values = [row[i].strip() for row in rows if i < len(row) and row[i].strip()]
+        types[column] = "text"
+        if not values:
+            continue
+        for pg_type, matches in candidates:
+            if all(matches(value) for value in values):
+                types[column] = pg_type
+                break
+    return types
+
+
+def column_definition(columns, types):
+    return ", ".join(f'"{column}" {types.get(column, "text")}' for column in columns)
+
+
+def binary_types(columns, types):
+    """Canonical types of the columns if all of them can be encoded in binary
+
+    :param columns: column names
+    :param types: dict of column names to types
+    :return: list of canonical types or None
+    """
+    canonical = [pgbinary.normalize_type(types.get(c, "text")) for c in columns]
+    if None in canonical:
+        return None
+    return canonical
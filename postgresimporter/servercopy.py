@@ -0,0 +1,55 @@
+import json
+import logging
+from pathlib import Path
+
+from . import exec, utils
+
+logger = logging.getLogger("servercopy")
+
+
+def server_path(path, mappings):
+    """Path of a local file on the database server
+
+    :param path: local path of the file
+    :param mappings: list of (local directory, server directory)
+    :return: server path or None if no mapping contains the file
+    """
+    path = Path(path).absolute()
+    matches = [
+        (local, server)
+        for local, server in mappings or []
+        if path == local or local in path.parents
+    ]
+    if not matches:
+        return None
+    local, server = max(matches, key=lambda m: len(m[0].parts))
+    return str(server.joinpath(*path.relative_to(local).parts))
+
+
+async def readable_size(db_options, path):
+    """Size of a file as the database server sees it
+
+    Reading server files requires superuser or the pg_read_server_files role.
+
+    :param db_options: psql connection options
+    :param path: server path of the file
+    :return: size in bytes or None if the server cannot read the file
+    """
+    stdout, stderr = await exec.exec_sql(
+        db_options,
+        command=f"SELECT (pg_stat_file({utils.sql_literal(path)}, true)).size AS size",
+        sync=True,
+    )
+    try:
+        return json.loads(stdout or "null")[0]["size"]
+    except (json.decoder.JSONDecodeError, TypeError, KeyError, IndexError):
+        logger.debug(stderr)
+        return None
+
+
+def copy_statement(table, columns, path, freeze=False):
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    return (
+        f"COPY {table} ({column_list}) FROM {utils.sql_literal(path)} "
+        "WITH (FORMAT csv, HEADER, ENCODING 'UTF8'" + (", FREEZE)" if freeze else ")")
+    )
@@ -0,0 +1,88 @@
+import json
+import logging
+import os
+import time
+import zipfile
+from pathlib import Path
+
+from . import extract
+
+logger = logging.getLogger("staging")
+
+manifest_name = ".postgresimporter-manifest.json"
+
+
+def extracted_size(src):
+    """Bytes an archive takes once it is extracted"""
+    with zipfile.ZipFile(src) as archive:
+        return sum(info.file_size for info in archive.infolist() if not info.is_dir())
+
+
+def next_batch(archives, budget, used=0):
+    """Archives to extract together so the extracted files fit the budget
+
+    An archive that is larger than the remaining budget is extracted on its own.
+
+    :param archives: list of (archive, destination, extracted size)
+    :param budget: staging budget in bytes
+    :param used: bytes taken by extracted files that were kept
+    :return: list of (archive, destination, extracted size) from the start
+    """
+    batch, size = list(), used
+    for archive in archives:
+        if batch and size + archive[2] > budget:
+            break
+        batch.append(archive)
+        size += archive[2]
+    if size > budget:
+        logger.warning(
+            f"{batch[0][0]} needs {batch[0][2]} bytes, which exceeds the remaining "
+            f"staging budget of {max(0, budget - used)} bytes"
+        )
+    return batch
+
+
+def members(src, dest):
+    """Zip entries of the extracted files of an archive
+
+    :param src: path of the zip archive
+    :param dest: destination directory
+    :return: dict of extracted paths to their zip info
+    """
+    with zipfile.ZipFile(src) as archive:
+        return {
+            extract.member_path(dest, info).absolute(): info
+            for info in archive.infolist()
+            if not info.is_dir() and extract.member_path(dest, info) is not None
+        }
+
+
+def load_manifest(dest):
+    try:
+        with open(Path(dest) / manifest_name, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return dict()
+
+
+def record(dest, path, info, rows):
+    """Replace a loaded and verified file by its entry in the manifest
+
+    :param dest: destination directory the file was extracted to
+    :param path: path of the extracted file
+    :param info: zip info of the file
+    :param rows: number of rows loaded from the file
+    :return:
+    """
+    manifest = load_manifest(dest)
+    manifest[Path(path).relative_to(Path(dest).absolute()).as_posix()] = dict(
+        size=info.file_size,
+        crc=info.CRC,
+        rows=rows,
+        loaded_at=time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    )
+    partial = Path(dest) / (manifest_name + ".part")
+    with open(partial, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(partial, Path(dest) / manifest_name)
+    Path(path).unlink()
@@ -0,0 +1,75 @@
+from pathlib import Path
+
+import jinja2
+
+from . import utils
+
+extension = "j2"
+
+
+def quote_ident(name):
+    return '"%s"' % str(name).replace('"', '""')
+
+
+def find(sources):
+    """Hook templates in directories or files
+
+    :param sources: list of directories or files
+    :return: sorted list of template paths
+    """
+    return sorted(
+        Path(template)
+        for source in sources or []
+        for template in utils.files_in(source, of_type=extension)
+    )
+
+
+def environment(directory):
+    """Jinja2 environment loading included templates next to a hook template
+
+    Undefined variables are errors instead of empty strings, so a typo does
+    not silently run a different statement.
+    """
+    env = jinja2.Environment(
+        loader=jinja2.FileSystemLoader(str(directory)),
+        undefined=jinja2.StrictUndefined,
+        keep_trailing_newline=True,
+    )
+    env.filters.update(ident=quote_ident, literal=utils.sql_literal)
+    return env
+
+
+def hook_variables(table, files, columns, types, combined=False):
+    """Variables of the hook template of a table group
+
+    :param table: name of the table group
+    :param files: source files of the table group
+    :param columns: header columns of the first file
+    :param types: dict of column names to their types
+    :param combined: whether the files are combined into import.<table>
+    :return: dict of template variables
+    """
+    return dict(
+        table=table,
+        files=[str(f) for f in files],
+        file_tables=[Path(f).stem for f in files],
+        columns=list(columns),
+        types={column: types.get(column, "text") for column in columns},
+        combined=combined,
+    )
+
+
+def render(template, variables):
+    """Render a hook template for a table group
+
+    :param template: path of the template
+    :param variables: template variables
+    :return: sql script, blank if the template skips the table
+    """
+    template = Path(template)
+    return environment(template.parent).get_template(template.name).render(**variables)
+
+
+def hook_name(template, table):
+    """Name identifying the rendered hook of a table in import._hooks"""
+    return f"{template}[{table}]"
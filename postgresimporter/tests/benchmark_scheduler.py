@@ -0,0 +1,248 @@
+"""
+Micro-benchmarks of scheduling and supervising processes, without a database
+
+Processes are simulated with configurable durations and output rates, so the
+overhead of exec.run_simultaneously, Loader.check_progress and
+Loader.update_progress can be measured for many thousands of jobs.
+
+Usage: PYTHONPATH=. python postgresimporter/tests/benchmark_scheduler.py --processes 10000
+"""
+import argparse
+import asyncio
+import bisect
+import logging
+import os
+import random
+import time
+import tracemalloc
+import unittest.mock
+from argparse import Namespace
+
+from prettytable import PrettyTable
+
+from postgresimporter import exec
+from postgresimporter.main import Loader, ProgressBar, UnknownLength
+
+# The progress bar is updated as usual, but nothing is drawn
+devnull = open(os.devnull, "w")
+
+
+class FakeStream:
+    def __init__(self, process):
+        self.process = process
+
+    async def read(self, _size=-1):
+        process = self.process
+        if process.returncode is not None:
+            return b""
+        if process.simulation.output_interval > 0:
+            await asyncio.wait(
+                {process.exited}, timeout=process.simulation.output_interval
+            )
+        elapsed = time.perf_counter() - process.started
+        percent = min(100.0, 100.0 * elapsed / max(process.duration, 1e-9))
+        return f"{percent:.2f}% 0.01 GiB / 0.10 GiB\n".encode()
+
+    readline = read
+
+
+class FakeProcess:
+    """Process that exits after its duration and writes progress like pgfutter"""
+
+    def __init__(self, simulation, duration):
+        self.simulation, self.duration = simulation, duration
+        self.returncode, self.pid = None, 0
+        self.started = time.perf_counter()
+        self.exited = asyncio.get_event_loop().create_future()
+        self.stdout = self.stderr = FakeStream(self)
+        asyncio.get_event_loop().call_later(duration, self.exit, 0)
+
+    def exit(self, returncode):
+        if self.returncode is None:
+            self.returncode, self.exit_time = returncode, time.perf_counter()
+            self.simulation.exits.append(self.exit_time)
+            self.exited.set_result(returncode)
+
+    async def communicate(self, _input=None):
+        await self.exited
+        self.simulation.handled.append(time.perf_counter() - self.exit_time)
+        return b"", b""
+
+    async def wait(self):
+        return await self.exited
+
+    def terminate(self):
+        self.exit(-15)
+
+    kill = terminate
+
+
+class Simulation:
+    def __init__(self, duration=0.01, jitter=0.5, output_interval=0.0, seed=0):
+        self.duration, self.jitter = duration, jitter
+        self.output_interval = output_interval
+        self.random = random.Random(seed)
+        self.spawns, self.exits, self.handled = list(), list(), list()
+
+    async def create_subprocess_exec(self, *_args, **_kwargs):
+        self.spawns.append(time.perf_counter())
+        duration = self.duration * self.random.uniform(1 - self.jitter, 1 + self.jitter)
+        return FakeProcess(self, duration)
+
+
+def percentiles(values, *quantiles):
+    values = sorted(values) or [0.0]
+    return [values[min(len(values) - 1, int(q * len(values)))] for q in quantiles]
+
+
+async def supervised(simulation, processes, concurrency=None):
+    """Processes of import_data: enqueued at once and polled by check_progress"""
+    loader = Loader(Namespace(), progress=True)
+    loader.queue = asyncio.PriorityQueue()
+    commands = [("pgfutter", ["csv", f"/data/file_{i}.csv"]) for i in range(processes)]
+    await exec.run_simultaneously(commands, queue=loader.queue)
+    await loader.check_progress(
+        output_handler=loader.import_received_output,
+        completion_handler=loader.import_completed,
+    )
+
+
+async def bounded(simulation, processes, concurrency=None):
+    """Processes of run_simultaneously with a concurrency limit"""
+    commands = [("psql", ["-c", f"SELECT {i}"]) for i in range(processes)]
+    await exec.run_simultaneously(
+        commands, max_concurrency=concurrency or os.cpu_count() or 1
+    )
+
+
+scenarios = dict(supervised=supervised, bounded=bounded)
+
+
+def measure(scenario, processes, concurrency=None, memory=True, **simulated):
+    """Run a scenario with simulated processes
+
+    :param scenario: name of the scenario (supervised or bounded)
+    :param processes: number of processes
+    :param concurrency: maximum number of processes at once (bounded only)
+    :param memory: whether to trace allocations, which slows down the run
+    :param simulated: keyword arguments of the Simulation
+    :return: dict of measurements, latencies in seconds
+    """
+    simulation = Simulation(**simulated)
+    Loader.bar = ProgressBar(max_value=UnknownLength, fd=devnull)
+    Loader.progress_interval, Loader.queue_timeout = 0.0, 0.1
+    Loader.load_done, Loader.load_total = dict(), processes
+    previous, loop = asyncio.get_event_loop(), asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    if memory:
+        tracemalloc.start()
+    start, cpu = time.perf_counter(), time.process_time()
+    try:
+        with unittest.mock.patch(
+            "asyncio.create_subprocess_exec", new=simulation.create_subprocess_exec
+        ):
+            loop.run_until_complete(
+                scenarios[scenario](simulation, processes, concurrency)
+            )
+        cpu, wall = time.process_time() - cpu, time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if memory else None
+    finally:
+        if memory:
+            tracemalloc.stop()
+        loop.close()
+        asyncio.set_event_loop(previous)
+        Loader.progress_interval, Loader.queue_timeout = 0.5, 10.0
+
+    exits, handoffs = sorted(simulation.exits), list()
+    for spawn in simulation.spawns[concurrency or processes :]:
+        # Time from the last exit that freed a slot to this start
+        freed = bisect.bisect_right(exits, spawn)
+        if freed:
+            handoffs.append(spawn - exits[freed - 1])
+    return dict(
+        scenario=scenario,
+        processes=processes,
+        completed=len(simulation.handled),
+        wall=wall,
+        cpu_per_job=cpu / max(processes, 1),
+        start_latency=percentiles([s - start for s in simulation.spawns], 0.5, 0.99),
+        handoff=percentiles(handoffs, 0.5, 0.99),
+        exit_to_handled=percentiles(simulation.handled, 0.5, 0.99),
+        memory_per_job=peak / max(processes, 1) if memory else None,
+    )
+
+
+def report(results):
+    header = [
+        "scenario",
+        "processes",
+        "completed",
+        "wall s",
+        "cpu/job ms",
+        "start p50/p99 ms",
+        "handoff p50/p99 ms",
+        "exit to handled p50/p99 ms",
+        "memory/job KiB",
+    ]
+    table = PrettyTable(header)
+    for column in header:
+        table.align[column] = "l"
+    for r in results:
+        table.add_row(
+            [
+                r["scenario"],
+                r["processes"],
+                r["completed"],
+                f"{r['wall']:.2f}",
+                f"{r['cpu_per_job'] * 1e3:.3f}",
+                "/".join(f"{v * 1e3:.1f}" for v in r["start_latency"]),
+                "/".join(f"{v * 1e3:.2f}" for v in r["handoff"]),
+                "/".join(f"{v * 1e3:.1f}" for v in r["exit_to_handled"]),
+                f"{r['memory_per_job'] / 1024:.1f}" if r["memory_per_job"] else "-",
+            ]
+        )
+    return str(table)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--scenario", choices=sorted(scenarios), action="append", dest="scenarios"
+    )
+    parser.add_argument("--processes", type=int, action="append", dest="counts")
+    parser.add_argument("--concurrency", type=int, default=os.cpu_count() or 1)
+    parser.add_argument(
+        "--duration", type=float, default=0.01, help="mean seconds per process"
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.5, help="relative spread of the durations"
+    )
+    parser.add_argument(
+        "--output-interval",
+        type=float,
+        default=0.0,
+        help="seconds between progress lines of a process",
+    )
+    parser.add_argument(
+        "--no-memory", action="store_true", help="do not trace allocations"
+    )
+    args = parser.parse_args()
+    logging.getLogger("loader").setLevel(logging.ERROR)
+    results = [
+        measure(
+            scenario,
+            processes,
+            concurrency=args.concurrency if scenario == "bounded" else None,
+            memory=not args.no_memory,
+            duration=args.duration,
+            jitter=args.jitter,
+            output_interval=args.output_interval,
+        )
+        for scenario in args.scenarios or sorted(scenarios)
+        for processes in args.counts or [1000, 10000]
+    ]
+    print(report(results))
+
+
+if __name__ == "__main__":
+    main()
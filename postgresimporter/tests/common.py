@@ -16,6 +16,9 @@ from postgresimporter.main import Loader
 
 logging.getLogger("loader").setLevel(logging.FATAL)
 
+# Start the worker processes before tests patch the file system with pyfakefs
+Loader.executor.submit(int).result()
+
 noop = asyncio.coroutine(lambda: None)()
 
 
@@ -182,11 +185,17 @@ class BaseTest(unittest.TestCase):
             yield [pathlib.Path(os.path.commonprefix(mock_files or []))]
 
     @staticmethod
-    def load(paths, **args):
+    def loader(**args):
         default_args = dict(
             pre_load=list(),
             post_load=list(),
+            table_hooks=list(),
+            hook_concurrency=None,
+            # Hooks always run, unless a test checks their fingerprints
+            force_hooks=True,
             disable_unzip=True,
+            unzip_concurrency=None,
+            staging_budget=None,
             disable_check=True,
             disable_import=True,
             combine_tables=False,
@@ -196,10 +205,59 @@ class BaseTest(unittest.TestCase):
             db_port=None,
             db_user=None,
             db_password=None,
+            targets=None,
+            fan_out_queue=2,
             exclude_regex=None,
+            json_mode="jsonb",
+            json_sample_lines=1000,
+            json_batch_lines=10000,
+            dedup=False,
+            dedup_keys=None,
+            dedup_partitions=2,
+            dedup_memory_rows=1000000,
+            dedup_bloom=None,
+            dedup_dir=None,
+            merge_keys=None,
+            merge_batch_rows=1000000,
+            delta_keys=None,
+            delta_dir=None,
+            preflight=False,
+            distributed=False,
+            node_name=None,
+            node_slots=1,
+            lease=60.0,
+            normalize=None,
+            keep_columns=None,
+            where=None,
+            samples=None,
+            convert_columns=None,
+            convert_sample_rows=1000,
+            schema=None,
+            infer_types=False,
+            infer_sample_rows=1000,
+            copy_format="csv",
+            max_streams=None,
+            min_streams=1,
+            adaptive_streams=False,
+            adaptive_interval=5.0,
+            max_bytes_per_second=None,
+            max_rows_per_second=None,
+            table_rates=None,
+            throttle_file=None,
+            server_paths=None,
+            freeze=False,
+            chunk_size=None,
+            resume=False,
+            drain_timeout=60.0,
+            max_rejects=None,
+            rejects_to="table",
+            watch=False,
+            watch_interval=5.0,
+            watch_settle_time=10.0,
+            watch_polling=False,
         )
-        run_sync(
-            Loader(Namespace(**{**default_args, **args}), progress=False).load,
-            paths,
-            timeout=100,
-        )
+        return Loader(Namespace(**{**default_args, **args}), progress=False)
+
+    @classmethod
+    def load(cls, paths, **args):
+        run_sync(cls.loader(**args).load, paths, timeout=100)
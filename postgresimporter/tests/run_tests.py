@@ -6,15 +6,55 @@ import test_runner
 
 def test_cases(**_kwargs):
 
+    import test_benchmark
+    import test_chunks
     import test_cli
+    import test_concurrency
+    import test_conversions
+    import test_dedup
+    import test_delta
+    import test_filters
+    import test_fingerprints
+    import test_jobs
     import test_load
+    import test_merge
+    import test_ndjson
+    import test_normalize
+    import test_pgbinary
+    import test_preflight
+    import test_servercopy
+    import test_staging
+    import test_templates
+    import test_throttle
     import test_unzip
+    import test_watch
+    import test_workers
 
     cases = list()
     cases += [
+        test_benchmark.BenchmarkTest,
+        test_chunks.ChunksTest,
         test_cli.CLITest,
+        test_concurrency.ConcurrencyTest,
+        test_conversions.ConversionsTest,
+        test_dedup.DedupTest,
+        test_delta.DeltaTest,
+        test_filters.FiltersTest,
+        test_fingerprints.FingerprintsTest,
+        test_jobs.JobsTest,
         test_load.LoadTest,
+        test_merge.MergeTest,
+        test_ndjson.NDJSONTest,
+        test_normalize.NormalizeTest,
+        test_pgbinary.PgBinaryTest,
+        test_preflight.PreflightTest,
+        test_servercopy.ServerCopyTest,
+        test_staging.StagingTest,
+        test_templates.TemplatesTest,
+        test_throttle.ThrottleTest,
         test_unzip.UnzipTest,
+        test_watch.WatchTest,
+        test_workers.WorkersTest,
     ]
     return cases
 
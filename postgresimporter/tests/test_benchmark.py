@@ -0,0 +1,20 @@
+import benchmark_scheduler
+import common
+
+
+class BenchmarkTest(common.BaseTest):
+    def test_simulates_processes(self):
+        """Test if the scheduling benchmarks complete every simulated process
+
+        :return:
+        """
+        supervised = benchmark_scheduler.measure(
+            "supervised", 50, memory=False, duration=0.001, output_interval=0.001
+        )
+        self.assertEqual(supervised["completed"], 50)
+        bounded = benchmark_scheduler.measure(
+            "bounded", 50, concurrency=4, duration=0.001
+        )
+        self.assertEqual(bounded["completed"], 50)
+        self.assertGreater(bounded["memory_per_job"], 0)
+        self.assertIn("bounded", benchmark_scheduler.report([supervised, bounded]))
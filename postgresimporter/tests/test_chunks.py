@@ -0,0 +1,294 @@
+import pathlib
+import unittest.mock
+
+import common
+
+from postgresimporter import checkpoints, chunks, exec, ndjson, rejects
+
+
+class ChunksTest(common.BaseTest):
+    def test_splits_on_row_boundaries(self):
+        """Test if chunks never split a quoted newline
+
+        :return:
+        """
+        data = b'a,"x\n""y"""\nb,c\n"d\n'
+        self.assertEqual(chunks.csv_row_boundary(data), 16)
+        self.assertEqual(chunks.csv_rows(data[:16]), 2)
+        self.assertEqual(chunks.csv_row_boundary(b'"open\nrow'), 0)
+
+        with self.create_mock_files([]):
+            path = pathlib.Path("/test/a.csv")
+            path.parent.mkdir()
+            path.write_bytes(b'h1,h2\n1,"a\nb"\n2,c\n3,d')
+            columns, start = chunks.read_header(path)
+            self.assertEqual((columns, start), (["h1", "h2"], 6))
+            self.assertEqual(
+                [
+                    (c.index, c.start, c.end, c.rows)
+                    for c in chunks.read_chunks(path, 4, start=start)
+                ],
+                [(0, 6, 14, 1), (1, 14, 18, 1), (2, 18, 21, 1)],
+            )
+
+    def test_resumes_after_last_checkpoint(self):
+        """Test if --resume continues a file after its last committed chunk
+
+        :return:
+        """
+        with self.create_mock_files([]):
+            path = pathlib.Path("/test/a.csv")
+            path.parent.mkdir()
+            path.write_bytes(b"h\n1\n2\n3\n")
+            stat = path.stat()
+            last = checkpoints.Checkpoint(
+                str(path), 0, 4, 1, 2, stat.st_size, stat.st_mtime
+            )
+            copied = list()
+
+            async def last_checkpoint(*_args):
+                return last
+
+            async def copy_from(db_options, table, data, **kwargs):
+                copied.append((b"".join(data), kwargs["setup"], kwargs["finish"]))
+                process = unittest.mock.Mock(returncode=0)
+                return process, b"", b""
+
+            with unittest.mock.patch(
+                "postgresimporter.checkpoints.last", new=last_checkpoint
+            ), unittest.mock.patch("postgresimporter.exec.copy_from", new=copy_from):
+                loader = self.loader(chunk_size=2, resume=True)
+                common.run_sync(loader.import_chunked, path)
+
+            self.assertEqual([data for data, _, _ in copied], [b"2\n", b"3\n"])
+            # The table is not recreated when resuming
+            self.assertFalse(
+                any("DROP TABLE" in s for _, setup, _ in copied for s in setup)
+            )
+            self.assertIn(
+                "VALUES ('/test/a.csv', 1, 'import.a', 4, 6, 1, 3", copied[0][2][0]
+            )
+
+    def test_resumes_targets_at_different_checkpoints(self):
+        """Test if targets that committed different chunks all receive the rest
+
+        :return:
+        """
+        with self.create_mock_files([]):
+            path = pathlib.Path("/test/a.csv")
+            path.parent.mkdir()
+            path.write_bytes(b"h\n" + b"".join(b"%d,row\n" % i for i in range(200)))
+            stat = path.stat()
+            cut = list(chunks.read_chunks(path, 100, start=2))
+            last = {
+                db_options: checkpoints.Checkpoint(
+                    str(path), c.index, c.end, c.rows, 0, stat.st_size, stat.st_mtime
+                )
+                for db_options, c in (("host=a", cut[0]), ("host=b", cut[5]))
+            }
+            copied = {"host=a": [], "host=b": []}
+
+            async def last_checkpoint(db_options, _src):
+                return last[db_options]
+
+            async def copy_from(db_options, table, data, **kwargs):
+                copied[db_options].append(b"".join(data))
+                return unittest.mock.Mock(returncode=0), b"", b""
+
+            with unittest.mock.patch(
+                "postgresimporter.checkpoints.last", new=last_checkpoint
+            ), unittest.mock.patch("postgresimporter.exec.copy_from", new=copy_from):
+                loader = self.loader(
+                    chunk_size=100, resume=True, targets=["host=a", "host=b"]
+                )
+                common.run_sync(loader.import_chunked, path)
+
+            self.assertEqual(copied["host=a"], [c.data for c in cut[1:]])
+            self.assertEqual(copied["host=b"], [c.data for c in cut[6:]])
+            self.assertEqual(
+                [
+                    (s["name"], s["failed"], s["committed"])
+                    for s in loader.load_done[str(path)]["targets"]
+                ],
+                [("host=a", False, stat.st_size), ("host=b", False, stat.st_size)],
+            )
+
+    def test_quarantines_malformed_rows(self):
+        """Test if malformed rows are rejected while valid rows are kept
+
+        :return:
+        """
+        valid = b'1,"a\nb"\n2,c\n'
+        self.assertEqual(rejects.validate_csv(valid, 2, 2), (valid, []))
+
+        data = b'1,a\n2,b,x\n\n3,\xff\n4,"d\n5,e\n'
+        kept, rejected = rejects.validate_csv(data, 2, 2)
+        self.assertEqual(kept, b"1,a\n")
+        self.assertEqual(
+            [(r.line, r.reason.split(":")[0]) for r in rejected],
+            [
+                (3, "expected 2 columns, got 3"),
+                (5, "invalid encoding"),
+                (6, "malformed row"),
+            ],
+        )
+
+        rejected = list()
+        self.assertEqual(
+            ndjson.encode_chunk(b'{"a": 1}\n{"a": \n\n[1]\n', rejected=rejected),
+            b'{"a": 1}\n[1]\n',
+        )
+        self.assertEqual([r.line for r in rejected], [2])
+
+    def test_copies_rejects_into_their_table(self):
+        """Test if rejects are copied into import._rejects ahead of their chunk,
+        replacing the rejects of the same lines
+
+        :return:
+        """
+        with self.create_mock_files([]):
+            path = pathlib.Path("/test/a.csv")
+            path.parent.mkdir()
+            path.write_bytes(b"h1,h2\n1,a\n2,b,x\n3,c\n4,d\n5,e,y\n")
+            copied = list()
+
+            async def copy_from(db_options, table, data, **kwargs):
+                copied.append((table, b"".join(data), kwargs["setup"]))
+                return unittest.mock.Mock(returncode=0), b"", b""
+
+            with unittest.mock.patch("postgresimporter.exec.copy_from", new=copy_from):
+                loader = self.loader(chunk_size=10, max_rejects=5)
+                loader.reset()
+                common.run_sync(loader.import_chunked, path)
+
+            self.assertEqual(
+                [(table, data) for table, data, _ in copied],
+                [
+                    (
+                        rejects.table,
+                        b'import.a,/test/a.csv,3,"expected 2 columns, '
+                        b'got 3",\\x322c622c780a\n',
+                    ),
+                    ("import.a", b"1,a\n"),
+                    ("import.a", b"3,c\n4,d\n"),
+                    (
+                        rejects.table,
+                        b'import.a,/test/a.csv,6,"expected 2 columns, '
+                        b'got 3",\\x352c652c790a\n',
+                    ),
+                    ("import.a", b""),
+                ],
+            )
+            self.assertEqual(
+                copied[0][2][-1],
+                "DELETE FROM import._rejects WHERE source = '/test/a.csv'",
+            )
+            self.assertTrue(copied[3][2][-1].endswith("AND line BETWEEN 6 AND 6"))
+
+    def test_fans_out_to_multiple_targets(self):
+        """Test if chunks are read once and committed to every target separately
+
+        :return:
+        """
+        with self.create_mock_files([]):
+            path = pathlib.Path("/test/a.csv")
+            path.parent.mkdir()
+            path.write_bytes(b"h\n1\n2\n3\n")
+            copied = {"host=a": [], "host=b": []}
+
+            async def copy_from(db_options, table, data, **kwargs):
+                copied[db_options].append(b"".join(data))
+                failed = db_options == "host=b" and len(copied[db_options]) > 1
+                process = unittest.mock.Mock(returncode=1 if failed else 0)
+                return process, b"", b"failed" if failed else b""
+
+            with unittest.mock.patch("postgresimporter.exec.copy_from", new=copy_from):
+                loader = self.loader(chunk_size=2, targets=["host=a", "host=b"])
+                with unittest.mock.patch.object(
+                    chunks, "read_chunks", wraps=chunks.read_chunks
+                ) as reader:
+                    common.run_sync(loader.import_chunked, path)
+                    reader.assert_called_once()
+
+            self.assertEqual(copied["host=a"], [b"1\n", b"2\n", b"3\n"])
+            self.assertEqual(copied["host=b"], [b"1\n", b"2\n"])
+            self.assertEqual(
+                [
+                    (s["name"], s["failed"], s["committed"])
+                    for s in loader.load_done[str(path)]["targets"]
+                ],
+                [("host=a", False, 8), ("host=b", True, 6)],
+            )
+
+    def test_loads_into_a_single_target(self):
+        """Test if a single --target receives csv and json files instead of the default database
+
+        :return:
+        """
+        with self.create_mock_files([]):
+            pathlib.Path("/test").mkdir()
+            files = [pathlib.Path("/test/a.csv"), pathlib.Path("/test/b.jsonl")]
+            files[0].write_bytes(b"h\n1\n")
+            files[1].write_bytes(b'{"h": 1}\n')
+            copied = list()
+
+            async def copy_from(db_options, table, data, **kwargs):
+                copied.append((db_options, table))
+                return unittest.mock.Mock(returncode=0), b"", b""
+
+            with unittest.mock.patch(
+                "postgresimporter.exec.copy_from", new=copy_from
+            ), unittest.mock.patch("postgresimporter.exec.run") as run:
+                loader = self.loader(targets=["host=a"])
+                self.assertTrue(loader.streaming)
+                common.run_sync(loader.import_data, {"a": files[:1], "b": files[1:]})
+                run.assert_not_called()
+            self.assertEqual(
+                sorted(copied), [("host=a", "import.a"), ("host=a", "import.b")]
+            )
+
+    def test_freezes_rows_of_created_tables(self):
+        """Test if --freeze copies every file in the transaction creating its table
+        and rolls back files that are not read completely
+
+        :return:
+        """
+        with self.create_mock_files([]):
+            path = pathlib.Path("/test/a.csv")
+            path.parent.mkdir()
+            path.write_bytes(b"h,i\n1,a\n2,b\n3,c,x\n4,d\n")
+            copied = list()
+
+            async def copy_from(db_options, table, data, **kwargs):
+                if not hasattr(data, "__aiter__"):
+                    data = exec.iterate(data)
+                parts = [part async for part in data]
+                copied.append((table, parts, kwargs))
+                return unittest.mock.Mock(returncode=0), b"", b""
+
+            with unittest.mock.patch("postgresimporter.exec.copy_from", new=copy_from):
+                loader = self.loader(chunk_size=2, freeze=True)
+                self.assertTrue(loader.streaming)
+                loader.reset()
+                common.run_sync(loader.import_chunked, path)
+                self.assertFalse(loader.load_failed(str(path)))
+
+                self.assertEqual(len(copied), 1)
+                table, parts, kwargs = copied[0]
+                self.assertEqual(parts, [b"1,a\n", b"2,b\n", b"3,c,x\n", b"4,d\n"])
+                self.assertEqual(kwargs["options"], "FORMAT csv, FREEZE")
+                self.assertIn("DROP TABLE IF EXISTS import.a", kwargs["setup"])
+                self.assertIn(
+                    "VALUES ('/test/a.csv', 0, 'import.a', 4, 22, "
+                    "(SELECT count(*) FROM import.a)",
+                    kwargs["finish"][0],
+                )
+
+                # Exceeding the reject budget stops reading and rolls back
+                copied.clear()
+                loader = self.loader(chunk_size=2, freeze=True, max_rejects=0)
+                loader.reset()
+                with self.assertLogs("loader", level="ERROR"):
+                    common.run_sync(loader.import_chunked, path)
+                self.assertTrue(loader.load_failed(str(path)))
+                self.assertEqual([table for table, _, _ in copied], [rejects.table])
@@ -0,0 +1,87 @@
+import asyncio
+import json
+import pathlib
+import unittest.mock
+
+import common
+
+from postgresimporter import concurrency
+
+
+class ConcurrencyTest(common.BaseTest):
+    def test_limits_streams(self):
+        """Test if the limit of concurrent streams can change while in use
+
+        :return:
+        """
+        limit = concurrency.AdaptiveLimit(1)
+        running, peak = list(), list()
+
+        async def stream():
+            async with limit:
+                running.append(1)
+                peak.append(len(running))
+                await asyncio.sleep(0.01)
+                running.pop()
+
+        async def streams():
+            tasks = [asyncio.ensure_future(stream()) for _ in range(6)]
+            await asyncio.sleep(0.005)
+            await limit.set_limit(3)
+            await asyncio.gather(*tasks)
+
+        common.run_sync(streams)
+        self.assertEqual(peak[0], 1)
+        self.assertEqual(max(peak), 3)
+
+    def test_limits_files_read_at_once(self):
+        """Test if files only start reading once they get one of the stream slots
+
+        :return:
+        """
+        running, peak = list(), list()
+
+        async def import_chunked(_self, dump_file):
+            running.append(dump_file)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(dump_file)
+
+        files = [pathlib.Path(f"/test/animals_{i}.csv") for i in range(6)]
+        with unittest.mock.patch(
+            "postgresimporter.main.Loader.import_chunked", new=import_chunked
+        ):
+            loader = self.loader(max_streams=2)
+            common.run_sync(loader.import_data, dict(animals=files))
+        self.assertEqual(len(peak), 6)
+        self.assertEqual(max(peak), 2)
+
+    def test_adapts_to_congestion(self):
+        """Test if streams grow additively and shrink multiplicatively
+
+        :return:
+        """
+        limit = concurrency.AdaptiveLimit(4)
+        controller = concurrency.Controller(limit, [], minimum=2, maximum=5)
+        signals = concurrency.Signals(throughput=10e6)
+        self.assertEqual(controller.decide(signals, 4).limit, 5)
+        self.assertEqual(controller.decide(signals, 2).action, "hold")
+
+        signals = concurrency.Signals(throughput=5e6)
+        self.assertEqual(controller.decide(signals, 4).action, "hold")
+
+        decision = controller.decide(concurrency.Signals(waiting=0.8), 4)
+        self.assertEqual((decision.action, decision.limit), ("decrease", 2))
+
+        async def exec_sql(db_options, command=None, sync=False, **kwargs):
+            activity = dict(waiting=1, active=4, checkpoints=exec_sql.checkpoints)
+            return json.dumps([activity]).encode(), b""
+
+        with unittest.mock.patch("postgresimporter.exec.exec_sql", new=exec_sql):
+            controller.targets = [{}]
+            for checkpoints in (3, 5):
+                exec_sql.checkpoints = checkpoints
+                signals = concurrency.Signals()
+                common.run_sync(controller.database_signals, signals)
+        self.assertEqual((signals.waiting, signals.checkpoints), (0.25, 2))
+        self.assertIn("checkpoints", controller.congestion(signals))
@@ -0,0 +1,74 @@
+import json
+import unittest.mock
+
+import common
+
+from postgresimporter import conversions
+
+
+class ConversionsTest(common.BaseTest):
+    def test_detects_column_formats(self):
+        """Test if sampled values select the matching branch of parse_timestamp()
+
+        :return:
+        """
+        examples = {
+            "31-JAN-19 03.20.00.000000000 PM +01:00": "timestamp_fraction_offset",
+            "31-JAN-19 03.20.00 PM +01:00": "timestamp_offset",
+            "28-MAR-19 05.02.10.000000000 AM GMT": "timestamp_fraction_zone",
+            "28-MAR-19 05.02.10 AM GMT": "timestamp_zone",
+            "20190101013449+0000": "timestamp_compact",
+            "01-FEB-19": "date",
+        }
+        for value, name in examples.items():
+            self.assertEqual(conversions.detect([value, None, ""]).name, name)
+        self.assertIsNone(conversions.detect(["cat", "31-JAN-19"]))
+        self.assertIsNone(conversions.detect([None]))
+        self.assertEqual(
+            conversions.detect(["01-FEB-19"] * 9 + ["2019-02-01"]).name, "date"
+        )
+
+        self.assertEqual(
+            conversions.selected_columns(
+                [conversions.parse_rule("animals*.born")],
+                "animals_1",
+                ["name", "born"],
+            ),
+            ["born"],
+        )
+
+    def test_converts_with_single_format(self):
+        """Test if detected columns are converted directly with a fallback
+
+        :return:
+        """
+        statements = list()
+
+        async def exec_sql(db_options, command=None, sync=False, **kwargs):
+            statements.append(command)
+            if "information_schema" in command:
+                columns = [
+                    dict(column_name="name", data_type="text"),
+                    dict(column_name="born", data_type="text"),
+                    dict(column_name="age", data_type="integer"),
+                ]
+                return json.dumps(columns).encode(), b""
+            if sync:
+                sample = [dict(name="cat", born="20190101013449+0000")]
+                return json.dumps(sample).encode(), b""
+
+        with unittest.mock.patch("postgresimporter.exec.exec_sql", new=exec_sql):
+            loader = self.loader(convert_columns=[conversions.parse_rule("animals")])
+            common.run_sync(loader.convert_table, {}, "animals")
+
+        self.assertIn(
+            'SELECT "name", "born" FROM import.animals LIMIT 1000', statements
+        )
+        self.assertEqual(
+            statements[-1],
+            "DROP TABLE IF EXISTS import.animals_typed;"
+            'CREATE TABLE import.animals_typed AS SELECT "name", '
+            "CASE WHEN \"born\" ~ '^\\d\\d\\d\\d\\d\\d\\d\\d\\d\\d\\d\\d\\d\\d(\\+|-)\\d\\d\\d\\d$' "
+            "THEN to_timestamp(\"born\", 'YYYYMMDDHH24MISS TZHTZM') "
+            'ELSE parse_timestamp("born") END AS "born", "age" FROM import.animals',
+        )
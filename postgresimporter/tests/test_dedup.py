@@ -0,0 +1,116 @@
+import tempfile
+import unittest.mock
+
+import common
+
+from postgresimporter import dedup, workers
+
+
+class DedupTest(common.BaseTest):
+    def test_spills_to_disk(self):
+        """Test if duplicates are found in memory, in spilled runs and after merging
+
+        :return:
+        """
+        digests = [dedup.row_digest(str(i).encode()) for i in range(20)]
+        with tempfile.TemporaryDirectory() as directory:
+            seen = dedup.SpillingSet(
+                directory, memory_items=3, bloom_capacity=20, max_runs=2
+            )
+            self.assertTrue(all(seen.add(d) for d in digests))
+            self.assertTrue(len(seen.runs) >= 1)
+            self.assertFalse(any(seen.add(d) for d in digests))
+            self.assertTrue(seen.add(dedup.row_digest(b"new")))
+            seen.close()
+
+        bloom = dedup.BloomFilter(100)
+        bloom.add(digests[0])
+        self.assertIn(digests[0], bloom)
+        self.assertNotIn(digests[1], bloom)
+
+    def test_deduplicates_by_key(self):
+        """Test if rows with the same key end up in the same partition once
+
+        :return:
+        """
+        deduplicator = dedup.Deduplicator(partitions=3, key_indexes=[0])
+        first = deduplicator.filter(b"1\ta\n2\tb\n1\tc\n")
+        second = deduplicator.filter(b"2\td\n3\te\n")
+        deduplicator.close()
+        rows = b"".join(first + second).splitlines()
+        self.assertEqual(sorted(rows), [b"1\ta", b"2\tb", b"3\te"])
+        self.assertEqual((deduplicator.rows, deduplicator.duplicates), (5, 2))
+
+    def test_keeps_the_first_row_of_a_key_across_blocks(self):
+        """Test if blocks hashed out of order keep the first row of every key
+
+        :return:
+        """
+        copied = list()
+
+        async def exec_sql(db_options, command=None, sync=False, **kwargs):
+            if sync:
+                return b'[{"column_name": "id"}, {"column_name": "name"}]', b""
+
+        async def copy_to(db_options, query, output, **kwargs):
+            for i in range(3 * workers.processes + 3):
+                await output(b"%d\tfirst\n" % i + b"%d\tlater\n" % (i - 1))
+            return unittest.mock.Mock(returncode=0), b""
+
+        async def copy_from(db_options, table, chunks, **kwargs):
+            copied.extend([chunk async for chunk in chunks])
+            return unittest.mock.Mock(returncode=0), b"", b""
+
+        with unittest.mock.patch.multiple(
+            "postgresimporter.exec",
+            exec_sql=exec_sql,
+            copy_to=copy_to,
+            copy_from=copy_from,
+        ):
+            loader = self.loader(dedup_keys=["id"], dedup_partitions=3)
+            common.run_sync(loader.combine_deduplicated, "animals", ["animals_1"], {})
+
+        rows = b"".join(copied).splitlines()
+        self.assertEqual(len(rows), 3 * workers.processes + 4)
+        self.assertEqual([r for r in rows if r.startswith(b"-1\t")], [b"-1\tlater"])
+        self.assertTrue(all(r.endswith(b"first") for r in rows if r != b"-1\tlater"))
+
+    def test_combines_without_duplicates(self):
+        """Test if combining tables streams unique rows back into the database
+
+        :return:
+        """
+        copied, statements = list(), list()
+
+        async def exec_sql(db_options, command=None, sync=False, **kwargs):
+            statements.append(command)
+            if sync:
+                return b'[{"column_name": "id"}, {"column_name": "name"}]', b""
+
+        async def copy_to(db_options, query, output, **kwargs):
+            statements.append(query)
+            await output(b"1\ta\n2\tb\n")
+            await output(b"1\ta\n")
+            return unittest.mock.Mock(returncode=0), b""
+
+        async def copy_from(db_options, table, chunks, **kwargs):
+            copied.extend([chunk async for chunk in chunks])
+            return unittest.mock.Mock(returncode=0), b"", b""
+
+        with unittest.mock.patch(
+            "postgresimporter.exec.exec_sql", new=exec_sql
+        ), unittest.mock.patch(
+            "postgresimporter.exec.copy_to", new=copy_to
+        ), unittest.mock.patch(
+            "postgresimporter.exec.copy_from", new=copy_from
+        ):
+            loader = self.loader(dedup=True)
+            common.run_sync(
+                loader.combine_deduplicated, "animals", ["animals_1", "animals_2"], {}
+            )
+
+        self.assertEqual(sorted(b"".join(copied).splitlines()), [b"1\ta", b"2\tb"])
+        self.assertIn(
+            "SELECT * FROM import.animals_1 UNION ALL SELECT * FROM import.animals_2",
+            statements,
+        )
@@ -0,0 +1,106 @@
+import json
+import pathlib
+import tempfile
+import unittest.mock
+
+import common
+
+from postgresimporter import delta, utils
+
+
+class DeltaTest(common.BaseTest):
+    def test_finds_changed_rows(self):
+        """Test if inserted, updated and deleted keys are found by their hashes
+
+        :return:
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = pathlib.Path(directory) / "animals.csv"
+            columns, keys = ["id", "name"], ["id"]
+            path.write_bytes(b'id,name\n1,Cat\n2,Dog\n3,"Fish\nBlub"\n4,Cow\n')
+            delta.build(directory, "animals", str(path), 8, columns, keys)
+            delta.Index(directory, "animals").commit()
+
+            path.write_bytes(b'id,name\n1,Cat\n3,"Fish\nBlub"\n4,Ox\n5,Bird\n')
+            self.assertEqual(
+                delta.build(directory, "animals", str(path), 8, columns, keys), 4
+            )
+            numbers, deleted, counts = delta.diff(directory, "animals")
+            self.assertEqual(numbers, [2, 3])
+            self.assertEqual(deleted, [["2"]])
+            self.assertEqual(
+                (counts["inserted"], counts["updated"], counts["deleted"]), (1, 1, 1)
+            )
+            out = pathlib.Path(directory) / "animals.delta"
+            self.assertEqual(
+                delta.delta_rows(str(path), 8, numbers, deleted, columns, keys, out),
+                21,
+            )
+            self.assertEqual(
+                list(delta.read_delta(out, 8)), [b"4,Ox,f\n5", b",Bird,f\n", b"2,,t\n"]
+            )
+
+    def test_sorts_the_index_in_runs(self):
+        """Test if index records spilled in sorted runs are merged into one index
+
+        :return:
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = pathlib.Path(directory) / "animals.csv"
+            columns, keys = ["id", "name"], ["id"]
+            path.write_bytes(
+                b"id,name\n" + b"".join(b"%d,x%d\n" % (i, i) for i in range(50))
+            )
+            self.assertEqual(
+                delta.build(
+                    directory,
+                    "animals",
+                    str(path),
+                    8,
+                    columns,
+                    keys,
+                    memory_entries=7,
+                    max_runs=3,
+                ),
+                50,
+            )
+            index = delta.Index(directory, "animals")
+            entries = list(delta.read_run(index.path(".idx", part=True)))
+            self.assertEqual(entries, sorted(entries))
+            self.assertEqual(sorted(entry[2] for entry in entries), list(range(50)))
+            self.assertEqual(
+                sorted(p.suffix for p in pathlib.Path(directory).iterdir()),
+                [".csv", ".part", ".part", ".part"],
+            )
+
+    def test_loads_only_the_delta(self):
+        """Test if a file is loaded completely once and then only by its delta
+
+        :return:
+        """
+        copies = list()
+
+        async def exec_sql(db_options, command=None, sync=False, **kwargs):
+            rows = [dict(column_name="id"), dict(column_name="name")]
+            return json.dumps(rows).encode(), b""
+
+        async def copy_from(db_options, table, data, **kwargs):
+            copies.append((table, b"".join(data)))
+            return unittest.mock.Mock(returncode=0), b"", b""
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = pathlib.Path(directory) / "animals.csv"
+            path.write_bytes(b"id,name\n1,Cat\n2,Dog\n")
+            with unittest.mock.patch.multiple(
+                "postgresimporter.exec", exec_sql=exec_sql, copy_from=copy_from
+            ):
+                loader = self.loader(delta_keys=[utils.parse_table_keys("animals=id")])
+                self.assertTrue(loader.streaming)
+                common.run_sync(loader.import_chunked, path)
+                common.run_sync(loader.import_chunked, path)
+                path.write_bytes(b"id,name\n1,Cat\n2,Wolf\n")
+                common.run_sync(loader.import_chunked, path)
+
+        self.assertEqual(
+            copies, [("import.animals", b"1,Cat\n2,Dog\n"), ("_delta", b"2,Wolf,f\n")],
+        )
@@ -0,0 +1,124 @@
+import pathlib
+import unittest.mock
+
+import common
+
+from postgresimporter import filters
+
+
+class FiltersTest(common.BaseTest):
+    def test_parses_predicates_and_samples(self):
+        """Test if predicates and samples are parsed from the command line
+
+        :return:
+        """
+        self.assertEqual(
+            filters.parse_predicate("animals.legs>=4"), ("animals", "legs", ">=", "4")
+        )
+        self.assertEqual(filters.parse_predicate("*.name~^c"), ("*", "name", "~", "^c"))
+        self.assertEqual(filters.parse_predicate(".name="), ("*", "name", "=", ""))
+        for spec in ["animals", "animals.legs", "animals.name~("]:
+            with self.assertRaises(ValueError):
+                filters.parse_predicate(spec)
+
+        self.assertEqual(
+            filters.parse_sample("animals=1%:id"), ("animals", 0.01, ["id"])
+        )
+        self.assertEqual(filters.parse_sample("*=0.5"), ("*", 0.5, None))
+        for spec in ["animals", "animals=0", "animals=150%", "=0.1", "animals=x"]:
+            with self.assertRaises(ValueError):
+                filters.parse_sample(spec)
+
+    def test_plans_files(self):
+        """Test if the settings of a table are planned by column index
+
+        :return:
+        """
+        columns = ["id", "name", "legs"]
+        self.assertIsNone(filters.plan(["animals_1", "animals"], columns))
+        selection = filters.plan(
+            ["animals_1", "animals"],
+            columns,
+            keep_columns=[("animals", ["legs", "id"]), ("plants", ["name"])],
+            predicates=[("animal*", "legs", ">", "2")],
+            samples=[("*", 0.5, None), ("animals", 0.1, ["id"])],
+        )
+        self.assertEqual(selection.keep, [0, 2])
+        self.assertEqual(selection.predicates, [(2, ">", "2")])
+        self.assertEqual(selection.fraction, 0.1)
+        self.assertEqual(selection.sample_keys, [0])
+        with self.assertRaises(ValueError):
+            filters.plan(["animals"], columns, keep_columns=[("animals", ["age"])])
+
+    def test_filters_chunks(self):
+        """Test if rows and columns are dropped from csv chunks
+
+        :return:
+        """
+        self.assertTrue(filters.matches("10", ">", "9"))
+        self.assertTrue(filters.matches("b", ">", "a"))
+        self.assertTrue(filters.matches("", "=", ""))
+        self.assertFalse(filters.matches("", "<", "3"))
+        self.assertTrue(filters.matches("cat", "~", "^c"))
+
+        selection = filters.plan(
+            ["animals"],
+            ["id", "name", "legs"],
+            keep_columns=[("animals", ["id", "legs"])],
+            predicates=[("animals", "legs", ">=", "4")],
+        )
+        data, dropped = filters.filter_csv(
+            b'1,"cat\n",4\n2,bird,2\n3,dog,\n4,ragged\n', selection
+        )
+        self.assertEqual(data, b"1,4\n4,ragged\n")
+        self.assertEqual(dropped, 2)
+
+        # Projection keeps empty strings, NULLs and quoting as they are
+        selection = filters.plan(
+            ["animals"],
+            ["id", "name", "legs"],
+            keep_columns=[("animals", ["id", "name"])],
+        )
+        self.assertEqual(
+            filters.filter_csv(b'1,"",z\n2,,z\n"3","a""b",z\n', selection),
+            (b'1,""\n2,\n"3","a""b"\n', 0),
+        )
+
+    def test_samples_deterministically(self):
+        """Test if samples keep the same keys in every table and run
+
+        :return:
+        """
+        rows = [[str(i), "x"] for i in range(10000)]
+        kept = [row[0] for row in rows if filters.sampled(row, 0.1, [0])]
+        self.assertAlmostEqual(len(kept) / len(rows), 0.1, delta=0.02)
+        other = [[str(i), "y", "z"] for i in range(10000)]
+        self.assertEqual(
+            kept, [row[0] for row in other if filters.sampled(row, 0.1, [0])]
+        )
+        self.assertTrue(all(filters.sampled(row, 1.0) for row in rows))
+
+    def test_loads_filtered_columns(self):
+        """Test if chunked loads create and fill only the kept columns
+
+        :return:
+        """
+        with self.create_mock_files([]):
+            path = pathlib.Path("/test/animals_1.csv")
+            path.parent.mkdir()
+            path.write_bytes(b"id,name,legs\n1,cat,4\n2,bird,2\n")
+            copied = list()
+
+            async def copy_from(db_options, table, data, columns=None, **kwargs):
+                copied.append((columns, b"".join(data)))
+                return unittest.mock.Mock(returncode=0), b"", b""
+
+            with unittest.mock.patch("postgresimporter.exec.copy_from", new=copy_from):
+                loader = self.loader(
+                    keep_columns=[("animals", ["id", "name"])],
+                    where=[filters.parse_predicate("animals.legs>2")],
+                )
+                self.assertTrue(loader.streaming)
+                common.run_sync(loader.import_chunked, path)
+            self.assertEqual(copied, [(["id", "name"], b"1,cat\n")])
+            self.assertEqual(loader.load_done[str(path)]["filtered"], 1)
@@ -0,0 +1,132 @@
+import json
+import pathlib
+import unittest.mock
+
+import common
+
+from postgresimporter import exec, fingerprints
+
+
+class FingerprintsTest(common.BaseTest):
+    def test_finds_input_tables(self):
+        """Test if the import tables a script refers to are its inputs
+
+        :return:
+        """
+        script = (
+            'INSERT INTO public.animals SELECT * FROM import.animals_1, IMPORT."Zoo"\n'
+            "JOIN import . Plants ON true; DELETE FROM import._checkpoints;"
+        )
+        self.assertEqual(
+            fingerprints.input_tables(script), ["Zoo", "animals_1", "plants"]
+        )
+        self.assertNotEqual(
+            fingerprints.fingerprint(script, dict(animals_1=1)),
+            fingerprints.fingerprint(script, dict(animals_1=2)),
+        )
+
+    def test_skips_unchanged_hooks(self):
+        """Test if hooks only run again when the script or its inputs changed
+
+        :return:
+        """
+        text = "SELECT * FROM import.animals"
+        recorded, executed, versions = dict(), list(), dict(animals=1)
+
+        async def exec_sql(db_options, command=None, script=None, **kwargs):
+            if script:
+                executed.append(script)
+                await kwargs["completion"](unittest.mock.Mock(returncode=0), [script])
+            elif kwargs.get("sync"):
+                self.assertIn("WHERE table_name IN ('animals')", command)
+                state = dict(last=recorded.get("/post.sql"), versions=versions)
+                return json.dumps([state]).encode(), b""
+            elif fingerprints.hooks_table in command:
+                recorded["/post.sql"] = command.split("'")[-2]
+
+        with self.create_mock_files(["/post.sql"]):
+            pathlib.Path("/post.sql").write_text(text)
+            with unittest.mock.patch("postgresimporter.exec.exec_sql", new=exec_sql):
+                loader = self.loader(force_hooks=False)
+                for _ in range(2):
+                    common.run_sync(loader.run_hook, pathlib.Path("/post.sql"))
+                self.assertEqual(len(executed), 1)
+
+                versions["animals"] = 2
+                common.run_sync(loader.run_hook, pathlib.Path("/post.sql"))
+                self.assertEqual(len(executed), 2)
+
+                common.run_sync(
+                    self.loader(force_hooks=True).run_hook, pathlib.Path("/post.sql")
+                )
+                self.assertEqual(len(executed), 3)
+
+    def test_does_not_record_failed_hooks(self):
+        """Test if a hook script with a failing statement runs again next time
+
+        :return:
+        """
+        executed, recorded = list(), list()
+
+        async def create_subprocess_exec(executable, *args, **kwargs):
+            # psql only exits with an error for failing statements of a
+            # script with ON_ERROR_STOP
+            returncode, stderr = 0, b""
+            if "-f" in args and "-" not in args:
+                executed.append(args)
+                stops = "ON_ERROR_STOP=1" in args
+                returncode, stderr = (3 if stops else 0), b"ERROR: division by zero"
+            elif fingerprints.hooks_table in args[-1] and "INSERT" in args[-1]:
+                recorded.append(args[-1])
+
+            async def communicate(_input=None):
+                return b"null", stderr
+
+            return unittest.mock.Mock(
+                returncode=returncode, pid=0, communicate=communicate
+            )
+
+        with self.create_mock_files(["/post.sql"]):
+            pathlib.Path("/post.sql").write_text("SELECT 1 / 0 FROM import.animals")
+            with unittest.mock.patch(
+                "asyncio.create_subprocess_exec", new=create_subprocess_exec
+            ):
+                loader = self.loader(force_hooks=False)
+                for _ in range(2):
+                    common.run_sync(loader.run_hook, pathlib.Path("/post.sql"))
+            self.assertEqual(len(executed), 2)
+            # Scripts may run statements that cannot run in a transaction
+            self.assertNotIn("--single-transaction", executed[0])
+            self.assertEqual(recorded, [])
+
+    def test_records_many_loads(self):
+        """Test if the loads of many tables are not limited by the argument length
+
+        :return:
+        """
+        calls = list()
+
+        async def create_subprocess_exec(executable, *args, **kwargs):
+            if max(len(arg) for arg in args) > 128 * 1024:
+                raise OSError(7, "Argument list too long")
+
+            async def communicate(input=None):
+                calls.append((args, input))
+                return b"", b""
+
+            return unittest.mock.Mock(returncode=0, pid=0, communicate=communicate)
+
+        tables = [f"animals_{i:06d}" for i in range(10000)]
+        with unittest.mock.patch(
+            "asyncio.create_subprocess_exec", new=create_subprocess_exec
+        ):
+            common.run_sync(self.loader().record_loads, tables)
+            self.assertEqual(len(calls), 1)
+            self.assertIn(b"'animals_009999', 1)", calls[0][1])
+
+            # Commands that cannot be started are logged instead of raised
+            async def exec_sql():
+                await exec.exec_sql({}, command="SELECT '" + "x" * 200000 + "'")
+                return await exec.exec_sql({}, command="x" * 200000, sync=True)
+
+            self.assertEqual(common.run_sync(exec_sql)[0], b"")
@@ -0,0 +1,396 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import pathlib
+import re
+import shutil
+import subprocess
+import time
+import unittest.mock
+
+import common
+
+from postgresimporter import exec, jobs
+
+# Connection string of a scratch database whose import._jobs table is dropped
+test_target = os.environ.get("POSTGRESIMPORTER_TEST_TARGET")
+
+
+def database_available():
+    if not test_target or shutil.which("psql") is None:
+        return False
+    try:
+        check = subprocess.run(
+            ["psql", test_target, "-c", "SELECT 1"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            timeout=10,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+    return check.returncode == 0
+
+
+def claim_jobs(target, node, lease, claimed):
+    """Claim and end jobs of every kind with the real queries, run as a process"""
+
+    async def claim():
+        for kind in ("file", "combine", "finish"):
+            while True:
+                job = await jobs.claim(target, node, kind, lease)
+                if job is None:
+                    if await jobs.open_jobs(target, kind) == 0:
+                        break
+                    await asyncio.sleep(0.05)
+                    continue
+                await asyncio.sleep(0.02)
+                await exec.exec_sql(
+                    target,
+                    command=jobs.finish_statement(node, job, "done"),
+                    sync=True,
+                    wrap_json=False,
+                )
+                claimed.put((node, job))
+
+    asyncio.new_event_loop().run_until_complete(claim())
+
+
+class FakeJobs:
+    """In memory stand-in for import._jobs answering the queries of the nodes"""
+
+    def __init__(self, files, tables=()):
+        self.jobs = {f: dict(kind="file", state="pending", node=None) for f in files}
+        for table in tables:
+            self.jobs[jobs.combine_job(table)] = dict(
+                kind="combine", state="pending", node=None
+            )
+        self.jobs[jobs.finish_job] = dict(kind="finish", state="pending", node=None)
+
+    def open(self, kind):
+        return [
+            job
+            for job, info in self.jobs.items()
+            if info["kind"] == kind and info["state"] in ("pending", "running")
+        ]
+
+    def claim(self, node, kind):
+        if kind != "file" and self.open("file"):
+            return []
+        if kind == "finish" and self.open("combine"):
+            return []
+        for job, info in self.jobs.items():
+            expired = info["state"] == "running" and info["lease_until"] < time.time()
+            if info["kind"] == kind and (info["state"] == "pending" or expired):
+                info.update(state="running", node=node, lease_until=time.time() + 0.1)
+                return [dict(job=job, attempts=2 if expired else 1)]
+        return []
+
+    async def exec_sql(self, db_options, command=None, sync=False, **kwargs):
+        node = re.search(r"node = '([^']*)'", command)
+        if command.startswith("WITH claimed"):
+            kind = re.search(r"kind = '(\w+)'", command).group(1)
+            rows = self.claim(node.group(1), kind)
+            return json.dumps(rows or None).encode(), b""
+        if "count(*) AS open" in command:
+            kind = re.search(r"kind = '(\w+)'", command).group(1)
+            return json.dumps([dict(open=len(self.open(kind)))]).encode(), b""
+        ended = re.search(r"SET state = '(\w+)'.*WHERE job = '([^']*)'", command)
+        if ended:
+            info = self.jobs[ended.group(2)]
+            if info["node"] == node.group(1) and info["state"] == "running":
+                info["state"] = ended.group(1)
+        return b"", b""
+
+    async def execute(self, db_options, statements):
+        return unittest.mock.Mock(returncode=0), b"", b""
+
+
+class FakeLock:
+    """Stand-in for exec.AdvisoryLock recording the keys held"""
+
+    held = list()
+
+    def __init__(self, db_options, key):
+        self.key = key
+
+    async def __aenter__(self):
+        FakeLock.held.append(self.key)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        FakeLock.held.remove(self.key)
+
+
+class JobsTest(common.BaseTest):
+    def test_claims_skip_locked_jobs(self):
+        """Test if jobs are claimed with SKIP LOCKED and taken over after their lease
+
+        :return:
+        """
+        query = jobs.claim_query("node-1", "finish", 30)
+        self.assertIn("FOR UPDATE SKIP LOCKED", query)
+        self.assertIn("lease_until < now()", query)
+        self.assertIn(
+            "kind IN ('file', 'combine') AND state IN ('pending', 'running')", query
+        )
+        self.assertIn(
+            "kind IN ('file') AND state", jobs.claim_query("node-1", "combine", 30),
+        )
+        statements = jobs.register_statements({"/data/a.csv": ("4:1.0", 4)}, "v1")
+        self.assertIn("('/data/a.csv', 'file', '4:1.0', 4)", statements[2])
+        self.assertIn(
+            "node = 'node-1' AND state = 'running'",
+            jobs.finish_statement("node-1", "/data/a.csv", "done"),
+        )
+
+    def test_registers_many_files(self):
+        """Test if the jobs of many files are not limited by the argument length
+
+        :return:
+        """
+        calls = list()
+
+        async def create_subprocess_exec(executable, *args, **kwargs):
+            if max(len(arg) for arg in args) > 128 * 1024:
+                raise OSError(7, "Argument list too long")
+
+            async def communicate(input=None):
+                calls.append(input)
+                return b"", b""
+
+            return unittest.mock.Mock(returncode=0, pid=0, communicate=communicate)
+
+        files = {
+            f"/data/{'deeply/nested/' * 8}animals_{i:04d}.csv": (f"{i}:1.0", i)
+            for i in range(1500)
+        }
+        with unittest.mock.patch(
+            "asyncio.create_subprocess_exec", new=create_subprocess_exec
+        ):
+            process, _, _ = common.run_sync(
+                exec.execute, {}, jobs.register_statements(files, "v1")
+            )
+        self.assertEqual(process.returncode, 0)
+        self.assertIn(b"animals_1499.csv', 'file', '1499:1.0', 1499)", calls[0])
+
+    def test_retries_failed_job_queries(self):
+        """Test if a node keeps claiming files after a failed query
+
+        :return:
+        """
+        with self.create_mock_files(["/data/a.csv", "/data/b.csv"]):
+            fake = FakeJobs(["/data/a.csv", "/data/b.csv"])
+            failures = {"WITH claimed": 1, "count(*) AS open": 1}
+            loaded = list()
+
+            async def exec_sql(db_options, command=None, sync=False, **kwargs):
+                for query, count in failures.items():
+                    if query in command and count > 0:
+                        failures[query] -= 1
+                        return b"", b"server closed the connection unexpectedly"
+                return await fake.exec_sql(db_options, command=command, sync=sync)
+
+            async def import_data(_self, table_dump_files, parallel=True):
+                for files in table_dump_files.values():
+                    loaded.extend(str(f) for f in files)
+
+            async def finish_import(
+                _self, table_csv_files, imported=True, combine=True
+            ):
+                pass
+
+            async def step3_post_load(_self, dump_files, table_csv_files):
+                pass
+
+            with unittest.mock.patch.multiple(
+                "postgresimporter.exec", exec_sql=exec_sql, execute=fake.execute
+            ), unittest.mock.patch.multiple(
+                "postgresimporter.main.Loader",
+                import_data=import_data,
+                finish_import=finish_import,
+                step3_post_load=step3_post_load,
+            ):
+                node = self.loader(distributed=True, node_name="node-0", lease=0.04)
+                common.run_sync(node.load_distributed, [pathlib.Path("/data")])
+
+            self.assertEqual(sorted(loaded), ["/data/a.csv", "/data/b.csv"])
+            self.assertEqual(fake.jobs[jobs.finish_job]["state"], "done")
+
+    def test_locks_tables(self):
+        """Test if every combine strategy and table hook holds the table lock
+        in distributed loads
+
+        :return:
+        """
+        held = list()
+
+        async def work(_self, *args, **kwargs):
+            held.append(list(FakeLock.held))
+
+        files = [
+            pathlib.Path("/data/animals_1.csv"),
+            pathlib.Path("/data/animals_2.csv"),
+        ]
+        with unittest.mock.patch(
+            "postgresimporter.exec.AdvisoryLock", new=FakeLock
+        ), unittest.mock.patch.multiple(
+            "postgresimporter.main.Loader",
+            combine_merged=work,
+            combine_deduplicated=work,
+            run_hook_target=work,
+        ):
+            for distributed in (True, False):
+                merging = self.loader(
+                    distributed=distributed, merge_keys=[("animals", ["id"])]
+                )
+                common.run_sync(merging.combine_tables, {"animals": files})
+                deduplicating = self.loader(distributed=distributed, dedup=True)
+                common.run_sync(deduplicating.combine_tables, {"animals": files})
+                common.run_sync(merging.run_hook, "/hooks/a.sql", lock="animals")
+
+        key = jobs.lock_key("animals")
+        self.assertEqual(held, [[key]] * 3 + [[None]] * 3)
+        self.assertEqual(FakeLock.held, [])
+
+    def test_nodes_share_files(self):
+        """Test if nodes load every file and combine every table once, take over
+        crashed jobs and finish once
+
+        :return:
+        """
+        with self.create_mock_files(["/data/a.csv", "/data/b.csv", "/data/c.csv"]):
+            files = ["/data/a.csv", "/data/b.csv", "/data/c.csv"]
+            fake = FakeJobs(files, tables=["a", "b", "c"])
+            # A crashed node still holds c.csv, but its lease ran out
+            fake.jobs["/data/c.csv"].update(
+                state="running", node="crashed", lease_until=time.time() - 1
+            )
+            loaded, combined, finished = list(), list(), list()
+
+            async def import_data(_self, table_dump_files, parallel=True):
+                for files in table_dump_files.values():
+                    loaded.extend((_self.args.node_name, str(f)) for f in files)
+                await asyncio.sleep(0.01)
+
+            async def combine_tables(_self, table_csv_files):
+                combined.extend((_self.args.node_name, t) for t in table_csv_files)
+                await asyncio.sleep(0.01)
+
+            async def finish_import(
+                _self, table_csv_files, imported=True, combine=True
+            ):
+                self.assertFalse(combine)
+                finished.append(_self.args.node_name)
+
+            async def step3_post_load(_self, dump_files, table_csv_files):
+                pass
+
+            with unittest.mock.patch.multiple(
+                "postgresimporter.exec", exec_sql=fake.exec_sql, execute=fake.execute
+            ), unittest.mock.patch.multiple(
+                "postgresimporter.main.Loader",
+                import_data=import_data,
+                combine_tables=combine_tables,
+                finish_import=finish_import,
+                step3_post_load=step3_post_load,
+            ):
+                nodes = [
+                    self.loader(
+                        distributed=True,
+                        combine_tables=True,
+                        node_name=f"node-{i}",
+                        lease=0.04,
+                    )
+                    for i in range(2)
+                ]
+
+                async def run_nodes():
+                    await asyncio.gather(
+                        *[
+                            node.load_distributed([pathlib.Path("/data")])
+                            for node in nodes
+                        ]
+                    )
+
+                common.run_sync(run_nodes)
+
+            self.assertEqual(sorted(f for _, f in loaded), files)
+            self.assertEqual({node for node, _ in loaded}, {"node-0", "node-1"})
+            self.assertEqual(sorted(t for _, t in combined), ["a", "b", "c"])
+            self.assertEqual({node for node, _ in combined}, {"node-0", "node-1"})
+            self.assertEqual(len(finished), 1)
+            self.assertTrue(all(info["state"] == "done" for info in fake.jobs.values()))
+
+    @unittest.skipUnless(
+        database_available(), "set POSTGRESIMPORTER_TEST_TARGET to a scratch database"
+    )
+    def test_processes_share_jobs_in_postgres(self):
+        """Test if processes claim every job once with the real queries of import._jobs
+
+        :return:
+        """
+        files = {f"/data/{name}.csv": ("1:1.0", 1) for name in "abcdef"}
+        tables = {name: ("v1", 1) for name in "abc"}
+
+        async def register(files, drop=False):
+            process, _, stderr = await exec.execute(
+                test_target,
+                (["DROP TABLE IF EXISTS import._jobs"] if drop else [])
+                + jobs.register_statements(files, "v1", tables),
+            )
+            self.assertEqual(process.returncode, 0, stderr)
+
+        async def states():
+            stdout, _ = await exec.exec_sql(
+                test_target, command="SELECT job, state FROM import._jobs", sync=True
+            )
+            return {row["job"]: row["state"] for row in json.loads(stdout)}
+
+        def run_nodes(count):
+            context = multiprocessing.get_context("spawn")
+            claimed = context.Queue()
+            nodes = [
+                context.Process(
+                    target=claim_jobs, args=(test_target, f"node-{i}", 30, claimed)
+                )
+                for i in range(count)
+            ]
+            [node.start() for node in nodes]
+            [node.join(60) for node in nodes]
+            self.assertTrue(all(node.exitcode == 0 for node in nodes))
+            result = list()
+            while not claimed.empty():
+                result.append(claimed.get())
+            return result
+
+        common.run_sync(register, files, drop=True)
+        claimed = run_nodes(3)
+        jobs_claimed = sorted(job for _, job in claimed)
+        self.assertEqual(
+            jobs_claimed,
+            sorted(
+                list(files) + [jobs.combine_job(t) for t in tables] + [jobs.finish_job]
+            ),
+        )
+        self.assertTrue(len({node for node, _ in claimed}) > 1)
+        self.assertEqual(set(common.run_sync(states).values()), {"done"})
+
+        # Registering again keeps done jobs, a changed file is loaded,
+        # combined and finished again
+        files["/data/a.csv"] = ("2:2.0", 2)
+        common.run_sync(register, files)
+        self.assertEqual(
+            sorted(
+                job for job, state in common.run_sync(states).items() if state != "done"
+            ),
+            sorted(
+                ["/data/a.csv", jobs.finish_job] + [jobs.combine_job(t) for t in tables]
+            ),
+        )
+        self.assertEqual(
+            sorted(job for _, job in run_nodes(2)),
+            sorted(
+                ["/data/a.csv", jobs.finish_job] + [jobs.combine_job(t) for t in tables]
+            ),
+        )
@@ -1,11 +1,13 @@
 import itertools
 import pathlib
+import tempfile
+import threading
 from contextlib import contextmanager
 from unittest import mock
 
 import common
 
-from postgresimporter import utils
+from postgresimporter import discovery, utils
 
 
 class LoadTest(common.BaseTest):
@@ -118,3 +120,77 @@ class LoadTest(common.BaseTest):
                 }
             ):
                 self.load(paths, disable_import=False, exclude_regex="^.*sample.*$")
+
+    def test_discovers_sources_in_single_pass(self):
+        """Test if a single walk classifies archives and groups dump files
+
+        :return:
+        """
+        mock_files = [
+            "/sources/a.zip",
+            "/sources/x/running_jan19.csv",
+            "/sources/x/y/running_feb19.csv",
+            "/sources/x/y/train_sample.csv",
+            "/sources/x/y/train.jsonl",
+            "/sources/x/notes.txt",
+        ]
+        with self.create_mock_files(mock_files):
+            sources = discovery.Discovery(exclude_regex="^.*sample.*$")
+            found = sources.scan(
+                [pathlib.Path("/sources"), pathlib.Path("/sources/a.zip")]
+            )
+            self.assertEqual(len(found), 4)
+            self.assertEqual(sources.zip_files, [pathlib.Path("/sources/a.zip")])
+            self.assertEqual(
+                {t: sorted(f) for t, f in sources.table_dump_files.items()},
+                {
+                    "running": [
+                        pathlib.Path("/sources/x/running_jan19.csv"),
+                        pathlib.Path("/sources/x/y/running_feb19.csv"),
+                    ],
+                    "train": [pathlib.Path("/sources/x/y/train.jsonl")],
+                },
+            )
+
+    def test_loads_files_while_walking(self):
+        """Test if dump files start loading before the walk of the sources is complete
+
+        :return:
+        """
+        started, waited, loaded = threading.Event(), list(), list()
+        walk = discovery.walk
+
+        def slow_walk(source):
+            for i, path in enumerate(sorted(walk(source))):
+                if i == 1:
+                    # Only continue once the first file is loading
+                    waited.append(started.wait(5))
+                yield path
+
+        async def import_chunked(_self, dump_file):
+            loaded.append(dump_file.name)
+            started.set()
+
+        async def finish_import(_self, table_csv_files, imported=True):
+            pass
+
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ["animals_1.csv", "animals_2.csv", "plants.csv"]:
+                (pathlib.Path(directory) / name).write_text("id\n1\n")
+            with mock.patch(
+                "postgresimporter.discovery.walk", new=slow_walk
+            ), mock.patch.multiple(
+                "postgresimporter.main.Loader",
+                import_chunked=import_chunked,
+                finish_import=finish_import,
+            ):
+                loader = self.loader(chunk_size=1024, disable_import=False)
+                self.assertTrue(loader.overlapped)
+                dump_files, table_csv_files = common.run_sync(
+                    loader.step12_overlapped, [pathlib.Path(directory)]
+                )
+
+        self.assertEqual(waited, [True])
+        self.assertEqual(loaded, ["animals_1.csv", "animals_2.csv", "plants.csv"])
+        self.assertEqual(sorted(table_csv_files), ["animals", "plants"])
+        self.assertEqual(loader.load_total, 3)
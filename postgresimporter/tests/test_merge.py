@@ -0,0 +1,88 @@
+import json
+import pathlib
+import unittest.mock
+
+import common
+
+from postgresimporter import merge, utils
+
+
+class MergeTest(common.BaseTest):
+    def test_upserts_only_changed_rows(self):
+        """Test if conflicting rows are only updated when their values differ
+
+        :return:
+        """
+        rules = [utils.parse_table_keys("animals*=id"), utils.parse_table_keys("x=a,b")]
+        self.assertEqual(merge.keys_for("animals", rules), ["id"])
+        self.assertIsNone(merge.keys_for("plants", rules))
+        with self.assertRaises(ValueError):
+            utils.parse_table_keys("animals=")
+
+        statement = merge.upsert_statement(
+            "animals", ["id", "name"], ["id"], lower="3", upper="7"
+        )
+        self.assertIn("WHERE \"id\" > '3' AND \"id\" <= '7'", statement)
+        self.assertIn('ON CONFLICT ("id") DO UPDATE SET ("name")', statement)
+        self.assertIn(
+            'WHERE (target."name") IS DISTINCT FROM (EXCLUDED."name")', statement
+        )
+        self.assertTrue(
+            merge.upsert_statement("animals", ["id"], ["id"]).endswith("DO NOTHING")
+        )
+        self.assertEqual(merge.written_rows(b"INSERT 0 3\nINSERT 0 2\n"), 5)
+
+    def test_merges_in_key_ranges(self):
+        """Test if combined tables with keys are merged batch by batch, never dropped
+
+        :return:
+        """
+        executed = list()
+
+        async def exec_sql(db_options, command=None, sync=False, **kwargs):
+            executed.append([command])
+            if "information_schema" in command:
+                rows = [dict(column_name="id"), dict(column_name="name")]
+            else:
+                rows = [dict(bound="4"), dict(bound="9")]
+            return json.dumps(rows).encode(), b""
+
+        async def execute(db_options, statements):
+            executed.append(statements)
+            return unittest.mock.Mock(returncode=0), b"INSERT 0 2\n", b""
+
+        with unittest.mock.patch.multiple(
+            "postgresimporter.exec", exec_sql=exec_sql, execute=execute
+        ):
+            loader = self.loader(
+                combine_tables=True,
+                merge_keys=[utils.parse_table_keys("animals=id")],
+                merge_batch_rows=5,
+            )
+            common.run_sync(
+                loader.combine_tables,
+                {
+                    "animals": [
+                        pathlib.Path("animals_1.csv"),
+                        pathlib.Path("animals_2.csv"),
+                    ]
+                },
+            )
+
+        statements = [s for batch in executed for s in batch]
+        self.assertFalse(
+            any(
+                s.startswith("DROP TABLE IF EXISTS import.animals ") for s in statements
+            )
+        )
+        self.assertIn(
+            "CREATE TABLE IF NOT EXISTS import.animals "
+            "(LIKE import.animals_1 INCLUDING ALL)",
+            statements,
+        )
+        self.assertTrue(any("/ 5 AS batch" in s for s in statements))
+        upserts = [s for s in statements if s.startswith("INSERT INTO import.animals")]
+        self.assertEqual(len(upserts), 2)
+        self.assertIn("WHERE \"id\" <= '4' ON CONFLICT", upserts[0])
+        self.assertIn("WHERE \"id\" > '4' AND \"id\" <= '9' ON CONFLICT", upserts[1])
+        self.assertEqual(statements[-1], "DROP TABLE IF EXISTS import._merge_animals")
@@ -0,0 +1,71 @@
+import pathlib
+
+import common
+
+from postgresimporter import ndjson
+
+
+class NDJSONTest(common.BaseTest):
+    def test_discovers_json_lines_files(self):
+        """Test if json lines files are grouped into tables alongside csv files
+
+        :return:
+        """
+        files = ["/test/animals_1.csv", "/test/animals_2.jsonl", "/test/b.ndjson"]
+        with self.locked_harness(files) as mocks:
+            self.load(mocks.paths, disable_import=False)
+            args, _ = mocks.mocked_import.call_args
+            self.assertEqual(
+                {table: sorted(files) for table, files in args[1].items()},
+                {
+                    "animals": [
+                        pathlib.Path("/test/animals_1.csv"),
+                        pathlib.Path("/test/animals_2.jsonl"),
+                    ],
+                    "b": [pathlib.Path("/test/b.ndjson")],
+                },
+            )
+
+    def test_encodes_batches(self):
+        """Test if json lines are encoded as rows of the COPY text format
+
+        :return:
+        """
+        lines = [
+            '{"Name": "Grizzly", "height": 220, "tags": ["a\\tb"]}',
+            '{"Name": null, "origin": "Africa", "big": true}',
+        ]
+        self.assertEqual(
+            ndjson.encode_batch(lines, keys=["Name", "height", "tags", "big"]),
+            b'Grizzly\t220\t["a\\\\tb"]\t\\N\n\\N\t\\N\t\\N\ttrue\n',
+        )
+        self.assertEqual(
+            ndjson.encode_batch(lines[:1]),
+            b'{"Name": "Grizzly", "height": 220, "tags": ["a\\\\tb"]}\n',
+        )
+
+    def test_reports_malformed_lines(self):
+        """Test if a malformed line is reported with its line number
+
+        :return:
+        """
+        with self.assertRaises(ndjson.MalformedLineError) as context:
+            ndjson.parse_batch(['{"a": 1}', '{"a": '], file="x.jsonl", first_line=5)
+        self.assertEqual(context.exception.line_number, 6)
+
+    def test_samples_flattened_columns(self):
+        """Test if flattened columns are derived from the sampled records
+
+        :return:
+        """
+        with self.create_mock_files([]):
+            path = pathlib.Path("/test/a.jsonl")
+            path.parent.mkdir(parents=True)
+            path.write_text('{"First Name": 1}\n\n{"b.c": 2, "First Name": 3}\n')
+            self.assertEqual(
+                ndjson.sample_columns(path), {"first_name": "First Name", "b_c": "b.c"},
+            )
+            self.assertEqual(
+                list(ndjson.read_batches(path, batch_lines=1)),
+                [(1, ['{"First Name": 1}']), (3, ['{"b.c": 2, "First Name": 3}'])],
+            )
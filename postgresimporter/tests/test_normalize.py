@@ -0,0 +1,93 @@
+import itertools
+import pathlib
+import unittest.mock
+
+import common
+
+from postgresimporter import normalize
+
+
+class NormalizeTest(common.BaseTest):
+    def test_matches_strip_function(self):
+        """Test if the column transform gives the same results as strip() in sql
+
+        :return:
+        """
+        self.assertEqual(normalize.strip('\r\n"a"\nb"\n'), "a\nb")
+        # Newlines are only removed at the very edges, like anchors in sql
+        self.assertEqual(normalize.strip('a\n"'), "a\n")
+        self.assertIsNone(normalize.strip('\n""\n'))
+        self.assertIsNone(normalize.strip(None))
+
+        values = [
+            "".join(chars)
+            for length in range(4)
+            for chars in itertools.product(["a", "\n", "\r", '"', " "], repeat=length)
+        ]
+        values.append(None)
+        self.assertEqual(
+            normalize.strip_column(values), [normalize.strip(v) for v in values]
+        )
+
+    def test_selects_transforms_per_column(self):
+        """Test if rules select transforms by table and column
+
+        :return:
+        """
+        rules = [
+            normalize.parse_rule("animals"),
+            normalize.parse_rule("*.id=trim"),
+            normalize.parse_rule("plants.name=empty_to_null"),
+        ]
+        self.assertEqual(rules[0], ("animals", "*", "strip"))
+        with self.assertRaises(ValueError):
+            normalize.parse_rule("animals=upper")
+        self.assertEqual(
+            normalize.column_transforms(
+                rules, ["animals_1", "animals"], ["id", "name"]
+            ),
+            ["trim", "strip"],
+        )
+        self.assertIsNone(normalize.column_transforms(rules, ["trees"], ["name"]))
+
+    def test_normalizes_chunks(self):
+        """Test if csv chunks are normalized before they are copied
+
+        :return:
+        """
+        self.assertEqual(
+            normalize.normalize_csv(b'" 1 ","\n""x""\n"\n,\n2\n', ["trim", "strip"]),
+            b'"1","x"\n,\n2\n',
+        )
+        # Empty strings stay distinct from NULL and other columns are unchanged
+        self.assertEqual(
+            normalize.normalize_csv(b'"",,"a"\r\n" ",x,\n', ["trim", "trim", None]),
+            b'"",,"a"\n"","x",\n',
+        )
+        self.assertEqual(
+            list(normalize.raw_rows('1,"",\n\n2,"a""\nb"')),
+            [["1", '""', ""], ["2", '"a""\nb"']],
+        )
+        self.assertEqual(
+            [line for line, _ in normalize.numbered_rows('"a\nb"\r\n\nc\nd', 2)],
+            [2, 5, 6],
+        )
+        self.assertEqual(
+            [normalize.field_value(f) for f in ['""', "", '"a""b"', "c"]],
+            ["", None, 'a"b', "c"],
+        )
+
+        with self.create_mock_files([]):
+            path = pathlib.Path("/test/animals_1.csv")
+            path.parent.mkdir()
+            path.write_bytes(b'id,name\n1,"""cat"""\n')
+            copied = list()
+
+            async def copy_from(db_options, table, data, **kwargs):
+                copied.append(b"".join(data))
+                return unittest.mock.Mock(returncode=0), b"", b""
+
+            with unittest.mock.patch("postgresimporter.exec.copy_from", new=copy_from):
+                loader = self.loader(normalize=[normalize.parse_rule("animals.name")])
+                common.run_sync(loader.import_chunked, path)
+            self.assertEqual(copied, [b'1,"cat"\n'])
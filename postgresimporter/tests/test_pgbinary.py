@@ -0,0 +1,182 @@
+import datetime
+import json
+import pathlib
+import struct
+import unittest.mock
+
+import common
+
+from postgresimporter import pgbinary, schema
+
+
+class PgBinaryTest(common.BaseTest):
+    def test_encodes_values(self):
+        """Test if values are encoded like the binary send functions of postgres
+
+        :return:
+        """
+        encoders = pgbinary.encoders
+        self.assertEqual(encoders["bigint"]("-2"), struct.pack(">q", -2))
+        self.assertEqual(encoders["boolean"]("true"), b"\x01")
+        self.assertEqual(encoders["date"]("2000-01-02"), struct.pack(">i", 1))
+        self.assertEqual(
+            encoders["timestamp"]("2000-01-01 00:00:01.5"), struct.pack(">q", 1500000)
+        )
+        self.assertEqual(
+            encoders["timestamp with time zone"]("2000-01-01T01:00:00+01:00"),
+            struct.pack(">q", 0),
+        )
+        # 123.45 is stored as the base 10000 digits 123 and 4500 with scale 2
+        self.assertEqual(
+            encoders["numeric"]("-123.45"),
+            struct.pack(">hhHHHH", 2, 0, 0x4000, 2, 123, 4500),
+        )
+        self.assertEqual(
+            encoders["numeric"]("1E+6"), struct.pack(">hhHHH", 1, 1, 0, 0, 100)
+        )
+        self.assertEqual(encoders["integer"](" -12 "), struct.pack(">i", -12))
+        for invalid in ["1_000", "\u0661\u0662", "1.0", ""]:
+            with self.assertRaisesRegex(ValueError, "invalid integer"):
+                encoders["integer"](invalid)
+        self.assertEqual(pgbinary.normalize_type("VARCHAR(20)"), "varchar")
+        self.assertIsNone(pgbinary.normalize_type("uuid"))
+
+        data, rejected = pgbinary.encode_csv(
+            b'1,"a,b"\n,\n', ["integer", "text"], first_line=2
+        )
+        self.assertIsNone(rejected)
+        self.assertEqual(
+            data,
+            pgbinary.HEADER
+            + struct.pack(">hii", 2, 4, 1)
+            + struct.pack(">i", 3)
+            + b"a,b"
+            + struct.pack(">hii", 2, -1, -1)
+            + pgbinary.TRAILER,
+        )
+        # Quoted empty fields are empty strings, unquoted ones NULL
+        data, _ = pgbinary.encode_csv(b'"",\n', ["text", "text"])
+        self.assertEqual(
+            data, pgbinary.HEADER + struct.pack(">hii", 2, 0, -1) + pgbinary.TRAILER,
+        )
+        with self.assertRaisesRegex(ValueError, "line 3"):
+            pgbinary.encode_csv(b"1\nx\n", ["integer"], first_line=2)
+
+        data, rejected = pgbinary.encode_csv(
+            b'1\nx\n"2\n3"\n4\n', ["integer"], first_line=2, tolerant=True
+        )
+        self.assertEqual([r.line for r in rejected], [3, 4])
+        self.assertEqual(data.count(struct.pack(">hi", 1, 4)), 2)
+
+    def test_encodes_timestamps_in_session_zone(self):
+        """Test if timestamps without an offset are encoded in the zone of the session
+
+        :return:
+        """
+        self.assertIs(pgbinary.session_zone("Etc/UTC"), datetime.timezone.utc)
+        self.assertIs(pgbinary.session_zone("GMT"), datetime.timezone.utc)
+        self.assertIsNone(pgbinary.session_zone("Not/A_Zone"))
+        if pgbinary.zoneinfo is not None:
+            self.assertIsNotNone(pgbinary.session_zone("Europe/Berlin"))
+
+        zone = datetime.timezone(datetime.timedelta(hours=1))
+        for value in ("2000-01-01 01:00:00", "2000-01-01T00:00:00Z"):
+            data, _ = pgbinary.encode_csv(
+                value.encode() + b"\n", ["timestamp with time zone"], zone=zone
+            )
+            self.assertIn(struct.pack(">hiq", 1, 8, 0), data)
+
+    def test_infers_column_types(self):
+        """Test if column types are inferred from a sample of leading rows
+
+        :return:
+        """
+        with self.create_mock_files([]):
+            path = pathlib.Path("/test/a.csv")
+            path.parent.mkdir()
+            path.write_bytes(
+                b"id,zip,price,day,at,flag,empty\n"
+                b"1,01234,1.5,2020-01-01,2020-01-01 10:00:00,t,\n"
+                b"20,12345,2,2020-01-02,2020-01-01T10:00:00.5,f,\n"
+            )
+            types = schema.infer_types(path, 31, ["id", "zip", "price", "day", "at"])
+            self.assertEqual(
+                types,
+                dict(
+                    id="bigint",
+                    zip="text",
+                    price="numeric",
+                    day="date",
+                    at="timestamp",
+                ),
+            )
+
+    def test_loads_binary_chunks(self):
+        """Test if typed csv tables are created with their types and sent in binary
+
+        :return:
+        """
+        with self.create_mock_files([]):
+            path = pathlib.Path("/test/a.csv")
+            path.parent.mkdir()
+            path.write_bytes(b"id,name\n1,x\n2,y\n")
+            copied = list()
+
+            async def copy_from(db_options, table, data, **kwargs):
+                copied.append((b"".join(data), kwargs))
+                return unittest.mock.Mock(returncode=0), b"", b""
+
+            with unittest.mock.patch("postgresimporter.exec.copy_from", new=copy_from):
+                loader = self.loader(
+                    schema=dict(a=dict(id="integer")),
+                    infer_types=True,
+                    copy_format="binary",
+                )
+                common.run_sync(loader.import_chunked, path)
+
+            data, kwargs = copied[0]
+            self.assertEqual(kwargs["options"], "FORMAT binary")
+            self.assertIn(
+                'CREATE TABLE import.a ("id" integer, "name" text)', kwargs["setup"]
+            )
+            self.assertTrue(data.startswith(pgbinary.HEADER))
+            self.assertIn(struct.pack(">hii", 2, 4, 2), data)
+
+    def test_sends_csv_without_a_common_time_zone(self):
+        """Test if tables with timestamps with time zone are sent in binary only in a known zone
+
+        :return:
+        """
+        with self.create_mock_files([]):
+            path = pathlib.Path("/test/a.csv")
+            path.parent.mkdir()
+            path.write_bytes(b"id,at\n1,2000-01-01 01:00:00\n")
+            zones = {"host=a": "Etc/UTC", "host=b": "Etc/UTC"}
+            copied = list()
+
+            async def exec_sql(db_options, command=None, **kwargs):
+                return json.dumps([dict(zone=zones[db_options])]).encode(), b""
+
+            async def copy_from(db_options, table, data, **kwargs):
+                copied.append((b"".join(data), kwargs["options"]))
+                return unittest.mock.Mock(returncode=0), b"", b""
+
+            with unittest.mock.patch.multiple(
+                "postgresimporter.exec", exec_sql=exec_sql, copy_from=copy_from
+            ):
+                for zone in ("Etc/UTC", "Europe/Berlin"):
+                    zones["host=b"] = zone
+                    copied.clear()
+                    loader = self.loader(
+                        schema=dict(a=dict(id="integer", at="timestamptz")),
+                        copy_format="binary",
+                        targets=list(zones),
+                    )
+                    common.run_sync(loader.import_chunked, path)
+                    self.assertEqual(
+                        [options for _, options in copied],
+                        ["FORMAT binary"] * 2
+                        if zone == "Etc/UTC"
+                        else ["FORMAT csv"] * 2,
+                    )
+            self.assertEqual(copied[0][0], b"1,2000-01-01 01:00:00\n")
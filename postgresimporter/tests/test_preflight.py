@@ -0,0 +1,59 @@
+import pathlib
+import tempfile
+import unittest.mock
+
+import common
+
+from postgresimporter import preflight
+
+
+class PreflightTest(common.BaseTest):
+    def test_reports_broken_rows(self):
+        """Test if ragged rows, invalid bytes, BOMs and open quotes are reported
+
+        :return:
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = pathlib.Path(directory) / "animals.csv"
+            path.write_bytes(b'\xef\xbb\xbfname,legs\n"Cat\nTom",4\nDog\nBird,2,x\n')
+            report = preflight.scan_file(str(path))
+            self.assertEqual(report.columns, ["name", "legs"])
+            self.assertEqual((report.rows, report.ragged_lines), (3, [4, 5]))
+            self.assertEqual(report.bom, "UTF-8")
+            self.assertEqual(len(report.errors), 2)
+            self.assertEqual(
+                preflight.scan_file(str(path), bom_allowed=True).warnings,
+                ["starts with a UTF-8 byte order mark"],
+            )
+
+            path.write_bytes(b'name,legs\nCat,4\nK\xf6nig,2\n"Dog,4\nRex,4\n')
+            report = preflight.scan_file(str(path))
+            self.assertEqual((report.invalid_line, report.unterminated_line), (3, 4))
+
+    def test_fails_before_loading(self):
+        """Test if differing headers within a group stop the load before any sql
+
+        :return:
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            (pathlib.Path(directory) / "animals_1.csv").write_bytes(
+                b"name,legs\nCat,4\n"
+            )
+            (pathlib.Path(directory) / "animals_2.csv").write_bytes(b"name\nDog\n")
+            executed = list()
+
+            async def exec_sql(*args, **kwargs):
+                executed.append(kwargs)
+
+            with unittest.mock.patch("postgresimporter.exec.exec_sql", new=exec_sql):
+                loader = self.loader(
+                    preflight=True,
+                    combine_tables=True,
+                    disable_import=False,
+                    pre_load=[pathlib.Path(directory) / "pre.sql"],
+                )
+                self.assertFalse(
+                    common.run_sync(loader.step0_preflight, [pathlib.Path(directory)])
+                )
+                common.run_sync(loader.load, [pathlib.Path(directory)])
+            self.assertEqual(executed, [])
@@ -0,0 +1,73 @@
+import json
+import pathlib
+import unittest.mock
+
+import common
+
+from postgresimporter import servercopy, utils
+
+
+class ServerCopyTest(common.BaseTest):
+    def test_maps_local_paths(self):
+        """Test if files are mapped with the most specific local directory
+
+        :return:
+        """
+        mappings = [
+            utils.parse_path_mapping("/data=/import"),
+            utils.parse_path_mapping("/data/large=/mnt/large"),
+        ]
+        self.assertEqual(
+            servercopy.server_path("/data/a/b.csv", mappings), "/import/a/b.csv"
+        )
+        self.assertEqual(
+            servercopy.server_path("/data/large/c.csv", mappings), "/mnt/large/c.csv"
+        )
+        self.assertIsNone(servercopy.server_path("/other/d.csv", mappings))
+        with self.assertRaises(ValueError):
+            utils.parse_path_mapping("/data=import")
+
+    def test_falls_back_to_streaming(self):
+        """Test if only targets that can read a file are loaded server side
+
+        :return:
+        """
+        with self.create_mock_files([]):
+            path = pathlib.Path("/data/a.csv")
+            path.parent.mkdir()
+            path.write_bytes(b"h\n1\n2\n")
+            executed, copied = dict(), dict()
+
+            async def exec_sql(db_options, command=None, sync=False, **kwargs):
+                self.assertIn("'/import/a.csv'", command)
+                size = 6 if db_options == "host=a" else None
+                return json.dumps([dict(size=size)]).encode(), b""
+
+            async def execute(db_options, statements):
+                executed[db_options] = statements
+                return unittest.mock.Mock(returncode=0), b"", b""
+
+            async def copy_from(db_options, table, data, **kwargs):
+                copied[db_options] = list(data)
+                return unittest.mock.Mock(returncode=0), b"", b""
+
+            with unittest.mock.patch.multiple(
+                "postgresimporter.exec",
+                exec_sql=exec_sql,
+                execute=execute,
+                copy_from=copy_from,
+            ):
+                loader = self.loader(
+                    server_paths=[utils.parse_path_mapping("/data=/import")],
+                    targets=["host=a", "host=b"],
+                )
+                self.assertTrue(loader.streaming)
+                common.run_sync(loader.import_chunked, path)
+
+            self.assertEqual(list(executed), ["host=a"])
+            self.assertIn(
+                "COPY import.a (\"h\") FROM '/import/a.csv' "
+                "WITH (FORMAT csv, HEADER, ENCODING 'UTF8')",
+                executed["host=a"],
+            )
+            self.assertEqual(copied, {"host=b": [b"1\n2\n"]})
@@ -0,0 +1,122 @@
+import json
+import pathlib
+import tempfile
+import unittest.mock
+import zipfile
+
+import common
+
+from postgresimporter import staging
+
+
+class StagingTest(common.BaseTest):
+    def test_batches_archives_within_budget(self):
+        """Test if archives are grouped so their extracted files fit the budget
+
+        :return:
+        """
+        archives = [("a", "a", 40), ("b", "b", 50), ("c", "c", 30), ("d", "d", 200)]
+        self.assertEqual(len(staging.next_batch(archives, 100)), 2)
+        self.assertEqual(len(staging.next_batch(archives[2:], 100, used=80)), 1)
+        self.assertEqual(len(staging.next_batch(archives[3:], 100)), 1)
+
+    def test_deletes_verified_files(self):
+        """Test if extracted files are replaced by manifest entries once verified
+
+        :return:
+        """
+        imported, loaded = list(), dict(animals_1=2, animals_2=2, animals_3=1)
+
+        async def import_data(_self, table_dump_files, parallel=True):
+            imported.append(
+                sorted(f.name for files in table_dump_files.values() for f in files)
+            )
+
+        async def exec_sql(db_options, command=None, sync=False, **kwargs):
+            if sync:
+                count = loaded[command.split("import.")[-1]]
+                return json.dumps([dict(count=count)]).encode(), b""
+
+        with tempfile.TemporaryDirectory() as directory:
+            for i in range(1, 4):
+                archive = pathlib.Path(directory) / f"animals_{i}.zip"
+                with zipfile.ZipFile(archive, "w") as zf:
+                    zf.writestr(f"animals_{i}.csv", 'name\nCat\n"Dog\nRex"\n')
+            loader = self.loader(
+                staging_budget=50, disable_unzip=False, disable_import=False
+            )
+            with unittest.mock.patch(
+                "postgresimporter.main.Loader.import_data", new=import_data
+            ):
+                with unittest.mock.patch(
+                    "postgresimporter.exec.exec_sql", new=exec_sql
+                ):
+                    common.run_sync(loader.step12_staged, [pathlib.Path(directory)])
+
+            self.assertEqual(
+                imported, [["animals_1.csv", "animals_2.csv"], ["animals_3.csv"]],
+            )
+            extracted = pathlib.Path(directory) / "animals_1"
+            self.assertFalse((extracted / "animals_1.csv").exists())
+            manifest = staging.load_manifest(extracted)
+            self.assertEqual(manifest["animals_1.csv"]["rows"], 2)
+            # Only one of the two rows was loaded, so the file stays
+            self.assertTrue(
+                (pathlib.Path(directory) / "animals_3/animals_3.csv").exists()
+            )
+            self.assertEqual(len(loader.staged), 2)
+
+    def test_keeps_deleted_files_in_later_runs(self):
+        """Test if files deleted by an earlier run are combined and counted again
+
+        :return:
+        """
+        combined, loaded = list(), dict(animals_1=2, animals_2=2)
+
+        async def import_data(_self, table_dump_files, parallel=True):
+            pass
+
+        async def combine_tables(_self, table_csv_files):
+            combined.append(
+                {
+                    t: sorted(f.name for f in files)
+                    for t, files in table_csv_files.items()
+                }
+            )
+
+        async def exec_sql(db_options, command=None, sync=False, **kwargs):
+            if sync:
+                count = loaded[command.split("import.")[-1]]
+                return json.dumps([dict(count=count)]).encode(), b""
+
+        with tempfile.TemporaryDirectory() as directory:
+            for i in range(1, 3):
+                archive = pathlib.Path(directory) / f"animals_{i}.zip"
+                with zipfile.ZipFile(archive, "w") as zf:
+                    zf.writestr(f"animals_{i}.csv", "name\nCat\nDog\n")
+            with unittest.mock.patch.multiple(
+                "postgresimporter.main.Loader",
+                import_data=import_data,
+                combine_tables=combine_tables,
+            ):
+                with unittest.mock.patch(
+                    "postgresimporter.exec.exec_sql", new=exec_sql
+                ):
+                    for _ in range(2):
+                        loader = self.loader(
+                            staging_budget=1000,
+                            disable_unzip=False,
+                            disable_import=False,
+                            combine_tables=True,
+                        )
+                        common.run_sync(loader.step12_staged, [pathlib.Path(directory)])
+
+            self.assertEqual(
+                combined, 2 * [dict(animals=["animals_1.csv", "animals_2.csv"])]
+            )
+            staged = {pathlib.Path(f).name: r for f, r in loader.staged_rows.items()}
+            self.assertEqual(staged, {"animals_1.csv": 2, "animals_2.csv": 2})
+            # The tables of deleted files were not loaded again
+            self.assertEqual(
+                loader.loaded_tables(loader.discovery.tables()), ["animals"]
+            )
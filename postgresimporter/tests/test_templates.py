@@ -0,0 +1,124 @@
+import asyncio
+import json
+import pathlib
+import unittest.mock
+
+import common
+import jinja2
+
+from postgresimporter import templates
+
+
+class TemplatesTest(common.BaseTest):
+    def test_renders_table_variables(self):
+        """Test if hook templates are rendered with the variables of a table group
+
+        :return:
+        """
+        with self.create_mock_files([]):
+            directory = pathlib.Path("/hooks")
+            directory.mkdir()
+            (directory / "columns.sql").write_text(
+                "{% for c in columns %}{{ c | ident }}::{{ types[c] }}"
+                "{{ ', ' if not loop.last }}{% endfor %}"
+            )
+            (directory / "typed.sql.j2").write_text(
+                "SELECT {% include 'columns.sql' %} FROM import.{{ table }} "
+                "WHERE src = {{ files[0] | literal }};\n"
+            )
+            (directory / "typo.sql.j2").write_text("SELECT {{ tabel }};\n")
+            self.assertEqual(
+                templates.find([directory]),
+                [directory / "typed.sql.j2", directory / "typo.sql.j2"],
+            )
+
+            variables = templates.hook_variables(
+                "animals",
+                [pathlib.Path("/test/animals_1.csv")],
+                ["id", 'a"b'],
+                dict(id="bigint"),
+            )
+            self.assertEqual(variables["file_tables"], ["animals_1"])
+            self.assertEqual(
+                templates.render(directory / "typed.sql.j2", variables),
+                'SELECT "id"::bigint, "a""b"::text FROM import.animals '
+                "WHERE src = '/test/animals_1.csv';\n",
+            )
+            with self.assertRaises(jinja2.UndefinedError):
+                templates.render(directory / "typo.sql.j2", variables)
+
+    def test_runs_table_hooks_concurrently(self):
+        """Test if the hooks of different tables run at once, up to the limit
+
+        :return:
+        """
+        files = [
+            "/test/animals_1.csv",
+            "/test/animals_2.csv",
+            "/test/plants_1.csv",
+            "/test/trees_1.csv",
+        ]
+        with self.create_mock_files([]):
+            for f in files:
+                pathlib.Path(f).parent.mkdir(exist_ok=True)
+                pathlib.Path(f).write_text("id,name\n1,a\n")
+            pathlib.Path("/hooks").mkdir()
+            pathlib.Path("/hooks/typed.sql.j2").write_text(
+                "{% if table != 'trees' %}"
+                "CREATE TABLE {{ table }} ({{ columns | join(', ') }});"
+                "{% endif %}\n"
+            )
+            executed, running = list(), list()
+
+            async def exec_sql(db_options, script=None, **kwargs):
+                running.append(script)
+                executed.append((pathlib.Path(script).read_text(), len(running)))
+                await asyncio.sleep(0.05)
+                running.remove(script)
+
+            table_csv_files = {
+                "animals": [pathlib.Path(f) for f in files[:2]],
+                "plants": [pathlib.Path(files[2])],
+                "trees": [pathlib.Path(files[3])],
+            }
+            with unittest.mock.patch("postgresimporter.exec.exec_sql", new=exec_sql):
+                loader = self.loader(
+                    table_hooks=[pathlib.Path("/hooks")], hook_concurrency=2
+                )
+                common.run_sync(loader.run_table_hooks, table_csv_files)
+            self.assertEqual(
+                sorted(text for text, _ in executed),
+                [
+                    "CREATE TABLE animals (id, name);\n",
+                    "CREATE TABLE plants (id, name);\n",
+                ],
+            )
+            self.assertEqual(max(concurrent for _, concurrent in executed), 2)
+
+    def test_reads_columns_of_deleted_files_from_the_database(self):
+        """Test if the columns of deleted files are read from their import table
+
+        :return:
+        """
+        with self.create_mock_files([]):
+            queries = list()
+
+            async def exec_sql(db_options, command=None, **kwargs):
+                queries.append(command)
+                rows = [
+                    dict(column_name="id", data_type="bigint"),
+                    dict(column_name="name", data_type="text"),
+                ]
+                return json.dumps(rows).encode(), b""
+
+            with unittest.mock.patch("postgresimporter.exec.exec_sql", new=exec_sql):
+                loader = self.loader(combine_tables=True)
+                variables = common.run_sync(
+                    loader.table_hook_variables,
+                    "animals",
+                    [pathlib.Path("/test/animals_1.csv")],
+                )
+            self.assertIn("'animals_1'", queries[0])
+            self.assertEqual(variables["columns"], ["id", "name"])
+            self.assertEqual(variables["types"], dict(id="bigint", name="text"))
+            self.assertTrue(variables["combined"])
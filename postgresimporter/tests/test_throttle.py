@@ -0,0 +1,77 @@
+import json
+import pathlib
+import unittest.mock
+
+import common
+
+from postgresimporter import throttle, utils
+
+
+class ThrottleTest(common.BaseTest):
+    def test_limits_bytes_and_rows(self):
+        """Test if slices wait for the global and table token buckets
+
+        :return:
+        """
+        self.assertEqual(
+            utils.parse_table_rate("animals_*=2K/"), ("animals_*", 2048.0, None)
+        )
+        delays = list()
+
+        async def sleep(delay):
+            delays.append(delay)
+
+        async def send(table, data, rows):
+            return [part async for part in limits.slices(table, data, rows)]
+
+        with unittest.mock.patch("time.monotonic", return_value=0.0):
+            limits = throttle.Throttle(
+                bytes_per_second=4096,
+                tables=[utils.parse_table_rate("animals_*=1K/2")],
+            )
+            with unittest.mock.patch("asyncio.sleep", new=sleep):
+                parts = common.run_sync(send, "plants", b"x" * 4096, 10)
+                self.assertEqual(b"".join(parts), b"x" * 4096)
+                self.assertEqual(delays, [])
+
+                # Both buckets are in debt now, the table limits are stricter
+                common.run_sync(send, "animals_1", b"x" * 2048, 4)
+                self.assertAlmostEqual(delays[-1], 1.0)
+
+                limits.configure(rows_per_second=1)
+                common.run_sync(send, "animals_1", b"x" * 10, 4)
+                self.assertAlmostEqual(delays[-1], 4.0)
+
+    def test_reloads_control_file(self):
+        """Test if the limits of the throttle file are applied while loading
+
+        :return:
+        """
+        with self.create_mock_files(["/throttle.json"]):
+            control = pathlib.Path("/throttle.json")
+            control.write_text(
+                json.dumps(
+                    dict(
+                        bytes_per_second="1M",
+                        tables={"animals_*": dict(rows_per_second=5)},
+                    )
+                )
+            )
+            loader = self.loader(throttle_file=str(control))
+            self.assertTrue(loader.streaming)
+
+            async def reload():
+                watcher = loader.start_throttle()
+                self.assertEqual(loader.throttle.bytes.rate, 1 << 20)
+                self.assertEqual(loader.throttle.table_rates("animals_1"), (None, 5.0))
+                control.write_text("{not json")
+                loader.load_throttle()
+                self.assertEqual(loader.throttle.bytes.rate, 1 << 20)
+                control.write_text(json.dumps(dict(rows_per_second=100)))
+                loader.load_throttle()
+                self.assertEqual(loader.throttle.bytes.rate, None)
+                self.assertEqual(loader.throttle.rows.rate, 100.0)
+                await loader.stop_throttle(watcher)
+
+            common.run_sync(reload)
+            self.assertIsNone(loader.throttle)
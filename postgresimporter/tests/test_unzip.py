@@ -1,29 +1,31 @@
+import asyncio
 import os
 import pathlib
+import zipfile
 from contextlib import contextmanager
 from unittest import mock
 
 import common
 
+from postgresimporter import extract
+
 
 class UnzipTest(common.BaseTest):
     @contextmanager
     def assertUnzipsFiles(self, files, from_files=None):
-        with self.lock_create_subprocess() as mocked_subprocess_calls:
-            yield [pathlib.Path(os.path.commonprefix(from_files or []))]
-            for zip_file, extracted_file in files.items():
-                self.assertIn(
-                    mock.call(
-                        "unzip",
-                        "-o",
-                        zip_file,
-                        "-d",
-                        extracted_file,
-                        stderr=-1,
-                        stdout=-1,
-                    ),
-                    mocked_subprocess_calls.call_args_list,
-                )
+        extracted = list()
+
+        async def extract_archive(src, dest, limit, **kwargs):
+            extracted.append((str(src.absolute()), str(dest.absolute())))
+            return dict(extracted=1, skipped=0)
+
+        with self.lock_create_subprocess():
+            with mock.patch(
+                "postgresimporter.extract.extract_archive", new=extract_archive
+            ):
+                yield [pathlib.Path(os.path.commonprefix(from_files or []))]
+        for zip_file, extracted_file in files.items():
+            self.assertIn((zip_file, extracted_file), extracted)
 
     def test_finds_zipped_files(self):
         """Test if all zipped files in the source directory are found and unzipped
@@ -48,3 +50,35 @@ class UnzipTest(common.BaseTest):
                 from_files=mock_files,
             ) as paths:
                 self.load(paths, disable_unzip=False)
+
+    def test_skips_unchanged_members(self):
+        """Test if only members that differ from the extracted files are written
+
+        :return:
+        """
+        with self.create_mock_files([]):
+            archive = pathlib.Path("/sources/animals.zip")
+            archive.parent.mkdir(parents=True)
+            with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+                zf.writestr("animals/cats.csv", "name\nTom\n" * 1000)
+                zf.writestr("animals/dogs.csv", "name\nRex\n")
+                zf.writestr("../escaped.csv", "name\nOut\n")
+            dest = archive.with_name("animals")
+
+            async def extract_archive():
+                return await extract.extract_archive(
+                    archive, dest, asyncio.Semaphore(2), size=512
+                )
+
+            counts = common.run_sync(extract_archive)
+            self.assertEqual((counts["extracted"], counts["skipped"]), (3, 0))
+            self.assertEqual(
+                (dest / "animals/cats.csv").read_text(), "name\nTom\n" * 1000
+            )
+            self.assertTrue((dest / "escaped.csv").exists())
+
+            (dest / "animals/dogs.csv").write_text("name\nMax\n")
+            counts = common.run_sync(extract_archive)
+            self.assertEqual((counts["extracted"], counts["skipped"]), (1, 2))
+            self.assertEqual((dest / "animals/dogs.csv").read_text(), "name\nRex\n")
+            self.assertEqual(sorted(p.name for p in dest.rglob("*.part")), [])
@@ -0,0 +1,137 @@
+import asyncio
+import json
+import pathlib
+import tempfile
+import unittest.mock
+
+import common
+
+from postgresimporter import watch
+
+
+class WatchTest(common.BaseTest):
+    def test_waits_for_files_to_settle(self):
+        """Test if files are reported only once their size and mtime are stable
+
+        :return:
+        """
+        with self.create_mock_files(["/sources/old.csv"]):
+            sources = [pathlib.Path("/sources")]
+            watcher = watch.Watcher(sources, settle_time=10, polling=True)
+            watcher.mark_handled([pathlib.Path("/sources/old.csv")])
+            new = pathlib.Path("/sources/x/new.csv")
+            new.parent.mkdir()
+            new.write_text("a,b\n")
+            pathlib.Path("/sources/x/notes.txt").write_text("ignored")
+
+            self.assertEqual(watcher.poll(now=0), [])
+            self.assertEqual(watcher.poll(now=5), [])
+            new.write_text("a,b\n1,2\n")
+            self.assertEqual(watcher.poll(now=12), [])
+            self.assertEqual(watcher.poll(now=22), [new])
+            self.assertEqual(watcher.poll(now=40), [])
+
+            # Rewritten files are reported again
+            new.write_text("a,b\n1,2\n3,4\n")
+            self.assertEqual(watcher.poll(now=50), [])
+            self.assertEqual(watcher.poll(now=60), [new])
+
+    def test_keeps_watching_after_failed_loads(self):
+        """Test if a failing incremental load does not stop watching
+
+        :return:
+        """
+        polls, loaded = [[pathlib.Path("/a.csv")], [pathlib.Path("/b.csv")]], list()
+
+        async def load(_self, data_dirs):
+            pass
+
+        async def load_incremental(_self, files, watcher=None):
+            loaded.append(files)
+            if len(loaded) < 2:
+                raise RuntimeError("database went away")
+
+        def poll(_self, now=None):
+            return polls.pop(0) if polls else []
+
+        async def watching(loader):
+            task = asyncio.ensure_future(loader.watch([pathlib.Path("/sources")]))
+            while len(loaded) < 2 and not task.done():
+                await asyncio.sleep(0.01)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        with self.create_mock_files(["/sources/old.csv"]):
+            with unittest.mock.patch.multiple(
+                "postgresimporter.main.Loader",
+                load=load,
+                load_incremental=load_incremental,
+            ), unittest.mock.patch.object(watch.Watcher, "poll", new=poll):
+                loader = self.loader(watch_interval=0.01)
+                common.run_sync(watching, loader)
+        self.assertEqual(loaded, [[pathlib.Path("/a.csv")], [pathlib.Path("/b.csv")]])
+
+    def test_watches_files_changed_during_the_initial_load(self):
+        """Test if files that appear or change while the initial load runs are
+        loaded once it finished
+
+        :return:
+        """
+        loaded = list()
+        with self.create_mock_files(["/sources/kept.csv", "/sources/grown.csv"]):
+            sources = [pathlib.Path("/sources")]
+
+            async def load(_self, data_dirs):
+                _self.reset()
+                _self.discover(data_dirs)
+                pathlib.Path("/sources/grown.csv").write_text("a,b\n1,2\n")
+                pathlib.Path("/sources/new.csv").write_text("a,b\n")
+
+            async def load_incremental(_self, files, watcher=None):
+                loaded.extend(files)
+
+            async def watching(loader):
+                task = asyncio.ensure_future(loader.watch(sources))
+                while len(loaded) < 2 and not task.done():
+                    await asyncio.sleep(0.01)
+                await asyncio.sleep(0.05)
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+            with unittest.mock.patch.multiple(
+                "postgresimporter.main.Loader",
+                load=load,
+                load_incremental=load_incremental,
+            ):
+                loader = self.loader(
+                    watch_interval=0.01, watch_settle_time=0, watch_polling=True
+                )
+                common.run_sync(watching, loader)
+        self.assertEqual(
+            sorted(str(f) for f in loaded), ["/sources/grown.csv", "/sources/new.csv"]
+        )
+
+    def test_checks_only_the_rows_of_new_files(self):
+        """Test if incremental loads check new files against their own tables
+
+        :return:
+        """
+        queries = list()
+
+        async def exec_sql(db_options, command=None, sync=False, **kwargs):
+            queries.append(command)
+            return json.dumps([dict(count=1)]).encode(), b""
+
+        with tempfile.TemporaryDirectory() as directory:
+            new = pathlib.Path(directory) / "animals_2.csv"
+            new.write_text("id\n1\n")
+            with unittest.mock.patch("postgresimporter.exec.exec_sql", new=exec_sql):
+                loader = self.loader(combine_tables=True, disable_check=False)
+                common.run_sync(
+                    loader.step3_post_load,
+                    [new],
+                    dict(animals=[new]),
+                    incremental=True,
+                )
+        counts = [q for q in queries if q and q.startswith("SELECT count(*)")]
+        self.assertEqual(counts, ["SELECT count(*) FROM import.animals_2"])
@@ -0,0 +1,102 @@
+import pathlib
+import tempfile
+import unittest.mock
+
+import common
+
+from postgresimporter import chunks, main, rejects, workers
+
+
+class WorkersTest(common.BaseTest):
+    def test_plans_chunks_like_reader(self):
+        """Test if chunks found by the workers end where the reader ends them
+
+        :return:
+        """
+        rows = ['1,"multi\nline",x\n', '2,"quoted "" quote",y\n', "3,plain,z\n"] * 20
+        with tempfile.TemporaryDirectory() as directory:
+            path = pathlib.Path(directory) / "animals.csv"
+            for data in ("".join(rows), "".join(rows) + '4,"open\nquote', ""):
+                path.write_text(data)
+                for chunk_size in (7, 64, 1000):
+                    expected = list(
+                        chunks.read_chunks(
+                            path, chunk_size, max_row_size=chunk_size * 4
+                        )
+                    )
+
+                    async def planned():
+                        return [
+                            chunk
+                            async for chunk in workers.plan_chunks(
+                                str(path), chunk_size, max_row_size=chunk_size * 4
+                            )
+                        ]
+
+                    self.assertEqual(common.run_sync(planned), expected)
+
+    def test_resumes_chunks_at_the_same_rows(self):
+        """Test if chunks read from the end of any chunk end where they ended before
+
+        :return:
+        """
+        rows = ['1,"multi\nline",x\n', "2,plain,y\n", "3,longer plain value,z\n"] * 20
+        with tempfile.TemporaryDirectory() as directory:
+            path = pathlib.Path(directory) / "animals.csv"
+            path.write_text("h1,h2,h3\n" + "".join(rows))
+            for chunk_size in (7, 64, 100):
+                expected = list(chunks.read_chunks(path, chunk_size, start=9))
+                for resumed in expected[1:]:
+                    kwargs = dict(start=resumed.start, index=resumed.index, origin=9)
+                    following = [c for c in expected if c.index >= resumed.index]
+
+                    async def planned():
+                        return [
+                            chunk
+                            async for chunk in workers.plan_chunks(
+                                str(path), chunk_size, **kwargs
+                            )
+                        ]
+
+                    self.assertEqual(
+                        list(chunks.read_chunks(path, chunk_size, **kwargs)), following
+                    )
+                    self.assertEqual(common.run_sync(planned), following)
+
+    def test_counts_rows(self):
+        """Test if rows are counted in the workers without a python subprocess
+
+        :return:
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = pathlib.Path(directory) / "animals.csv"
+            path.write_text('id,name\n1,"Cat\nDog"\n2,Cow')
+            with unittest.mock.patch.object(workers, "range_size", 4):
+                self.assertEqual(common.run_sync(workers.count_rows, path), 3)
+                self.assertEqual(
+                    common.run_sync(workers.count_rows, path, precise=True), 3
+                )
+            path.write_text('id,name\n1,"Cat\nDog"\n', encoding="utf-16")
+            self.assertEqual(common.run_sync(workers.count_rows, path, precise=True), 2)
+
+    def test_reads_large_chunks_from_offsets(self):
+        """Test if workers read unchanged chunks themselves instead of receiving them
+
+        :return:
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = pathlib.Path(directory) / "animals.csv"
+            path.write_bytes(b'id,name\n1,Cat\n2,"Dog\n')
+            chunk = chunks.Chunk(0, 8, 22, 2, b"replaced by the file")
+            with unittest.mock.patch.object(workers, "offset_size", 0):
+                data, rejected = common.run_sync(
+                    main.Loader.run_on_chunk,
+                    rejects.validate_csv,
+                    str(path),
+                    chunk,
+                    chunk.data,
+                    2,
+                    2,
+                )
+        self.assertEqual(data, b"1,Cat\n")
+        self.assertEqual([r.line for r in rejected], [3])
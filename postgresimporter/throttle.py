@@ -0,0 +1,144 @@
+import asyncio
+import fnmatch
+import json
+import time
+
+from . import utils
+
+# Data is sent in slices of this size, so limits apply smoothly within chunks
+slice_size = 256 << 10
+
+
+class TokenBucket:
+    """Token bucket allowing rate units per second with bursts of one second
+
+    Amounts larger than the bucket are admitted by going into debt, so a
+    single large request waits as long as its size requires.
+    """
+
+    def __init__(self, rate=None):
+        self.rate = rate
+        self.tokens = rate or 0.0
+        self.updated = time.monotonic()
+
+    def set_rate(self, rate):
+        self._refill()
+        self.rate = rate
+        if rate:
+            self.tokens = min(self.tokens, rate)
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self.tokens = min(
+                self.rate, self.tokens + max(0.0, now - self.updated) * self.rate
+            )
+        self.updated = now
+
+    def delay(self, amount):
+        """Take tokens and return the seconds to wait before using them"""
+        if not self.rate:
+            return 0.0
+        self._refill()
+        self.tokens -= amount
+        return max(0.0, -self.tokens / self.rate)
+
+
+class Throttle:
+    """Limits the bytes and rows sent per second, globally and per table"""
+
+    def __init__(self, bytes_per_second=None, rows_per_second=None, tables=None):
+        self.bytes = TokenBucket(bytes_per_second)
+        self.rows = TokenBucket(rows_per_second)
+        self.table_limits = list()
+        self.table_buckets = dict()
+        self.configure(bytes_per_second, rows_per_second, tables)
+
+    def configure(self, bytes_per_second=None, rows_per_second=None, tables=None):
+        """Change the limits, also while data is being sent
+
+        :param bytes_per_second: global limit of bytes or None
+        :param rows_per_second: global limit of rows or None
+        :param tables: list of (table pattern, bytes, rows per second)
+        :return:
+        """
+        self.bytes.set_rate(bytes_per_second)
+        self.rows.set_rate(rows_per_second)
+        self.table_limits = list(tables or [])
+        for table, (size, rows) in self.table_buckets.items():
+            size_rate, rows_rate = self.table_rates(table)
+            size.set_rate(size_rate)
+            rows.set_rate(rows_rate)
+
+    def table_rates(self, table):
+        # The last matching pattern wins
+        rates = (None, None)
+        for pattern, size, rows in self.table_limits:
+            if fnmatch.fnmatchcase(table, pattern):
+                rates = (size, rows)
+        return rates
+
+    def buckets(self, table):
+        if table not in self.table_buckets:
+            size_rate, rows_rate = self.table_rates(table)
+            self.table_buckets[table] = (TokenBucket(size_rate), TokenBucket(rows_rate))
+        return self.table_buckets[table]
+
+    @property
+    def active(self):
+        return bool(
+            self.bytes.rate
+            or self.rows.rate
+            or any(size or rows for _, size, rows in self.table_limits)
+        )
+
+    async def acquire(self, table, size, rows=0):
+        table_size, table_rows = self.buckets(table)
+        delay = max(
+            self.bytes.delay(size),
+            self.rows.delay(rows),
+            table_size.delay(size),
+            table_rows.delay(rows),
+        )
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def slices(self, table, data, rows=None):
+        """Yield slices of a chunk as fast as the limits allow
+
+        :param table: name of the table the data is sent to
+        :param data: encoded chunk
+        :param rows: number of rows of the chunk, spread over its slices
+        :return: async generator of slices
+        """
+        rows = data.count(b"\n") if rows is None else rows
+        for start in range(0, len(data), slice_size):
+            part = data[start : start + slice_size]
+            await self.acquire(table, len(part), rows * len(part) / len(data))
+            yield part
+
+    def load(self, path):
+        """Apply the limits of a json control file
+
+        The file looks like {"bytes_per_second": "10M", "rows_per_second": 5000,
+        "tables": {"animals_*": {"bytes_per_second": "2M"}}}. Missing limits
+        are unlimited.
+
+        :param path: path of the control file
+        :return:
+        """
+        with open(path, encoding="utf-8") as control_file:
+            config = json.load(control_file)
+        tables = [
+            (
+                pattern,
+                utils.parse_rate(limits.get("bytes_per_second"), size=True),
+                utils.parse_rate(limits.get("rows_per_second")),
+            )
+            for pattern, limits in (config.get("tables") or dict()).items()
+        ]
+        self.configure(
+            utils.parse_rate(config.get("bytes_per_second"), size=True),
+            utils.parse_rate(config.get("rows_per_second")),
+            tables,
+        )
@@ -1,11 +1,14 @@
 import csv
+import functools
 import re
 import unicodedata
-from pathlib import Path
+from pathlib import Path, PurePosixPath
 
 import chardet
 import pkg_resources
 
+from . import filters, normalize
+
 log_levels = ["DEBUG", "INFO", "WARNING", "ERROR", "FATAL"]
 
 
@@ -56,6 +59,119 @@ def valid_dir_or_file(_parser, arg, extensions=None):
     )
 
 
+def parse_size(size: str) -> int:
+    units = {"": 1, "k": 1 << 10, "m": 1 << 20, "g": 1 << 30, "t": 1 << 40}
+    match = re.match(r"^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*$", str(size).lower())
+    if not match:
+        raise ValueError("%s is not a valid size" % size)
+    return int(float(match.group(1)) * units[match.group(2)])
+
+
+def valid_size(_parser, arg):
+    try:
+        return parse_size(arg)
+    except ValueError:
+        _parser.error("%s is not a valid size (e.g. 512K, 64M or 2G)" % arg)
+
+
+def parse_rate(value, size=False):
+    """Parse a limit per second, where empty, 0 or unlimited mean no limit"""
+    if value is None or str(value).strip().lower() in ("", "0", "none", "unlimited"):
+        return None
+    return float(parse_size(value) if size else float(value))
+
+
+def parse_table_rate(spec):
+    """Parse a per table limit like animals_*=10M/5000
+
+    :param spec: table pattern, bytes and rows per second (either may be empty)
+    :return: tuple of pattern, bytes and rows per second
+    """
+    pattern, separator, limits = spec.partition("=")
+    if not separator or not pattern.strip():
+        raise ValueError("%s is not a valid table limit" % spec)
+    size, _, rows = limits.partition("/")
+    return pattern.strip(), parse_rate(size, size=True), parse_rate(rows)
+
+
+def valid_rate(_parser, arg, size=False):
+    try:
+        return parse_rate(arg, size=size)
+    except ValueError:
+        _parser.error("%s is not a valid limit per second" % arg)
+
+
+def valid_table_rate(_parser, arg):
+    try:
+        return parse_table_rate(arg)
+    except ValueError:
+        _parser.error("%s is not a valid table limit (e.g. animals_*=10M/5000)" % arg)
+
+
+def parse_path_mapping(mapping):
+    """Parse a mapping of a local directory to the path the server sees it at
+
+    :param mapping: LOCAL=SERVER (e.g. ./data=/import)
+    :return: tuple of the absolute local path and the server path
+    """
+    local, separator, server = mapping.partition("=")
+    if not separator or not local or not server.startswith("/"):
+        raise ValueError(
+            "%s is not a valid path mapping (e.g. ./data=/import)" % mapping
+        )
+    return Path(local).absolute(), PurePosixPath(server)
+
+
+def valid_server_path(_parser, arg):
+    try:
+        return parse_path_mapping(arg)
+    except ValueError as e:
+        _parser.error(str(e))
+
+
+def parse_table_keys(spec):
+    """Parse the key columns of tables like animals=id,date
+
+    :param spec: table pattern and comma separated key columns
+    :return: tuple of pattern and list of key columns
+    """
+    pattern, separator, columns = spec.partition("=")
+    keys = [column.strip() for column in columns.split(",") if column.strip()]
+    if not separator or not pattern.strip() or not keys:
+        raise ValueError("%s is not a valid list of key columns" % spec)
+    return pattern.strip(), keys
+
+
+def valid_table_keys(_parser, arg):
+    try:
+        return parse_table_keys(arg)
+    except ValueError:
+        _parser.error(
+            "%s is not a valid list of key columns (e.g. animals=id,date)" % arg
+        )
+
+
+def valid_normalize_rule(_parser, arg):
+    try:
+        return normalize.parse_rule(arg)
+    except ValueError as e:
+        _parser.error(str(e))
+
+
+def valid_predicate(_parser, arg):
+    try:
+        return filters.parse_predicate(arg)
+    except ValueError as e:
+        _parser.error(str(e))
+
+
+def valid_sample(_parser, arg):
+    try:
+        return filters.parse_sample(arg)
+    except ValueError as e:
+        _parser.error(str(e))
+
+
 def valid_log_level(_parser, arg):
     return _valid(
         _parser,
@@ -81,11 +197,49 @@ def to_filename(_title: str) -> str:
     return title
 
 
+def to_column_name(_key: str) -> str:
+    return to_filename(_key).lower()
+
+
+@functools.lru_cache(maxsize=65536)
+def table_name_for_stem(stem: str) -> str:
+    return to_filename(stem).split("_")[0]
+
+
 def table_name_for_path(file_path):
     if not isinstance(file_path, Path):
         file_path = Path(file_path)
-    filename = to_filename(file_path.stem)
-    return filename.split("_")[0]
+    return table_name_for_stem(file_path.stem)
+
+
+def sql_literal(value) -> str:
+    if value is None:
+        return "NULL"
+    return "'%s'" % str(value).replace("'", "''")
+
+
+def create_table_statements(table, definition):
+    return [
+        "CREATE SCHEMA IF NOT EXISTS import",
+        f"DROP TABLE IF EXISTS import.{table}",
+        f"CREATE TABLE import.{table} ({definition})",
+    ]
+
+
+def text_columns(columns):
+    return ", ".join(f'"{column}" text' for column in columns)
+
+
+def describe_target(db_options) -> str:
+    """Describe a database target for logging without revealing its password"""
+    if isinstance(db_options, str):
+        target = re.sub(r"password\s*=\s*('[^']*'|\S+)", "password=***", db_options)
+        return re.sub(r"(://[^:/@]*):[^@]*@", r"\1:***@", target)
+    return "{}@{}:{}".format(
+        db_options.get("user", ""),
+        db_options.get("host", "localhost"),
+        db_options.get("port", 5432),
+    )
 
 
 def to_cli_options(options: dict):
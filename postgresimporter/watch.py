@@ -0,0 +1,155 @@
+import logging
+import os
+import time
+from pathlib import Path
+
+from . import discovery
+
+logger = logging.getLogger("watch")
+
+try:
+    import inotify_simple
+
+except ImportError:
+    inotify_simple = None
+
+
+class PollingScanner:
+    """Reports every file of the sources on each scan using os.scandir"""
+
+    def __init__(self, sources):
+        self.sources = list(sources)
+
+    def candidates(self):
+        for source in self.sources:
+            yield from discovery.walk(source)
+
+    def close(self):
+        pass
+
+
+class InotifyScanner:
+    """Reports only files that were created, written or moved since the last scan"""
+
+    def __init__(self, sources):
+        flags = inotify_simple.flags
+        self.mask = flags.CREATE | flags.MODIFY | flags.CLOSE_WRITE | flags.MOVED_TO
+        self.inotify = inotify_simple.INotify()
+        self.directories = dict()
+        self.files = [Path(s) for s in sources if not Path(s).is_dir()]
+        for source in sources:
+            if Path(source).is_dir():
+                self._watch_tree(source)
+
+    def _watch_tree(self, directory):
+        directories = [str(directory)]
+        while directories:
+            current = directories.pop()
+            try:
+                wd = self.inotify.add_watch(current, self.mask)
+                self.directories[wd] = Path(current)
+                with os.scandir(current) as entries:
+                    directories += [
+                        e.path for e in entries if e.is_dir() and not e.is_symlink()
+                    ]
+            except OSError as e:
+                logger.warning(f"Cannot watch {current}: {e}")
+
+    def candidates(self):
+        found = set(self.files)
+        for event in self.inotify.read(timeout=0):
+            directory = self.directories.get(event.wd)
+            if directory is None or not event.name:
+                continue
+            path = directory / event.name
+            if event.mask & inotify_simple.flags.ISDIR:
+                # Watch new directories and report the files they already contain
+                self._watch_tree(path)
+                found.update(discovery.walk(path))
+            else:
+                found.add(path)
+        return found
+
+    def close(self):
+        self.inotify.close()
+
+
+def create_scanner(sources, polling=False):
+    if not polling and inotify_simple is not None:
+        try:
+            return InotifyScanner(sources)
+        except OSError as e:
+            logger.warning(f"Falling back to polling, inotify is unavailable: {e}")
+    return PollingScanner(sources)
+
+
+class Watcher:
+    """Detects new or changed source files that are complete
+
+    A file is considered complete once its size and modification time did
+    not change for at least settle_time seconds.
+    """
+
+    def __init__(self, sources, settle_time=10.0, polling=False):
+        self.settle_time = settle_time
+        self.scanner = create_scanner(sources, polling=polling)
+        self.pending = dict()
+        self.handled = dict()
+
+    @staticmethod
+    def _signature(path):
+        return discovery.signature(path)
+
+    def mark_handled(self, paths):
+        self.mark_signatures({path: self._signature(path) for path in paths})
+
+    def mark_signatures(self, signatures):
+        """Ignore files until they differ from the given signatures
+
+        :param signatures: dict of paths to their signature when they were handled
+        :return:
+        """
+        for path, signature in signatures.items():
+            if signature is not None:
+                self.handled[path.absolute()] = signature
+
+    def poll(self, now=None):
+        """Scan for changes and return the files that became complete
+
+        :param now: current time (defaults to time.monotonic)
+        :return: list of complete files
+        """
+        now = time.monotonic() if now is None else now
+        for path in self.scanner.candidates():
+            path = path.absolute()
+            suffix = path.suffix
+            if (
+                suffix not in discovery.zip_extensions
+                and suffix not in discovery.dump_extensions
+            ):
+                continue
+            signature = self._signature(path)
+            if signature is None or self.handled.get(path) == signature:
+                continue
+            previous = self.pending.get(path)
+            if previous is None or previous[0] != signature:
+                self.pending[path] = (signature, now)
+
+        complete = list()
+        for path, (signature, since) in list(self.pending.items()):
+            if now - since < self.settle_time:
+                continue
+            current = self._signature(path)
+            del self.pending[path]
+            if current is None:
+                continue
+            if current != signature:
+                # Changed since the last scan, wait for it to settle again
+                self.pending[path] = (current, now)
+                continue
+            self.handled[path] = signature
+            complete.append(path)
+        return sorted(complete)
+
+    def close(self):
+        self.scanner.close()
@@ -0,0 +1,182 @@
+import asyncio
+import collections
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import chardet
+
+from . import chunks
+
+logger = logging.getLogger("workers")
+
+processes = max(1, multiprocessing.cpu_count() - 1)
+executor = concurrent.futures.ProcessPoolExecutor(max_workers=processes)
+
+# Bytes scanned per task when counting rows or looking for chunk boundaries
+range_size = 16 << 20
+# Files from this size on are scanned for chunk boundaries in parallel
+parallel_size = 64 << 20
+# Chunks from this size on are read by the workers instead of being pickled
+offset_size = 4 << 20
+encoding_sample_size = 64 << 10
+wide_encodings = ("utf-16", "utf-32")
+
+
+async def run(function, *args):
+    """Run a function in the worker processes
+
+    :param function: module level function
+    :param args: arguments, which are pickled, so pass offsets instead of large buffers
+    :return: result of the function
+    """
+    return await asyncio.get_event_loop().run_in_executor(executor, function, *args)
+
+
+def read_range(path, start, end):
+    with open(path, "rb") as source:
+        source.seek(start)
+        return source.read(end - start)
+
+
+def apply_range(function, path, start, end, *args):
+    """Apply a function to a byte range of a file that is read by the worker"""
+    return function(read_range(path, start, end), *args)
+
+
+@dataclass()
+class Scan:
+    """Newlines of a byte range, split by the quote parity relative to its start
+
+    Index 0 holds newlines outside of quotes if the range starts outside of
+    quotes, index 1 those inside. Escaped quotes ("") keep the parity.
+    """
+
+    start: int
+    end: int
+    quotes: int
+    rows: Tuple[int, int]
+    last: Tuple[Optional[int], Optional[int]]
+    last_line: Optional[int]
+    quotes_after: int
+
+
+def scan_range(path, start, end, quote=b'"'):
+    data = read_range(path, start, end)
+    rows, last, offset = [0, 0], [None, None], start
+    segments = data.split(quote) if quote else [data]
+    for i, segment in enumerate(segments):
+        count = segment.count(b"\n")
+        if count:
+            rows[i % 2] += count
+            last[i % 2] = offset + segment.rfind(b"\n") + 1
+        offset += len(segment) + 1
+    lines = [position for position in last if position is not None]
+    last_line = max(lines) if lines else None
+    quotes = len(segments) - 1
+    quotes_after = quotes
+    if quote and last_line is not None:
+        quotes_after = data.count(quote, last_line - start)
+    return Scan(start, end, quotes, tuple(rows), tuple(last), last_line, quotes_after)
+
+
+async def scans(path, start, end, size=range_size, quote=b'"', origin=None):
+    """Scan the ranges of a file in the workers, in order and a few ranges ahead
+
+    Ranges after the first one start at offsets origin + k * size.
+    """
+    edges = [start] + list(
+        range(start + chunks.aligned_size(start, size, origin), end, size)
+    )
+    ranges = collections.deque(
+        (offset, min(following, end))
+        for offset, following in zip(edges, edges[1:] + [end])
+        if offset < end
+    )
+    pending = collections.deque()
+    while ranges or pending:
+        while ranges and len(pending) < 2 * processes:
+            pending.append(
+                asyncio.ensure_future(run(scan_range, path, *ranges.popleft(), quote))
+            )
+        yield await pending.popleft()
+
+
+def detect_encoding(path, sample_size=encoding_sample_size):
+    with open(path, "rb") as source:
+        sample = source.read(sample_size)
+    return (chardet.detect(sample)["encoding"] or "utf-8").lower()
+
+
+def count_text_rows(path, encoding):
+    with open(path, encoding=encoding, newline="") as source:
+        data = source.read()
+    return chunks.csv_rows(data.encode("utf-8"))
+
+
+async def count_rows(path, precise=False):
+    """Count the rows of a csv file in the workers
+
+    :param path: path of the csv file
+    :param precise: whether newlines within quoted values do not start a row
+    :return: number of rows (lines if not precise), including the header
+    """
+    size = os.path.getsize(path)
+    if precise:
+        encoding = await run(detect_encoding, path)
+        if encoding.startswith(wide_encodings):
+            # Quotes and newlines are no single bytes, so decode the file
+            return await run(count_text_rows, path, encoding)
+    parity, rows = 0, 0
+    async for scan in scans(path, 0, size, quote=b'"' if precise else None):
+        rows += scan.rows[parity]
+        parity ^= scan.quotes % 2
+    if precise and size > 0 and read_range(path, size - 1, size) != b"\n":
+        rows += 1
+    return rows
+
+
+async def plan_chunks(
+    path, chunk_size, start=0, index=0, max_row_size=None, origin=None
+):
+    """Read a csv file in chunks of complete rows, found by the workers
+
+    The ranges of the file are scanned in parallel and combined in order,
+    so the chunks end at the same boundaries as with chunks.read_chunks.
+
+    :param path: path of the csv file
+    :param chunk_size: minimum number of bytes per chunk
+    :param start: byte offset of the first row
+    :param index: index of the first chunk
+    :param max_row_size: size after which a row that does not end is split at
+        the last newline
+    :param origin: offset the scanned ranges are aligned to, defaults to the start
+    :return: async generator of chunks, at least one (possibly empty) chunk
+    """
+    size, yielded = os.path.getsize(path), False
+    parity, rows, last_line, quotes_after = 0, 0, None, 0
+    async for scan in scans(path, start, size, size=chunk_size, origin=origin):
+        rows += scan.rows[parity]
+        boundary = scan.last[parity]
+        parity ^= scan.quotes % 2
+        if scan.last_line is not None:
+            last_line, quotes_after = scan.last_line, scan.quotes_after
+        else:
+            quotes_after += scan.quotes
+        too_large = max_row_size and scan.end - start > max_row_size
+        if boundary is None and too_large and last_line is not None:
+            logger.warning(f"Row at byte {start} of {path} does not end")
+            # Continue as if the row ended at the last newline
+            boundary, parity = last_line, quotes_after % 2
+        if boundary is not None:
+            yield chunks.Chunk(
+                index, start, boundary, rows, read_range(path, start, boundary)
+            )
+            yielded, index, start, rows, last_line = True, index + 1, boundary, 0, None
+    if start < size or not yielded:
+        data = read_range(path, start, size)
+        rows += 1 if data.strip() and not data.endswith(b"\n") else 0
+        yield chunks.Chunk(index, start, size, rows, data)
@@ -35,7 +35,9 @@ setup(
         "chardet",
         "prettytable",
     ],
-    extras_require=dict(dev=["blessings", "pygments", "m2r", "pyfakefs"]),
+    extras_require=dict(
+        dev=["blessings", "pygments", "m2r", "pyfakefs"], watch=["inotify_simple"]
+    ),
     package_data={"postgresimporter": ["hooks"]},
     classifiers=[
         "Environment :: Console",
@@ -59,6 +59,18 @@ def test(c, min_coverage=None):
     c.run("python -m unittest discover -v {}".format(TEST_DIR))
 
 
+@task(help={"processes": "Number of simulated processes per scenario"})
+def bench(c, processes=10000):
+    """Benchmark scheduling and supervising simulated processes
+    """
+    c.run(
+        "python {} --processes {}".format(
+            TEST_DIR.joinpath("benchmark_scheduler.py"), processes
+        ),
+        env=dict(PYTHONPATH=str(ROOT_DIR)),
+    )
+
+
 @task
 def type_check(c):
     """Check types